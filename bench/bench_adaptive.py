@@ -0,0 +1,185 @@
+import argparse
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture
+from IpCameraClient import IpCameraClient
+
+
+"""
+自适应质量控制的评测：客户端经过一个限速的TCP代理连接服务端(模拟带宽不足的远程连接)，
+中途改变带宽，每秒打印客户端收到的帧率、端到端延迟、图像尺寸以及服务端的工作点(quality/scale)。
+对比固定编码参数(--fixed)与自适应控制的情况。
+
+    python bench/bench_adaptive.py [--rates 4,1,4] [--seconds 6] [--fixed]
+rates为各阶段的带宽(MB/s)，每个阶段持续seconds秒
+"""
+
+PORT = 31060
+PROXY_PORT = 31062
+
+
+# 令牌桶限速的转发，rate为每秒字节数，None表示不限速
+class Throttle:
+    def __init__(self, rate=None) -> None:
+        self.rate = rate
+        self.tokens = 0.0
+        self.last = time.monotonic()
+
+    def wait(self, n: int):
+        while self.rate is not None:
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self.last) * self.rate, self.rate * 0.05)
+            self.last = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            time.sleep((n - self.tokens) / self.rate)
+
+
+def pipe(src: socket.socket, dst: socket.socket, throttle=None):
+    try:
+        while True:
+            data = src.recv(16384)
+            if not data:
+                break
+            if throttle is not None:
+                throttle.wait(len(data))
+            dst.sendall(data)
+    except OSError:
+        pass
+    for s in (src, dst):
+        try:
+            s.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+"""
+代理: PROXY_PORT转发到服务端的数据端口(服务端到客户端方向限速)，PROXY_PORT+1转发到控制端口。
+服务端按数据连接的端口匹配订阅者，因此记录代理连接服务端数据端口时使用的本地端口(upstream_port)
+"""
+class ThrottledProxy:
+    def __init__(self, rate: float) -> None:
+        self.throttle = Throttle(rate)
+        self.upstream_port = None
+        self.ready = threading.Event()
+        self.listeners = []
+        for port in (PROXY_PORT, PROXY_PORT + 1):
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(('localhost', port))
+            listener.listen(1)
+            self.listeners.append(listener)
+            threading.Thread(target=self.accept, args=(listener, port - PROXY_PORT), daemon=True).start()
+
+    def accept(self, listener: socket.socket, offset: int):
+        try:
+            client, _ = listener.accept()
+        except OSError:
+            return
+        upstream = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if offset == 0:     # 接收缓冲区很小，限速能尽快反映到服务端的发送
+            upstream.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 32*1024)
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 32*1024)
+        upstream.connect(('localhost', PORT + offset))
+        if offset == 0:
+            self.upstream_port = upstream.getsockname()[1]
+            self.ready.set()
+        threading.Thread(target=pipe, args=(client, upstream), daemon=True).start()
+        threading.Thread(target=pipe, args=(upstream, client, self.throttle if offset == 0 else None),
+                         daemon=True).start()
+
+    def close(self):
+        for listener in self.listeners:
+            listener.close()
+
+
+def run(args) -> list:
+    rates = [float(r) * 1024 * 1024 for r in args.rates.split(',')]
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: SyntheticCapture(idx, args.fps))
+    server.Start()
+    proxy = ThrottledProxy(rates[0])
+    client = IpCameraClient()
+    rows = []
+    try:
+        if not client.connect('localhost', PROXY_PORT):
+            raise RuntimeError('cannot connect to server')
+        proxy.ready.wait(5.0)
+        # 客户端的数据端口在代理之后，命令中使用代理的端口
+        data_port = proxy.upstream_port
+        response = client.request({'cmd': 'subscribe', 'data_port': data_port, 'protocol': 2})
+        if not response['result']:
+            raise RuntimeError('subscribe failed: %s' % response)
+        client.request({'cmd': 'set_codec', 'data_port': data_port, 'codec': 'jpeg', 'quality': args.quality})
+        if not args.fixed:
+            response = client.request({'cmd': 'set_adaptive', 'data_port': data_port,
+                                       'target_latency_ms': args.target_latency_ms,
+                                       'max_quality': args.quality, 'min_quality': 20, 'min_scale': 0.25})
+            if not response['result']:
+                raise RuntimeError('set_adaptive failed: %s' % response)
+        client.set_camera(0, args.width, args.height)
+        client.start_capture()
+
+        t_start = time.monotonic()
+        for phase, rate in enumerate(rates):
+            proxy.throttle.rate = rate
+            for second in range(args.seconds):
+                t0 = time.monotonic()
+                frames, latencies, size, nbytes = 0, [], None, 0
+                while time.monotonic() - t0 < 1.0:
+                    img, info = client.read(timeout=0.2, with_info=True)
+                    if img is None:
+                        continue
+                    frames += 1
+                    nbytes += info.payload_len
+                    size = (info.width, info.height)
+                    if info.latency() is not None:
+                        latencies.append(info.latency())
+                point = client.request({'cmd': 'get_adaptive', 'data_port': data_port})
+                codec = point.get('codec', {})
+                latencies.sort()
+                rows.append({'t': round(time.monotonic() - t_start, 1), 'rate_MBps': rate / 1024 / 1024,
+                             'fps': frames, 'KB/frame': round(nbytes / max(frames, 1) / 1024, 1),
+                             'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                             'size': '%sx%s' % size if size else '-',
+                             'quality': codec.get('quality'), 'scale': codec.get('scale') or 1.0})
+        client.stop_capture()
+    finally:
+        client.disconnect()
+        proxy.close()
+        server.Stop()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='adaptive quality over a throttled loopback connection')
+    parser.add_argument('--rates', default='4,0.5,4', help='bandwidth of each phase, MB/s')
+    parser.add_argument('--seconds', type=int, default=6, help='duration of each phase')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--quality', type=int, default=90)
+    parser.add_argument('--target-latency-ms', type=float, default=150)
+    parser.add_argument('--fixed', action='store_true', help='fixed codec, no adaptive control')
+    args = parser.parse_args()
+
+    rows = run(args)
+    print('%s, target latency %.0f ms' % ('fixed quality %d' % args.quality if args.fixed else 'adaptive',
+                                         args.target_latency_ms))
+    print('%6s %8s %5s %9s %8s %10s %8s %6s' % ('t', 'MB/s', 'fps', 'KB/frame', 'p50 ms', 'size', 'quality', 'scale'))
+    for row in rows:
+        print('%6.1f %8.2f %5d %9.1f %8s %10s %8s %6.3g' % (
+            row['t'], row['rate_MBps'], row['fps'], row['KB/frame'], row['p50_ms'], row['size'],
+            row['quality'], row['scale']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture
+from AsyncIpCameraClient import AsyncIpCameraClient
+
+
+"""
+AsyncIpCameraClient的回环测试：服务端用合成数据源代替相机并打开多路视频流，
+在一个事件循环中用多个客户端同时接收，检查每个客户端的每一路视频流都收到了图像，并统计帧率。
+有视频流没有收到图像时以1退出，可以在CI中运行。
+
+    python bench/bench_async.py [--clients 4] [--streams 2] [--width 640] [--height 480] [--fps 30]
+"""
+
+PORT = 31030
+DURATION = 3.0
+
+
+async def receive(client: AsyncIpCameraClient, stream_id: int, counts: dict, deadline: float):
+    while time.perf_counter() < deadline:
+        try:
+            img, info = await asyncio.wait_for(client.read(stream_id, with_info=True), 1.0)
+        except asyncio.TimeoutError:
+            continue
+        if img is None:     # 连接断开
+            return
+        if info.stream_id != stream_id:
+            raise RuntimeError('stream %d got a frame of stream %d' % (stream_id, info.stream_id))
+        counts[stream_id] += 1
+
+
+async def run(client_num: int, stream_num: int, width: int, height: int):
+    clients = [AsyncIpCameraClient() for _ in range(client_num)]
+    for client in clients:
+        if not await client.connect('localhost', PORT):
+            raise RuntimeError('cannot connect to server')
+    for stream_id in range(stream_num):
+        await clients[0].set_camera(stream_id, width, height, stream_id)
+    for client in clients:
+        await client.start_capture()
+    counts = [{stream_id: 0 for stream_id in range(stream_num)} for _ in clients]
+    t0 = time.perf_counter()
+    await asyncio.gather(*[receive(client, stream_id, counts[i], t0 + DURATION)
+                           for i, client in enumerate(clients) for stream_id in range(stream_num)])
+    elapsed = time.perf_counter() - t0
+    for client in clients:
+        await client.stop_capture()
+        await client.close()
+    return counts, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='several asyncio clients receiving several streams')
+    parser.add_argument('--clients', type=int, default=4, help='number of clients')
+    parser.add_argument('--streams', type=int, default=2, help='number of streams')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--fps', type=float, default=30.0, help='source fps')
+    args = parser.parse_args()
+    client_num, stream_num, width, height, fps = args.clients, args.streams, args.width, args.height, args.fps
+
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: SyntheticCapture(idx, fps))
+    server.Start()
+    try:
+        counts, elapsed = asyncio.run(run(client_num, stream_num, width, height))
+    finally:
+        server.Stop()
+
+    print('%dx%d, %d clients x %d streams, source %.1f fps' % (width, height, client_num, stream_num, fps))
+    failed = False
+    for i, client_counts in enumerate(counts):
+        for stream_id, count in client_counts.items():
+            print('client %d stream %d: %.1f fps' % (i, stream_id, count / elapsed))
+            failed = failed or count == 0
+    if failed:
+        print('some streams received no frame')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture, capture_factory_for
+from IpCameraClient import IpCameraClient
+
+
+"""
+read_batch()的评测：服务端不限速(timing=max)地回放已压缩的MJPEG数据，客户端组成推理用的批数组
+(默认8 x 3 x 480 x 640, float32, 归一化到0~1)，比较
+    loop    循环调用read()，逐帧cv2.resize，再np.stack、转为float32、转置(每批都分配新的数组)
+    batch   read_batch()，缩放后直接写入复用的数组
+    lazy    lazy_decode=True的read_batch()，按不小于输出尺寸的缩小倍数解码
+的每秒帧数和每帧的进程CPU耗时
+
+    python bench/bench_batch.py [--width 1920] [--height 1080] [--batch 8] [--size 640x480] [--duration 3]
+"""
+
+PORT = 31120
+
+
+def make_source(tmp: Path, width: int, height: int, n: int = 30) -> str:
+    src = SyntheticCapture(0, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    rng = np.random.default_rng(0)
+    blob = tmp / 'frames.mjpeg'
+    with open(blob, 'wb') as f:
+        for _ in range(n):
+            image = src.read()[1].astype(np.int16) + rng.normal(0, 4, (height, width, 1)).astype(np.int16)
+            image = np.clip(image, 0, 255).astype(np.uint8)
+            f.write(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return str(blob)
+
+
+def read_loop(client: IpCameraClient, n: int, size: tuple):
+    frames = []
+    for _ in range(n):
+        img = client.read(timeout=1.0)
+        if img is None:
+            return None
+        frames.append(cv2.resize(img, size, interpolation=cv2.INTER_AREA))
+    return (np.stack(frames).astype(np.float32) / 255).transpose(0, 3, 1, 2).copy()
+
+
+def run(mode: str, width: int, height: int, n: int, size: tuple, duration: float) -> dict:
+    client = IpCameraClient(lazy_decode=(mode == 'lazy'))
+    if not client.connect('localhost', PORT):
+        raise RuntimeError('cannot connect to server')
+    try:
+        client.set_camera(0, width, height)
+        client.start_capture()
+        client.read(timeout=5.0)
+        batches, shape = 0, None
+        t0, c0 = time.perf_counter(), time.process_time()
+        while time.perf_counter() - t0 < duration:
+            if mode == 'loop':
+                batch = read_loop(client, n, size)
+            else:
+                batch, infos = client.read_batch(n, size, np.float32, channels_first=True, timeout=1.0)
+            if batch is not None:
+                batches += 1
+                shape = batch.shape
+        elapsed, cpu = time.perf_counter() - t0, time.process_time() - c0
+        client.stop_capture()
+    finally:
+        client.disconnect()
+    frames = batches * n
+    return {'mode': mode, 'fps': frames / elapsed, 'cpu_ms': cpu * 1000 / max(frames, 1), 'shape': shape}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='batched reads for inference')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--size', default='640x480')
+    parser.add_argument('--duration', type=float, default=3.0)
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.split('x'))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_source(Path(tmp), args.width, args.height)
+        server = CameraSocketServer('localhost', PORT, capture_factory=capture_factory_for(source, 30.0, 'max'))
+        server.Start()
+        try:
+            for mode in ('loop', 'batch', 'lazy'):
+                results.append(run(mode, args.width, args.height, args.batch, size, args.duration))
+        finally:
+            server.Stop()
+
+    print('%dx%d MJPEG -> batch of %d at %dx%d float32 NCHW' % (args.width, args.height, args.batch, size[0], size[1]))
+    print('%-6s %8s %12s %20s' % ('mode', 'fps', 'cpu ms/frame', 'shape'))
+    for r in results:
+        print('%-6s %8.1f %12.2f %20s' % (r['mode'], r['fps'], r['cpu_ms'], r['shape']))
+
+
+if __name__ == "__main__":
+    main()
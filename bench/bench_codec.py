@@ -0,0 +1,79 @@
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from FrameCodec import CodecConfig
+from FrameSource import SyntheticCapture
+from FrameDecoder import decode_payload
+
+
+"""
+各编码参数在不同分辨率下的评测矩阵：服务端编码耗时、客户端解码耗时(均为CPU时间)、每帧数据量，
+以及单核编码/解码所能达到的帧率上限。图像为合成图案叠加噪声，以接近真实相机图像的压缩率。
+
+    python bench/bench_codec.py
+"""
+
+RESOLUTIONS = [(640, 480), (1280, 960), (1920, 1080), (2592, 1944)]
+CODECS = [
+    CodecConfig('jpeg'),
+    CodecConfig('jpeg', quality=50, subsampling='420'),
+    CodecConfig('jpeg', quality=30, subsampling='420', optimize=True),
+    CodecConfig('jpeg', quality=95, subsampling='444'),
+    CodecConfig('webp', quality=50),
+    CodecConfig('png', compression=1),
+    CodecConfig('raw'),
+]
+REPEAT = 10
+
+
+def make_image(width: int, height: int) -> np.ndarray:
+    src = SyntheticCapture(0, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    image = src.read()[1].astype(np.int16)
+    noise = np.random.default_rng(0).normal(0, 6, image.shape).astype(np.int16)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def codec_name(codec: CodecConfig) -> str:
+    name = codec.codec
+    if codec.quality is not None:
+        name += ' q%d' % codec.quality
+    if codec.subsampling is not None:
+        name += ' %s' % codec.subsampling
+    if codec.optimize:
+        name += ' opt'
+    if codec.compression is not None:
+        name += ' c%d' % codec.compression
+    return name
+
+
+def main():
+    print('%-10s %-20s %10s %10s %10s %10s %10s' %
+          ('size', 'codec', 'KB/frame', 'enc ms', 'dec ms', 'enc fps', 'dec fps'))
+    for width, height in RESOLUTIONS:
+        image = make_image(width, height)
+        for codec in CODECS:
+            t0 = time.process_time()
+            for _ in range(REPEAT):
+                payload = codec.encode(image)
+            enc = (time.process_time() - t0) / REPEAT
+            data = np.frombuffer(payload, np.uint8)
+            t0 = time.process_time()
+            for _ in range(REPEAT):
+                decode_payload(codec.codec_id(), data)
+            dec = (time.process_time() - t0) / REPEAT
+            print('%-10s %-20s %10.1f %10.2f %10.2f %10.1f %10.1f' % (
+                '%dx%d' % (width, height), codec_name(codec), len(payload) / 1024,
+                enc * 1000, dec * 1000, 1 / max(enc, 1e-6), 1 / max(dec, 1e-6)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture
+from AsyncIpCameraClient import AsyncIpCameraClient
+
+
+"""
+服务端事件循环的评测：同时建立多个控制连接和数据连接，统计
+    - 控制命令的往返时间(get_stats)
+    - 从发送capture命令到收到第一帧图像的时间
+    - 服务端进程中的线程数(不再随连接数增加)
+
+    python bench/bench_connections.py [--connections 32] [--width 640] [--height 480]
+"""
+
+PORT = 31040
+
+
+async def run(conn_num: int, width: int, height: int):
+    clients = [AsyncIpCameraClient(decode_workers=1) for _ in range(conn_num)]
+    for client in clients:
+        if not await client.connect('localhost', PORT):
+            raise RuntimeError('cannot connect to server')
+    threads = threading.active_count()
+    await clients[0].set_camera(0, width, height)
+
+    rtts = []
+    for client in clients:
+        t0 = time.perf_counter()
+        await client.get_server_stats()
+        rtts.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await clients[0].start_capture()
+    first_frame = await clients[0].read()
+    first_frame_dur = time.perf_counter() - t0
+    for client in clients[1:]:
+        await client.start_capture()
+    # 所有连接都应该收到图像
+    frames = await asyncio.gather(*[asyncio.wait_for(client.read(), 5.0) for client in clients])
+    for client in clients:
+        await client.stop_capture()
+        await client.close()
+    return threads, rtts, first_frame_dur, first_frame is not None and all(f is not None for f in frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='many control and data connections on the server event loop')
+    parser.add_argument('--connections', type=int, default=32, help='number of clients')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    args = parser.parse_args()
+    conn_num, width, height = args.connections, args.width, args.height
+
+    base_threads = threading.active_count()
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: SyntheticCapture(idx, 30))
+    server.Start()
+    try:
+        threads, rtts, first_frame_dur, ok = asyncio.run(run(conn_num, width, height))
+    finally:
+        server.Stop()
+
+    rtts.sort()
+    print('%d control + %d data connections, %dx%d' % (conn_num, conn_num, width, height))
+    print('threads: %d (before server start: %d)' % (threads, base_threads))
+    print('command rtt: p50 %.2f ms, max %.2f ms' % (rtts[len(rtts) // 2] * 1000, rtts[-1] * 1000))
+    print('capture -> first frame: %.1f ms' % (first_frame_dur * 1000))
+    if not ok:
+        print('some connections received no frame')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
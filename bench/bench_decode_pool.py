@@ -0,0 +1,113 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture, capture_factory_for
+from IpCameraClient import IpCameraClient
+
+
+"""
+客户端并行解码(decode_workers)的评测：服务端不限速(timing=max)地回放已压缩的MJPEG数据(默认2592x1944)，
+服务端不解码也不重新编码，瓶颈在客户端的解码上。依次使用不同的解码线程数，统计
+    - read()得到的帧率、接收的帧率、单帧解码耗时、因解码跟不上而丢弃的帧数
+    - read()返回的服务端帧序号是否严格递增(按顺序交付)
+
+    python bench/bench_decode_pool.py [--source path] [--width 2592] [--height 1944] [--workers 0,1,2,4]
+"""
+
+PORT = 31100
+
+
+def make_source(tmp: Path, width: int, height: int, n: int = 30) -> str:
+    src = SyntheticCapture(0, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    rng = np.random.default_rng(0)
+    blob = tmp / 'frames.mjpeg'
+    with open(blob, 'wb') as f:
+        for _ in range(n):
+            image = src.read()[1].astype(np.int16) + rng.normal(0, 4, (height, width, 1)).astype(np.int16)
+            image = np.clip(image, 0, 255).astype(np.uint8)
+            f.write(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return str(blob)
+
+
+def run(workers: int, width: int, height: int, duration: float) -> dict:
+    client = IpCameraClient(decode_workers=workers)
+    if not client.connect('localhost', PORT):
+        raise RuntimeError('cannot connect to server')
+    try:
+        client.set_camera(0, width, height)
+        client.start_capture()
+        client.read(timeout=5.0)
+        frames, in_order, last_seq = 0, True, None
+        frames0 = client.get_stream_stats(0).rate('frames').total
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < duration:
+            img, info = client.read(timeout=1.0, with_info=True)
+            if img is None:
+                continue
+            frames += 1
+            if info.seq is not None:
+                if last_seq is not None and info.seq <= last_seq:
+                    in_order = False
+                last_seq = info.seq
+        elapsed = time.perf_counter() - t0
+        received = client.get_stream_stats(0).rate('frames').total - frames0
+        stats = client.get_stats().get(0, {})
+        client.stop_capture()
+    finally:
+        client.disconnect()
+    return {'workers': workers, 'fps': frames / elapsed, 'recv_fps': received / elapsed,
+            'decode_ms': stats.get('latency', {}).get('decode', {}).get('p50_ms', 0.0),
+            'skipped': stats.get('decode_skipped', 0), 'in_order': in_order}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='client fps with parallel jpeg decoding')
+    parser.add_argument('--source', default=None, help='mjpeg/avi file, jpeg directory or recording directory')
+    parser.add_argument('--width', type=int, default=2592)
+    parser.add_argument('--height', type=int, default=1944)
+    parser.add_argument('--workers', default=None, help='comma separated decode_workers, default 0,1,2,4... up to cpu count')
+    parser.add_argument('--duration', type=float, default=3.0)
+    args = parser.parse_args()
+
+    if args.workers is not None:
+        workers = [int(w) for w in args.workers.split(',')]
+    else:
+        workers = [0, 1]
+        while workers[-1] * 2 <= (os.cpu_count() or 1):
+            workers.append(workers[-1] * 2)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.source if args.source is not None else make_source(Path(tmp), args.width, args.height)
+        server = CameraSocketServer('localhost', PORT, capture_factory=capture_factory_for(source, 30.0, 'max'))
+        server.Start()
+        try:
+            for n in workers:
+                results.append(run(n, args.width, args.height, args.duration))
+        finally:
+            server.Stop()
+
+    print('%dx%d MJPEG, %d cpus' % (args.width, args.height, os.cpu_count() or 1))
+    print('%8s %8s %9s %10s %8s %9s' % ('workers', 'fps', 'recv fps', 'decode ms', 'skipped', 'in order'))
+    for r in results:
+        print('%8d %8.1f %9.1f %10.2f %8d %9s' % (
+            r['workers'], r['fps'], r['recv_fps'], r['decode_ms'], r['skipped'], r['in_order']))
+    if not all(r['in_order'] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture, capture_factory_for
+from IpCameraClient import IpCameraClient
+
+
+"""
+延迟解码(lazy_decode)和缩小解码(read(reduce=...))的评测：服务端以相机帧率回放已压缩的MJPEG数据(默认2592x1944, 30fps，
+不解码也不重新编码，服务端的CPU开销很小且各模式相同)，使用者只以较低的频率(默认5fps)调用read()，比较
+    eager          接收线程解码每一帧(原来的方式)
+    eager+resize   接收线程解码每一帧，read()后再用cv2.resize缩小
+    lazy           只在read()时按原尺寸解码
+    lazy/N         只在read()时按1/N尺寸解码(IMREAD_REDUCED_COLOR_N)
+    lazy/N gray    只在read()时按1/N尺寸解码为灰度图
+的进程CPU占用、解码次数和单次解码耗时
+
+    python bench/bench_lazy_decode.py [--width 2592] [--height 1944] [--read-fps 5] [--duration 5]
+"""
+
+PORT = 31110
+
+MODES = [('eager', False, 1, False, False), ('eager+resize', False, 4, False, True), ('lazy', True, 1, False, False),
+         ('lazy/4', True, 4, False, False), ('lazy/8', True, 8, False, False), ('lazy/4 gray', True, 4, True, False)]
+
+
+def make_source(tmp: Path, width: int, height: int, n: int = 30) -> str:
+    src = SyntheticCapture(0, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    rng = np.random.default_rng(0)
+    blob = tmp / 'frames.mjpeg'
+    with open(blob, 'wb') as f:
+        for _ in range(n):
+            image = src.read()[1].astype(np.int16) + rng.normal(0, 4, (height, width, 1)).astype(np.int16)
+            image = np.clip(image, 0, 255).astype(np.uint8)
+            f.write(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return str(blob)
+
+
+def run(mode: tuple, width: int, height: int, read_fps: float, duration: float) -> dict:
+    name, lazy, reduce, gray, resize = mode
+    client = IpCameraClient(lazy_decode=lazy)
+    if not client.connect('localhost', PORT):
+        raise RuntimeError('cannot connect to server')
+    try:
+        client.set_camera(0, width, height)
+        client.start_capture()
+        client.read(timeout=5.0)
+        decode0 = client.get_stream_stats(0).hist('decode').count
+        frames0 = client.get_stream_stats(0).rate('frames').total
+        reads, shape = 0, None
+        t0, c0 = time.perf_counter(), time.process_time()
+        while time.perf_counter() - t0 < duration:
+            if resize:
+                img = client.read(timeout=1.0)
+                if img is not None:
+                    img = cv2.resize(img, (img.shape[1] // reduce, img.shape[0] // reduce), interpolation=cv2.INTER_AREA)
+            else:
+                img = client.read(timeout=1.0, reduce=reduce, gray=gray)
+            if img is not None:
+                reads += 1
+                shape = img.shape
+            time.sleep(max(0.0, t0 + reads / read_fps - time.perf_counter()))
+        elapsed, cpu = time.perf_counter() - t0, time.process_time() - c0
+        stats = client.get_stream_stats(0)
+        decodes = stats.hist('decode').count - decode0
+        received = stats.rate('frames').total - frames0
+        decode_ms = stats.hist('decode').to_dict()['avg_ms']
+        client.stop_capture()
+    finally:
+        client.disconnect()
+    return {'mode': name, 'received': received, 'reads': reads, 'decodes': decodes, 'decode_ms': decode_ms,
+            'cpu_percent': cpu * 100.0 / elapsed, 'shape': shape}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='client cpu with lazy and reduced-resolution decoding')
+    parser.add_argument('--width', type=int, default=2592)
+    parser.add_argument('--height', type=int, default=1944)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--read-fps', type=float, default=5.0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_source(Path(tmp), args.width, args.height)
+        server = CameraSocketServer('localhost', PORT, capture_factory=capture_factory_for(source, args.fps))
+        server.Start()
+        try:
+            for mode in MODES:
+                results.append(run(mode, args.width, args.height, args.read_fps, args.duration))
+        finally:
+            server.Stop()
+
+    print('%dx%d MJPEG @ %.0f fps, read at %.0f fps' % (args.width, args.height, args.fps, args.read_fps))
+    print('%-14s %9s %6s %8s %10s %7s %16s' % ('mode', 'received', 'reads', 'decodes', 'decode ms', 'cpu %', 'shape'))
+    for r in results:
+        print('%-14s %9d %6d %8d %10.2f %7.1f %16s' % (
+            r['mode'], r['received'], r['reads'], r['decodes'], r['decode_ms'], r['cpu_percent'], r['shape']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture, capture_factory_for
+from IpCameraClient import IpCameraClient
+
+
+"""
+回环评测：在同一进程中运行服务端和IpCameraClient，服务端使用合成数据源或文件回放数据源代替相机，
+按GetAvailableFormats常见的分辨率(640x480 ~ 2592x1944)逐一测试，统计:
+    fps、端到端延迟(服务端采集到客户端read()返回)的百分位数、
+    每帧CPU耗时(服务端+客户端)、每秒接收的字节数、丢帧数以及服务端编码耗时
+结果以JSON输出，可以在Linux的CI中运行，--min-fps用于发现性能回退。
+
+    python bench/bench_loopback.py [--source synthetic,replay] [--json result.json] [--min-fps 10]
+                                   [--roi x,y,w,h] [--scale 0.5]
+--roi/--scale在服务端编码前裁剪和缩小图像(set_roi)，用于比较编码耗时、数据量和解码耗时的减少。
+replay使用--replay给出的视频文件或图片目录，未给出时生成一组带噪声的合成图片。
+"""
+
+PORT = 31020
+RESOLUTIONS = [(640, 480), (1280, 720), (1280, 960), (1920, 1080), (2592, 1944)]
+
+
+# 生成回放用的图片目录，叠加噪声使压缩率接近真实相机图像
+def make_replay_dir(path: Path, n: int = 16, width: int = 1920, height: int = 1080) -> Path:
+    src = SyntheticCapture(0, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        image = src.read()[1].astype(np.int16) + rng.normal(0, 6, (height, width, 3)).astype(np.int16)
+        cv2.imwrite(str(path / ('%04d.png' % i)), np.clip(image, 0, 255).astype(np.uint8))
+    return path
+
+
+def percentile(values: list, p: float) -> float:
+    return float(np.percentile(values, p)) * 1000.0 if len(values) > 0 else 0.0
+
+
+def run(source: str, width: int, height: int, fps: float, duration: float, warmup: float,
+        roi=None, scale=None) -> dict:
+    server = CameraSocketServer('localhost', PORT, capture_factory=capture_factory_for(source, fps))
+    server.Start()
+    client = IpCameraClient()
+    try:
+        if not client.connect('localhost', PORT):
+            raise RuntimeError('cannot connect to server')
+        client.set_camera(0, width, height)
+        if roi is not None or scale is not None:
+            client.set_roi(roi, scale)
+        client.start_capture()
+        t_end = time.perf_counter() + warmup
+        while time.perf_counter() < t_end:  # 跳过相机启动和文件载入阶段
+            client.read(timeout=1.0)
+        latencies = []
+        payload_bytes = 0
+        dropped0 = client.get_dropped()
+        t0, c0 = time.perf_counter(), time.process_time()
+        while time.perf_counter() - t0 < duration:
+            img, info = client.read(timeout=1.0, with_info=True)
+            if img is None:
+                continue
+            if info.capture_ts is not None:
+                latencies.append(time.time() - info.capture_ts)
+            payload_bytes += info.payload_len
+        elapsed, cpu = time.perf_counter() - t0, time.process_time() - c0
+        count = len(latencies)
+        server_stats = client.get_server_stats()
+        decode = client.get_stats().get(0, {}).get('latency', {}).get('decode', {})
+        client.stop_capture()
+    finally:
+        client.disconnect()
+        server.Stop()
+    encode = server_stats.get('streams', {}).get('0', {}).get('latency', {}).get('encode', {})
+    return {
+        'source': source,
+        'width': width,
+        'height': height,
+        'source_fps': fps,
+        'frames': count,
+        'fps': count / elapsed,
+        'latency_ms': {'p50': percentile(latencies, 50), 'p90': percentile(latencies, 90),
+                       'p99': percentile(latencies, 99), 'max': percentile(latencies, 100)},
+        'cpu_ms_per_frame': cpu * 1000.0 / max(count, 1),
+        'cpu_percent': cpu * 100.0 / elapsed,
+        'bytes_per_s': payload_bytes / elapsed,
+        'dropped': client.get_dropped() - dropped0,
+        'server_encode_ms': {'p50': encode.get('p50_ms', 0.0), 'p99': encode.get('p99_ms', 0.0)},
+        'client_decode_ms': {'p50': decode.get('p50_ms', 0.0), 'p99': decode.get('p99_ms', 0.0)},
+        'roi': roi,
+        'scale': scale,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='loopback benchmark of IpCameraServer + IpCameraClient')
+    parser.add_argument('--source', default='synthetic,replay', help='comma separated: synthetic, replay')
+    parser.add_argument('--replay', default=None, help='video file or image directory for the replay source')
+    parser.add_argument('--resolutions', default=','.join('%dx%d' % r for r in RESOLUTIONS))
+    parser.add_argument('--fps', type=float, default=0.0, help='source fps, 0 means unlimited')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--json', default=None, help='write results to this file')
+    parser.add_argument('--min-fps', type=float, default=0.0, help='exit with 1 if any run is slower')
+    parser.add_argument('--roi', default=None, help='x,y,w,h cropped on the server before encoding')
+    parser.add_argument('--scale', type=float, default=None, help='server side downscale (0~1]')
+    args = parser.parse_args()
+
+    resolutions = [tuple(int(v) for v in r.split('x')) for r in args.resolutions.split(',')]
+    roi = None if args.roi is None else [int(v) for v in args.roi.split(',')]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.source.split(','):
+            source = name
+            if name == 'replay':
+                source = args.replay if args.replay is not None else str(make_replay_dir(Path(tmp)))
+            for width, height in resolutions:
+                result = run(source, width, height, args.fps, args.duration, args.warmup, roi, args.scale)
+                result['source'] = name
+                results.append(result)
+
+    print('%-10s %-10s %8s %8s %8s %8s %10s %10s %10s %8s' % (
+        'source', 'size', 'fps', 'p50 ms', 'p99 ms', 'cpu ms', 'MB/s', 'enc ms', 'dec ms', 'dropped'))
+    for r in results:
+        print('%-10s %-10s %8.1f %8.2f %8.2f %8.2f %10.1f %10.2f %10.2f %8d' % (
+            r['source'], '%dx%d' % (r['width'], r['height']), r['fps'], r['latency_ms']['p50'],
+            r['latency_ms']['p99'], r['cpu_ms_per_frame'], r['bytes_per_s'] / 1e6,
+            r['server_encode_ms']['p50'], r['client_decode_ms']['p50'], r['dropped']))
+
+    if args.json is not None:
+        report = {'python': platform.python_version(), 'opencv': cv2.__version__,
+                  'platform': platform.platform(), 'results': results}
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    slow = [r for r in results if r['fps'] < args.min_fps]
+    if len(slow) > 0:
+        for r in slow:
+            print('too slow: %s %dx%d %.1f fps < %.1f' % (r['source'], r['width'], r['height'], r['fps'], args.min_fps))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
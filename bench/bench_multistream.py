@@ -0,0 +1,74 @@
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture
+from IpCameraClient import IpCameraClient
+
+
+"""
+多路视频流的回环测试：服务端用合成数据源代替相机，同时打开多路视频流，
+客户端通过一个数据连接接收，统计每一路视频流的帧率。
+
+    python bench/bench_multistream.py [--streams 4] [--width 1280] [--height 960] [--fps 30]
+"""
+
+PORT = 31000
+DURATION = 5.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='several streams over one data connection')
+    parser.add_argument('--streams', type=int, default=4, help='number of streams')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--fps', type=float, default=30.0, help='source fps')
+    args = parser.parse_args()
+    stream_num, width, height, fps = args.streams, args.width, args.height, args.fps
+
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: SyntheticCapture(idx, fps))
+    server.Start()
+    client = IpCameraClient()
+    if not client.connect('localhost', PORT):
+        print('cannot connect to server')
+        server.Stop()
+        return
+    for stream_id in range(stream_num):
+        client.set_camera(stream_id, width, height, stream_id)
+
+    counts = [0] * stream_num
+    stop = threading.Event()
+
+    def reader(stream_id):
+        while not stop.is_set():
+            if client.read(stream_id, timeout=0.5) is not None:
+                counts[stream_id] += 1
+
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(stream_num)]
+    for th in readers:
+        th.start()
+    client.start_capture()
+    time.sleep(1.0)     # 跳过相机启动阶段
+    start_counts = list(counts)
+    time.sleep(DURATION)
+    end_counts = list(counts)
+    stop.set()
+    for th in readers:
+        th.join()
+    client.stop_capture()
+    client.disconnect()
+    server.Stop()
+
+    print('%dx%d, %d streams, source %.1f fps' % (width, height, stream_num, fps))
+    for stream_id in range(stream_num):
+        print('stream %d: %.1f fps' % (stream_id, (end_counts[stream_id] - start_counts[stream_id]) / DURATION))
+
+
+if __name__ == "__main__":
+    main()
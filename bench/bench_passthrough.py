@@ -0,0 +1,54 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+from CameraStream import CameraStream
+from FramePipeline import Frame
+from FrameSource import RecordedMjpegCapture
+
+
+"""
+对比服务端每帧的CPU耗时：
+    reencode    -> 相机的JPEG先由OpenCV解码为BGR，再用cv2.imencode重新编码(原来的方式)
+    passthrough -> CAP_PROP_CONVERT_RGB=0, 直接转发相机的JPEG数据
+使用录制的MJPEG数据源代替相机，单线程运行，CPU耗时用time.process_time统计。
+
+    python bench/bench_passthrough.py
+"""
+
+RESOLUTIONS = [(640, 480), (1280, 960), (1920, 1080), (2592, 1944)]
+FRAME_NUM = 60
+
+
+def run(source: RecordedMjpegCapture, width: int, height: int, passthrough: bool):
+    stream = CameraStream(0, None, capture_factory=lambda idx: source)
+    stream.configure(0, width, height)
+    stream.passthrough = passthrough
+    cap = stream.open_capture()
+    try:
+        payload_bytes = 0
+        t0 = time.process_time()
+        for seq in range(FRAME_NUM):
+            ret, image = cap.read()
+            frame = Frame(seq, image, 0.0)
+            stream.encode_frame(frame)
+            payload_bytes += sum(len(payload) for payload in frame.payloads.values())
+        cpu = time.process_time() - t0
+        mode = 'passthrough' if stream.passthrough_active else 'reencode'
+    finally:
+        stream.release_capture(cap)     # 归还给相机池或关闭
+    return mode, cpu * 1000 / FRAME_NUM, payload_bytes / FRAME_NUM / 1024
+
+
+def main():
+    print('%-10s %-12s %12s %12s' % ('size', 'path', 'cpu ms/frame', 'KB/frame'))
+    for width, height in RESOLUTIONS:
+        for passthrough in (False, True):
+            source = RecordedMjpegCapture.from_synthetic(width, height, n=30, fps=0)
+            mode, cpu_ms, kb = run(source, width, height, passthrough)
+            print('%-10s %-12s %12.2f %12.1f' % ('%dx%d' % (width, height), mode, cpu_ms, kb))
+
+
+if __name__ == "__main__":
+    main()
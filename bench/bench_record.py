@@ -0,0 +1,100 @@
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import capture_factory_for
+from IpCameraClient import IpCameraClient
+from FrameRecorder import FramePlayer
+
+
+"""
+录像的评测：客户端以全帧率接收(默认2592x1944)并把原始数据写入录像目录，统计
+    - 收到的帧数、写入的帧数、因磁盘跟不上而丢弃的帧数以及写入速率
+    - 回放时打开录像、按时间查找(二分)以及随机读取一帧并解码的耗时
+
+    python bench/bench_record.py [--source synthetic] [--width 2592] [--height 1944] [--duration 5]
+--dir指定录像目录(默认为临时目录，结束后删除)
+"""
+
+PORT = 31080
+
+
+def record(args, path: Path) -> dict:
+    server = CameraSocketServer('localhost', PORT, capture_factory=capture_factory_for(args.source, args.fps))
+    server.Start()
+    client = IpCameraClient()
+    try:
+        if not client.connect('localhost', PORT):
+            raise RuntimeError('cannot connect to server')
+        client.set_camera(0, args.width, args.height)
+        client.start_capture()
+        client.read(timeout=5.0)
+        frames0 = client.get_stream_stats(0).rate('frames').total
+        client.start_recording(path)
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < args.duration:
+            client.read(timeout=1.0)
+        stats = client.stop_recording()
+        elapsed = time.perf_counter() - t0
+        received = client.get_stream_stats(0).rate('frames').total - frames0
+        client.stop_capture()
+    finally:
+        client.disconnect()
+        server.Stop()
+    stats['received'] = received
+    stats['elapsed'] = elapsed
+    return stats
+
+
+def playback(path: Path, seeks: int) -> dict:
+    t0 = time.perf_counter()
+    player = FramePlayer(path, 0)
+    open_dur = time.perf_counter() - t0
+    n = len(player)
+    first, last = player.info(0).capture_ts, player.info(n - 1).capture_ts
+    t0 = time.perf_counter()
+    for _ in range(seeks):
+        player.find_time(random.uniform(first, last))
+    seek_dur = (time.perf_counter() - t0) / seeks
+    t0 = time.perf_counter()
+    for _ in range(min(seeks, 50)):
+        player.decode(random.randrange(n))
+    decode_dur = (time.perf_counter() - t0) / min(seeks, 50)
+    player.close()
+    return {'frames': n, 'open_ms': open_dur * 1000, 'seek_us': seek_dur * 1e6, 'read_decode_ms': decode_dur * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='record received frames and seek in the recording')
+    parser.add_argument('--source', default='synthetic', help='synthetic, or a video file / image directory')
+    parser.add_argument('--width', type=int, default=2592)
+    parser.add_argument('--height', type=int, default=1944)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--seeks', type=int, default=10000)
+    parser.add_argument('--dir', default=None, help='recording directory, default is a temporary one')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.dir) if args.dir is not None else Path(tmp) / 'rec'
+        rec = record(args, path)
+        play = playback(path, args.seeks)
+
+    print('%dx%d from %s, %.1f s' % (args.width, args.height, args.source, rec['elapsed']))
+    print('received %d, written %d, dropped %d, skipped %d, %.1f MB/s' % (
+        rec['received'], rec['written'], rec['dropped'], rec['skipped'], rec['bytes'] / rec['elapsed'] / 1e6))
+    print('playback: %d frames, open %.2f ms, seek by time %.2f us, read+decode %.2f ms' % (
+        play['frames'], play['open_ms'], play['seek_us'], play['read_decode_ms']))
+    if rec['dropped'] > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
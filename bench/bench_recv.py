@@ -0,0 +1,101 @@
+import sys
+import socket
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'client'))
+from RecvBuffer import RecvBuffer
+
+
+"""
+数据流接收路径的微基准测试：对比原来的 bytes += recv() 拼接方式与 RecvBuffer(recv_into) 方式，
+输出每种帧大小下的吞吐量(MB/s)、tracemalloc统计的内存分配峰值以及缓冲区扩容次数。
+帧大小取常见分辨率下JPEG的大致尺寸以及1280x960的原始BGR尺寸。
+
+    python bench/bench_recv.py
+"""
+
+FRAME_SIZES = [64*1024, 256*1024, 1024*1024, 1280*960*3]
+RECV_BUFSIZE = 1024*1024
+
+
+# 原来IpCameraClient.recv_data_pack中的接收方式，仅用于对比
+def recv_concat(cli_socket: socket.socket) -> int:
+    recv_bytes = cli_socket.recv(4, socket.MSG_WAITALL)
+    total_len = int.from_bytes(recv_bytes, byteorder='big')
+    recv_bytes = b''
+    while len(recv_bytes) < total_len:
+        to_read = total_len - len(recv_bytes)
+        recv_bytes += cli_socket.recv(
+            RECV_BUFSIZE if to_read > RECV_BUFSIZE else to_read)
+    return len(recv_bytes)
+
+
+def make_recv_into():
+    recv_buf = RecvBuffer(RECV_BUFSIZE)
+
+    def recv_into(cli_socket: socket.socket) -> int:
+        return recv_buf.recv_pack(cli_socket)
+    return recv_into, recv_buf
+
+
+def socket_pair():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sender.connect(server.getsockname())
+    receiver, _ = server.accept()
+    server.close()
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFSIZE)
+    return sender, receiver
+
+
+def send_frames(sender: socket.socket, frame_size: int, count: int):
+    payload = bytes(frame_size)
+    length_info = frame_size.to_bytes(4, byteorder='big')
+    for _ in range(count):
+        sender.sendall(length_info)
+        sender.sendall(payload)
+
+
+def run_once(recv_func, frame_size: int, count: int, trace: bool):
+    sender, receiver = socket_pair()
+    th = threading.Thread(target=send_frames, args=(sender, frame_size, count))
+    th.start()
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    for _ in range(count):
+        recv_func(receiver)
+    elapsed = time.perf_counter() - t0
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    th.join()
+    sender.close()
+    receiver.close()
+    return elapsed, peak
+
+
+def main():
+    print('%10s %-10s %10s %14s %8s' % ('frame', 'method', 'MB/s', 'peak alloc KB', 'grows'))
+    for frame_size in FRAME_SIZES:
+        count = max(20, (256*1024*1024) // frame_size)
+        mb = frame_size * count / (1024*1024)
+        for name in ('concat', 'recv_into'):
+            if name == 'concat':
+                recv_func, recv_buf = recv_concat, None
+            else:
+                recv_func, recv_buf = make_recv_into()
+            elapsed, _ = run_once(recv_func, frame_size, count, trace=False)
+            _, peak = run_once(recv_func, frame_size, 10, trace=True)
+            grows = '-' if recv_buf is None else str(recv_buf.grow_count)
+            print('%10d %-10s %10.1f %14.1f %8s' % (frame_size, name, mb/elapsed, peak/1024, grows))
+
+
+if __name__ == "__main__":
+    main()
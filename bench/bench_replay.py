@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture, capture_factory_for
+from IpCameraClient import IpCameraClient
+from AsyncIpCameraClient import AsyncIpCameraClient
+
+
+"""
+压缩数据回放的评测：服务端不限速(timing=max)地回放已压缩的JPEG数据(不解码、不重新编码)，
+测量同步客户端和异步客户端接收路径的最大吞吐，可以在没有相机的Linux机器上运行。
+未给出--source时生成一段拼接的JPEG数据以及一个MJPEG的AVI文件。
+
+    python bench/bench_replay.py [--source path] [--width 1920] [--height 1080] [--duration 3]
+"""
+
+PORT = 31090
+
+
+def make_sources(tmp: Path, width: int, height: int, n: int = 60) -> list:
+    src = SyntheticCapture(0, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(n):
+        image = src.read()[1].astype(np.int16) + rng.normal(0, 4, (height, width, 1)).astype(np.int16)
+        frames.append(np.clip(image, 0, 255).astype(np.uint8))
+    blob = tmp / 'frames.mjpeg'
+    with open(blob, 'wb') as f:
+        for image in frames:
+            f.write(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    sources = [str(blob)]
+    avi = tmp / 'frames.avi'
+    writer = cv2.VideoWriter(str(avi), cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), 30.0, (width, height))
+    if writer.isOpened():
+        for image in frames:
+            writer.write(image)
+        writer.release()
+        sources.append(str(avi))
+    return sources
+
+
+def run_sync(duration: float) -> dict:
+    client = IpCameraClient()
+    if not client.connect('localhost', PORT):
+        raise RuntimeError('cannot connect to server')
+    try:
+        client.set_camera(0, 640, 480)      # 回放数据的分辨率是固定的
+        client.start_capture()
+        client.read(timeout=5.0)
+        frames = 0
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < duration:
+            img, info = client.read(timeout=1.0, with_info=True)
+            if img is not None:
+                frames += 1
+        elapsed = time.perf_counter() - t0
+        stats = client.get_stats().get(0, {})
+        server_stats = client.get_server_stats()
+        client.stop_capture()
+    finally:
+        client.disconnect()
+    rate = stats.get('rate', {})
+    return {'client': 'sync', 'fps': frames / elapsed, 'recv_fps': rate.get('frames', {}).get('per_s', 0.0),
+            'mb_per_s': rate.get('bytes', {}).get('per_s', 0.0) / 1e6,
+            'decode_ms': stats.get('latency', {}).get('decode', {}).get('p50_ms', 0.0),
+            'server': server_stats.get('streams', {}).get('0', {})}
+
+
+async def run_async(duration: float) -> dict:
+    client = AsyncIpCameraClient(decode_workers=4)
+    if not await client.connect('localhost', PORT):
+        raise RuntimeError('cannot connect to server')
+    try:
+        await client.set_camera(0, 640, 480)
+        await client.start_capture()
+        await client.read()
+        frames = 0
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < duration:
+            if await asyncio.wait_for(client.read(), 1.0) is not None:
+                frames += 1
+        elapsed = time.perf_counter() - t0
+        stats = client.get_stats().get(0, {})
+        await client.stop_capture()
+    finally:
+        await client.close()
+    rate = stats.get('rate', {})
+    return {'client': 'async', 'fps': frames / elapsed, 'recv_fps': rate.get('frames', {}).get('per_s', 0.0),
+            'mb_per_s': rate.get('bytes', {}).get('per_s', 0.0) / 1e6,
+            'decode_ms': stats.get('latency', {}).get('decode', {}).get('p50_ms', 0.0), 'server': {}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='maximum client throughput with compressed replay')
+    parser.add_argument('--source', default=None, help='mjpeg/avi file, jpeg directory or recording directory')
+    parser.add_argument('--timing', default='max', help='max, original or fps')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--duration', type=float, default=3.0)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = [args.source] if args.source is not None else make_sources(Path(tmp), args.width, args.height)
+        for source in sources:
+            server = CameraSocketServer('localhost', PORT, capture_factory=capture_factory_for(source, args.fps, args.timing))
+            server.Start()
+            try:
+                for result in (run_sync(args.duration), asyncio.run(run_async(args.duration))):
+                    result['source'] = Path(source).name
+                    results.append(result)
+            finally:
+                server.Stop()
+
+    print('timing %s' % args.timing)
+    print('%-16s %-6s %8s %9s %8s %10s %12s %12s' % (
+        'source', 'client', 'fps', 'recv fps', 'MB/s', 'decode ms', 'passthrough', 'server enc ms'))
+    for r in results:
+        server = r['server']
+        print('%-16s %-6s %8.1f %9.1f %8.1f %10.2f %12s %12s' % (
+            r['source'], r['client'], r['fps'], r['recv_fps'], r['mb_per_s'], r['decode_ms'],
+            server.get('passthrough', '-'),
+            '%.2f' % server['latency']['encode']['p50_ms'] if 'latency' in server else '-'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture
+from IpCameraClient import IpCameraClient
+
+
+"""
+分块增量传输('tiles')的评测：比较jpeg与tiles在两种场景下的
+每帧数据量、每秒字节数、客户端解码耗时和端到端延迟
+    static: 静止的背景 + 传感器噪声 + 一个移动的小方块(模拟固定的检测相机)
+    moving: 整幅图像都在移动的合成图像
+
+    python bench/bench_tiles.py [--width 1280] [--height 960] [--duration 3]
+"""
+
+PORT = 31070
+
+
+# 静止场景: 背景不动，叠加噪声，只有一个小方块在移动
+class StaticSceneCapture(SyntheticCapture):
+    def __init__(self, cam_idx: int = 0, fps: float = 30.0, noise: float = 2.0) -> None:
+        super().__init__(cam_idx, fps)
+        self.noise = noise
+        self.rng = np.random.default_rng(cam_idx)
+        self.background = None
+
+    def read(self):
+        ret, frame = super().read()
+        if not ret:
+            return ret, frame
+        if self.background is None or self.background.shape != frame.shape:
+            self.background = frame.copy()
+        frame = self.background.copy()
+        if self.noise > 0:
+            noise = self.rng.normal(0, self.noise, frame.shape[:2]).astype(np.int16)[:, :, None]
+            frame = np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        size = 40
+        x = (self.frame_cnt * 6) % (self.width - size)
+        y = self.height // 2
+        frame[y:y + size, x:x + size] = (0, 0, 255)
+        return True, frame
+
+
+def run(scene: str, codec: str, width: int, height: int, fps: float, duration: float) -> dict:
+    capture = StaticSceneCapture if scene == 'static' else SyntheticCapture
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: capture(idx, fps))
+    server.Start()
+    client = IpCameraClient()
+    try:
+        if not client.connect('localhost', PORT):
+            raise RuntimeError('cannot connect to server')
+        client.set_codec(codec, quality=80)
+        client.set_camera(0, width, height)
+        client.start_capture()
+        client.read(timeout=5.0)
+        frames, nbytes, latencies = 0, 0, []
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < duration:
+            img, info = client.read(timeout=1.0, with_info=True)
+            if img is None:
+                continue
+            frames += 1
+            nbytes += info.payload_len
+            if info.latency() is not None:
+                latencies.append(info.latency())
+        elapsed = time.perf_counter() - t0
+        decode = client.get_stats().get(0, {}).get('latency', {}).get('decode', {})
+        client.stop_capture()
+    finally:
+        client.disconnect()
+        server.Stop()
+    latencies.sort()
+    return {'scene': scene, 'codec': codec, 'fps': frames / elapsed,
+            'kb_per_frame': nbytes / max(frames, 1) / 1024, 'mb_per_s': nbytes / elapsed / 1e6,
+            'decode_ms': decode.get('p50_ms', 0.0),
+            'latency_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tile delta transport vs full jpeg frames')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--duration', type=float, default=3.0)
+    args = parser.parse_args()
+
+    results = []
+    for scene in ('static', 'moving'):
+        for codec in ('jpeg', 'tiles'):
+            results.append(run(scene, codec, args.width, args.height, args.fps, args.duration))
+
+    print('%dx%d @ %.0f fps, quality 80' % (args.width, args.height, args.fps))
+    print('%-8s %-6s %6s %10s %8s %10s %12s' % ('scene', 'codec', 'fps', 'KB/frame', 'MB/s', 'decode ms', 'latency ms'))
+    for r in results:
+        print('%-8s %-6s %6.1f %10.1f %8.2f %10.2f %12.2f' % (
+            r['scene'], r['codec'], r['fps'], r['kb_per_frame'], r['mb_per_s'], r['decode_ms'], r['latency_ms']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture
+from IpCameraClient import IpCameraClient
+
+
+"""
+同一台机器上不同传输方式的对比: jpeg(默认) / raw(不压缩, TCP) / shm(共享内存)
+服务端使用不限速的合成数据源，统计客户端的帧率以及整个进程(服务端+客户端)每帧的CPU耗时。
+
+    python bench/bench_transport.py [--width 1280] [--height 960]
+"""
+
+PORT = 31010
+DURATION = 3.0
+
+
+def run(width: int, height: int, transport: str):
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: SyntheticCapture(idx, 0))
+    server.Start()
+    client = IpCameraClient()
+    try:
+        if not client.connect('localhost', PORT):
+            raise RuntimeError('cannot connect to server')
+        if transport == 'shm' and not client.set_transport('shm'):
+            raise RuntimeError('shm transport not available')
+        elif transport != 'jpeg':
+            client.set_codec(transport)
+        client.set_camera(0, width, height)
+        client.start_capture()
+        client.read(timeout=5.0)
+        count = 0
+        t0, c0 = time.perf_counter(), time.process_time()
+        while time.perf_counter() - t0 < DURATION:
+            if client.read(timeout=1.0) is not None:
+                count += 1
+        elapsed, cpu = time.perf_counter() - t0, time.process_time() - c0
+        client.stop_capture()
+    finally:
+        client.disconnect()
+        server.Stop()
+    return count / elapsed, cpu * 1000 / max(count, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='jpeg, raw and shared memory transport on one host')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    args = parser.parse_args()
+    width, height = args.width, args.height
+    print('%dx%d' % (width, height))
+    print('%-8s %10s %14s' % ('transport', 'fps', 'cpu ms/frame'))
+    for transport in ('jpeg', 'raw', 'shm'):
+        fps, cpu_ms = run(width, height, transport)
+        print('%-8s %10.1f %14.2f' % (transport, fps, cpu_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'client'))
+from Undistorter import Undistorter
+
+
+"""
+畸变校正的对比：每帧cv2.undistort与缓存映射表后cv2.remap(定点/浮点映射表，是否复用输出图像)
+输出各分辨率下每帧的耗时以及与cv2.undistort结果的最大差值。
+
+    python bench/bench_undistort.py
+"""
+
+RESOLUTIONS = [(640, 480), (1280, 960), (1920, 1080), (2592, 1944)]
+REPEAT = 20
+
+
+def make_params(width: int, height: int):
+    f = width * 0.9
+    matrix = np.array([[f, 0, width / 2], [0, f, height / 2], [0, 0, 1]], np.float64)
+    distortion = np.array([[-0.28, 0.09, 0.001, -0.0005, -0.01]], np.float64)
+    return matrix, distortion
+
+
+def timeit(func) -> float:
+    func()      # 第一次调用时生成映射表，不计入
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (time.perf_counter() - t0) / REPEAT * 1000
+
+
+def main():
+    print('%-10s %12s %12s %12s %12s %10s' % ('size', 'undistort', 'remap float', 'remap fixed', 'fixed+buf', 'max diff'))
+    for width, height in RESOLUTIONS:
+        image = np.random.default_rng(0).integers(0, 256, (height, width, 3), np.uint8)
+        matrix, distortion = make_params(width, height)
+        fixed = Undistorter(matrix, distortion)
+        floating = Undistorter(matrix, distortion, fixed_point=False)
+        out = np.empty_like(image)
+        t_undist = timeit(lambda: cv2.undistort(image, matrix, distortion))
+        t_float = timeit(lambda: floating.undistort(image))
+        t_fixed = timeit(lambda: fixed.undistort(image))
+        t_buf = timeit(lambda: fixed.undistort(image, out))
+        diff = np.abs(cv2.undistort(image, matrix, distortion).astype(np.int16) - fixed.undistort(image)).max()
+        print('%-10s %10.2fms %10.2fms %10.2fms %10.2fms %10d' % (
+            '%dx%d' % (width, height), t_undist, t_float, t_fixed, t_buf, diff))
+
+
+if __name__ == "__main__":
+    main()
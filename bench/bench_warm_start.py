@@ -0,0 +1,85 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture
+from IpCameraClient import IpCameraClient
+
+
+"""
+相机池的评测：用打开和设置分辨率都很慢的合成数据源模拟DirectShow相机，
+反复stop_capture/start_capture(以及断开重连)，统计从发送capture命令到收到第一帧的时间，
+对比不使用相机池(idle_timeout=0)与使用相机池的情况。
+
+    python bench/bench_warm_start.py [--open-delay 1.5] [--cycles 4]
+"""
+
+PORT = 31050
+OPEN_DELAY = 1.5
+RESIZE_DELAY = 0.3
+
+
+# 模拟DirectShow相机: 打开以及修改分辨率需要较长时间
+class SlowOpenCapture(SyntheticCapture):
+    def __init__(self, cam_idx: int = 0, fps: float = 30.0) -> None:
+        time.sleep(OPEN_DELAY)
+        super().__init__(cam_idx, fps)
+
+    def set(self, prop: int, value) -> bool:
+        if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT) and int(value) != int(self.get(prop)):
+            time.sleep(RESIZE_DELAY)
+        return super().set(prop, value)
+
+
+def first_frame_time(client: IpCameraClient) -> float:
+    t0 = time.perf_counter()
+    client.start_capture()
+    client.read(timeout=10.0)
+    return time.perf_counter() - t0
+
+
+def run(idle_timeout: float, cycles: int) -> list:
+    server = CameraSocketServer('localhost', PORT, capture_factory=SlowOpenCapture)
+    server.capture_pool.idle_timeout = idle_timeout
+    server.Start()
+    results = []
+    try:
+        for i in range(cycles):
+            client = IpCameraClient()   # 每次都重新连接
+            if not client.connect('localhost', PORT):
+                raise RuntimeError('cannot connect to server')
+            size = (1280, 960) if i != cycles - 1 else (640, 480)     # 最后一次只改变分辨率
+            client.set_camera(0, size[0], size[1])
+            results.append(first_frame_time(client))
+            client.stop_capture()
+            client.disconnect()
+    finally:
+        server.Stop()
+    return results
+
+
+def main():
+    global OPEN_DELAY
+    parser = argparse.ArgumentParser(description='capture -> first frame with and without the capture pool')
+    parser.add_argument('--open-delay', type=float, default=OPEN_DELAY, help='seconds to open a camera')
+    parser.add_argument('--cycles', type=int, default=4, help='stop/start cycles')
+    args = parser.parse_args()
+    OPEN_DELAY = args.open_delay
+    cycles = args.cycles
+    cold = run(0, cycles)
+    warm = run(60.0, cycles)
+    print('open %.1fs, resize %.1fs; capture -> first frame (ms), last cycle changes resolution' % (OPEN_DELAY, RESIZE_DELAY))
+    print('%-6s %12s %12s' % ('cycle', 'no pool', 'pool'))
+    for i in range(cycles):
+        print('%-6d %12.1f %12.1f' % (i, cold[i] * 1000, warm[i] * 1000))
+
+
+if __name__ == "__main__":
+    main()
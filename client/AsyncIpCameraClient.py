@@ -0,0 +1,404 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from FrameHeader import read_header_async, PROTOCOL_VERSION
+from FrameDecoder import decode_payload
+from ShmFrameReader import ShmFrameReader
+from StageStats import StageStats
+from WireFormat import encode_message, decode_message, CODEC_SHM, CODEC_TILES
+from TileDecoder import TileDecoder
+from FrameRecorder import FrameRecorder
+
+"""
+基于asyncio的网络相机客户端，控制连接和数据连接均使用asyncio streams，不为每个连接创建线程，
+一个事件循环中可以同时连接多个服务端、接收多路视频流。解码在一个小的线程池中进行，多个客户端可以共用同一个线程池。
+
+    client = AsyncIpCameraClient()
+    await client.connect('localhost', 30000)
+    cameras = await client.get_cameras()
+    await client.set_camera(0, 1280, 960)
+    await client.start_capture()
+    async for frame in client.frames():
+        ...
+    await client.close()
+
+每路视频流保留最近queue_size帧，读取不及时时丢弃最旧的帧；每路视频流同一时间只能有一个frames()迭代器。
+"""
+
+class AsyncIpCameraClient:
+    def __init__(self, decode_workers: int = 2, executor: ThreadPoolExecutor = None, queue_size: int = 2) -> None:
+        self.own_executor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(decode_workers)
+        self.queue_size = queue_size
+        self.queues = {}            # stream_id -> asyncio.Queue, 元素为(info, 解码的future)，连接断开时为None
+        self.dropped = {}           # stream_id -> 因读取不及时而丢弃的帧数
+        self.stats = {}             # stream_id -> StageStats
+        self.protocol = 0           # 与服务端协商的帧头版本
+        self.data_reader = None
+        self.data_writer = None
+        self.ctrl_reader = None
+        self.ctrl_writer = None
+        self.req_ids = itertools.count(1)   # 控制命令的请求ID
+        self.pending = OrderedDict()        # 请求ID -> 等待应答的future，可以同时有多个命令在进行
+        self.ctrl_features = []             # 服务端控制协议支持的功能(id/batch/pipelining)
+        self.ctrl_encodings = ['json']
+        self.ctrl_encoding = 'json'
+        self.recv_task = None
+        self.ctrl_task = None
+        self.shm_reader = ShmFrameReader()
+        self.tile_decoders = {}     # stream_id -> TileDecoder, 分块增量传输
+        self.tile_executor = None   # 分块数据必须按顺序逐帧解码，使用单独的单线程池
+        self.recorder = None        # FrameRecorder, 录制收到的原始数据
+        self.closed = False
+
+    async def connect(self, ip='localhost', port=30000) -> bool:
+        try:
+            self.data_reader, self.data_writer = await asyncio.open_connection(ip, port)
+            self.ctrl_reader, self.ctrl_writer = await asyncio.open_connection(ip, port + 1)
+        except OSError as e:
+            print('connect err: %s' % str(e))
+            await self.close()
+            return False
+        self.ctrl_task = asyncio.ensure_future(self.ctrl_loop())
+        await self.get_ctrl_features()
+        await self.subscribe()  # 使用带stream_id的帧头，旧版本的服务端会忽略该命令
+        self.recv_task = asyncio.ensure_future(self.recv_loop())
+        return True
+
+    async def close(self):
+        self.closed = True
+        for task in (self.recv_task, self.ctrl_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self.recv_task = self.ctrl_task = None
+        for writer in (self.data_writer, self.ctrl_writer):
+            if writer is not None:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+        self.data_writer = self.ctrl_writer = None
+        self.close_queues()
+        self.shm_reader.close()
+        self.stop_recording()
+        if self.own_executor:
+            self.executor.shutdown(wait=False)
+        if self.tile_executor is not None:
+            self.tile_executor.shutdown(wait=False)
+            self.tile_executor = None
+
+    def data_port(self) -> int:
+        return self.data_writer.get_extra_info('sockname')[1]
+
+    """
+    发送一个控制命令并等待应答, 格式与IpCameraClient相同: 4字节大端长度 + json/二进制编码
+    不需要等待上一个命令的应答，多个协程可以同时发送命令，应答按请求ID匹配
+    控制连接已断开或已close()时抛出ConnectionError，等待中的命令在连接断开时同样抛出ConnectionError
+    """
+    async def request(self, cmd: dict) -> dict:
+        if self.ctrl_task is None or self.ctrl_task.done():
+            raise ConnectionError('ctrl connection closed')
+        cmd = dict(cmd)
+        cmd['id'] = next(self.req_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[cmd['id']] = future
+        send_data = encode_message(cmd, self.ctrl_encoding)
+        self.ctrl_writer.write(len(send_data).to_bytes(4, byteorder='big') + send_data)
+        await self.ctrl_writer.drain()
+        return await future
+
+    # 接收控制连接上的应答，按请求ID交给等待的命令；旧版本的服务端不返回ID，按顺序匹配
+    async def ctrl_loop(self):
+        try:
+            while True:
+                data_len = int.from_bytes(await self.ctrl_reader.readexactly(4), byteorder='big')
+                response, encoding = decode_message(await self.ctrl_reader.readexactly(data_len))
+                future = self.pending.pop(response.get('id'), None)
+                if future is None and len(self.pending) > 0:
+                    future = self.pending.popitem(last=False)[1]
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            print('ctrl connection closed: %s' % str(e))
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('ctrl connection closed'))
+            self.pending.clear()
+
+    # 在服务端按顺序执行多个命令，一次往返完成，见IpCameraClient.batch
+    async def batch(self, cmds: list, stop_on_error: bool = False) -> list:
+        if 'batch' not in self.ctrl_features:
+            if not stop_on_error:
+                return list(await asyncio.gather(*[self.request(cmd) for cmd in cmds]))
+            responses = []
+            for cmd in cmds:
+                responses.append(await self.request(cmd))
+                if not responses[-1]['result']:
+                    break
+            return responses
+        response = await self.request({'cmd': 'batch', 'cmds': cmds, 'stop_on_error': stop_on_error})
+        return response.get('responses', [])
+
+    async def get_ctrl_features(self) -> list:
+        response = await self.request({'cmd': 'get_ctrl_features'})
+        if response['result']:
+            self.ctrl_features = response.get('features', [])
+            self.ctrl_encodings = response.get('encodings', ['json'])
+        return self.ctrl_features
+
+    # 控制数据包的编码: 'json' 或 'binary'，服务端不支持时返回False
+    def set_ctrl_encoding(self, encoding: str) -> bool:
+        if encoding not in self.ctrl_encodings:
+            return False
+        self.ctrl_encoding = encoding
+        return True
+
+    # 返回dict, cam_name -> cam_idx
+    async def get_cameras(self, refresh: bool = False) -> dict:
+        response = await self.request({'cmd': 'get_cameras', 'refresh': refresh})
+        return response['cameras'] if response['result'] else {}
+
+    # 参数见IpCameraClient.get_camera_formats
+    async def get_camera_formats(self, cam_name: str, min_width=640, min_fps=30, min_height=0, max_height=10000,
+                                 structured: bool = False, **filters) -> list:
+        cmd = {'cmd': 'get_camera_formats', 'cam_name': cam_name, 'min_width': min_width, 'min_fps': min_fps,
+               'min_height': min_height, 'max_height': max_height, 'structured': structured}
+        cmd.update(filters)
+        response = await self.request(cmd)
+        return response['formats'] if response['result'] else []
+
+    async def set_camera(self, cam_idx, width, height, stream_id: int = 0) -> bool:
+        response = await self.request({'cmd': 'set_camera', 'cam_idx': cam_idx, 'width': width,
+                                       'height': height, 'stream_id': stream_id})
+        return response['result']
+
+    # stream_id为None时启动所有已设置的视频流
+    async def start_capture(self, stream_id=None) -> bool:
+        cmd = {'cmd': 'capture'}
+        if stream_id is not None:
+            cmd['stream_id'] = stream_id
+        return (await self.request(cmd))['result']
+
+    async def stop_capture(self, stream_id=None) -> bool:
+        cmd = {'cmd': 'stop_capture'}
+        if stream_id is not None:
+            cmd['stream_id'] = stream_id
+        return (await self.request(cmd))['result']
+
+    # 与IpCameraClient.subscribe相同，从最高版本开始协商帧头
+    async def subscribe(self, streams=None) -> bool:
+        for protocol in range(PROTOCOL_VERSION, 0, -1):
+            response = await self.request({'cmd': 'subscribe', 'data_port': self.data_port(),
+                                           'protocol': protocol, 'streams': streams})
+            if response['result']:
+                self.protocol = protocol
+                return True
+            if response.get('msg') != 'unsupported protocol':
+                return False
+        return False
+
+    async def unsubscribe(self) -> bool:
+        return (await self.request({'cmd': 'unsubscribe', 'data_port': self.data_port()}))['result']
+
+    # 参数见IpCameraClient.set_codec
+    async def set_codec(self, codec='jpeg', quality=None, subsampling=None, optimize=False, compression=None,
+                        scale=None) -> bool:
+        response = await self.request({'cmd': 'set_codec', 'data_port': self.data_port(), 'codec': codec,
+                                       'quality': quality, 'subsampling': subsampling,
+                                       'optimize': optimize, 'compression': compression, 'scale': scale})
+        return response['result']
+
+    # 见IpCameraClient.set_roi
+    async def set_roi(self, roi=None, scale=None) -> bool:
+        response = await self.request({'cmd': 'set_roi', 'data_port': self.data_port(),
+                                       'roi': None if roi is None else list(roi), 'scale': scale})
+        return response['result']
+
+    # 见IpCameraClient.set_adaptive
+    async def set_adaptive(self, enabled: bool = True, target_latency_ms: float = 200, target_fps=None,
+                           min_quality: int = 30, max_quality: int = 90, quality_step: int = 10,
+                           min_scale: float = 0.5) -> dict:
+        response = await self.request({'cmd': 'set_adaptive', 'data_port': self.data_port(), 'enabled': enabled,
+                                       'target_latency_ms': target_latency_ms, 'target_fps': target_fps,
+                                       'min_quality': min_quality, 'max_quality': max_quality,
+                                       'quality_step': quality_step, 'min_scale': min_scale})
+        return response.get('adaptive') if response['result'] else None
+
+    async def get_adaptive(self) -> dict:
+        response = await self.request({'cmd': 'get_adaptive', 'data_port': self.data_port()})
+        return response.get('adaptive') if response['result'] else None
+
+    # 见IpCameraClient.set_transport，探测共享内存失败时改回'tcp'并返回False
+    async def set_transport(self, transport: str = 'shm') -> bool:
+        response = await self.request({'cmd': 'set_transport', 'data_port': self.data_port(), 'transport': transport})
+        if response['result'] and transport == 'shm' and not self.probe_shm(response):
+            await self.set_transport('tcp')
+            return False
+        return response['result']
+
+    # 见IpCameraClient.probe_shm
+    def probe_shm(self, response: dict) -> bool:
+        if 'shm_probe' not in response:
+            return True
+        try:
+            return self.shm_reader.probe(response['shm_probe'], response['shm_token'])
+        except (OSError, ValueError) as e:
+            print('shm probe err: %s' % str(e))
+            return False
+
+    # 共享内存打不开时丢弃该帧，不结束接收
+    def read_shm(self, payload: bytes):
+        try:
+            return self.shm_reader.read(np.frombuffer(payload, np.uint8))
+        except OSError as e:
+            print('shm attach err: %s' % str(e))
+            return None
+
+    # 见IpCameraClient.get_server_stats
+    async def get_server_stats(self) -> dict:
+        response = await self.request({'cmd': 'get_stats'})
+        if response['result']:
+            return {key: value for key, value in response.items() if key not in ('result', 'id')}
+        return {}
+
+    def get_stats(self) -> dict:
+        result = {}
+        for stream_id, stats in list(self.stats.items()):
+            stream_stats = stats.to_dict()
+            stream_stats['dropped'] = self.dropped.get(stream_id, 0)
+            result[stream_id] = stream_stats
+        return result
+
+    def get_queue(self, stream_id: int) -> asyncio.Queue:
+        queue = self.queues.get(stream_id)
+        if queue is None:
+            queue = asyncio.Queue(self.queue_size + 1)  # 多一个位置留给连接断开的通知
+            if self.closed:
+                queue.put_nowait(None)
+            self.queues[stream_id] = queue
+        return queue
+
+    def close_queues(self):
+        for queue in self.queues.values():
+            while queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def get_stream_stats(self, stream_id: int) -> StageStats:
+        stats = self.stats.get(stream_id)
+        if stats is None:
+            stats = self.stats[stream_id] = StageStats()
+        return stats
+
+    # 解码在线程池中进行，返回图像以及解码耗时
+    @staticmethod
+    def decode(codec: int, payload: bytes):
+        t0 = time.perf_counter()
+        img = decode_payload(codec, np.frombuffer(payload, np.uint8))
+        return img, time.perf_counter() - t0
+
+    # 见IpCameraClient.start_recording
+    def start_recording(self, path, streams=None, segment_bytes: int = 1 << 30) -> FrameRecorder:
+        self.stop_recording()
+        self.recorder = FrameRecorder(path, streams, segment_bytes)
+        return self.recorder
+
+    def stop_recording(self) -> dict:
+        recorder = self.recorder
+        if recorder is None:
+            return {}
+        self.recorder = None
+        recorder.close()
+        return recorder.get_stats()
+
+    @staticmethod
+    def decode_tiles(decoder: TileDecoder, payload: bytes):
+        t0 = time.perf_counter()
+        img = decoder.decode(np.frombuffer(payload, np.uint8))
+        return img, time.perf_counter() - t0
+
+    def get_tile_decoder(self, stream_id: int) -> TileDecoder:
+        decoder = self.tile_decoders.get(stream_id)
+        if decoder is None:
+            decoder = self.tile_decoders[stream_id] = TileDecoder()
+        return decoder
+
+    def get_tile_executor(self) -> ThreadPoolExecutor:
+        if self.tile_executor is None:
+            self.tile_executor = ThreadPoolExecutor(1)
+        return self.tile_executor
+
+    # 接收数据流，每一帧提交到线程池解码，按接收顺序放入对应视频流的队列
+    async def recv_loop(self):
+        loop = asyncio.get_running_loop()
+        readexactly = self.data_reader.readexactly
+        try:
+            while True:
+                info = await read_header_async(readexactly)
+                payload = await readexactly(info.payload_len)
+                info.recv_ts = time.time()
+                if self.recorder is not None:
+                    self.recorder.write(info, payload)
+                stats = self.get_stream_stats(info.stream_id)
+                stats.rate('frames').add()
+                stats.rate('bytes').add(info.payload_len)
+                if info.codec == CODEC_SHM:     # 共享内存中的图像直接映射，不需要解码
+                    future = loop.create_future()
+                    future.set_result((self.read_shm(payload), 0.0))
+                elif info.codec == CODEC_TILES:
+                    # 丢弃该帧时也要完成解码(之后的帧只包含变化的块)，因此不能被取消
+                    future = asyncio.shield(loop.run_in_executor(self.get_tile_executor(), self.decode_tiles,
+                                                                 self.get_tile_decoder(info.stream_id), payload))
+                else:
+                    future = loop.run_in_executor(self.executor, self.decode, info.codec, payload)
+                queue = self.get_queue(info.stream_id)
+                if queue.qsize() >= self.queue_size:    # 读取不及时，丢弃最旧的一帧
+                    queue.get_nowait()[1].cancel()
+                    self.dropped[info.stream_id] = self.dropped.get(info.stream_id, 0) + 1
+                queue.put_nowait((info, future))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print('data connection closed: %s' % str(e))
+        finally:
+            self.closed = True
+            self.close_queues()
+
+    """
+    等待并返回视频流stream_id的下一帧，连接断开时返回None
+    with_info=True时返回(img, info)，info为帧头信息(FrameHeader.FrameInfo)
+    """
+    async def read(self, stream_id: int = 0, with_info: bool = False):
+        queue = self.get_queue(stream_id)
+        stats = self.get_stream_stats(stream_id)
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.put_nowait(None)  # 留给之后的读取者
+                return (None, None) if with_info else None
+            info, future = item
+            img, decode_dur = await future
+            if img is None:     # 解码失败，丢弃该帧
+                continue
+            stats.hist('decode').record(decode_dur)
+            latency = info.latency()
+            if latency is not None:
+                stats.hist('e2e').record(max(latency, 0.0))
+            return (img, info) if with_info else img
+
+    # 异步迭代视频流stream_id的图像帧，连接断开时结束
+    async def frames(self, stream_id: int = 0, with_info: bool = False):
+        while True:
+            item = await self.read(stream_id, True)
+            if item[0] is None:
+                return
+            yield item if with_info else item[0]
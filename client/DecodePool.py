@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
+
+from FrameDecoder import decode_payload
+
+
+"""
+并行解码池：接收线程只负责接收数据，已压缩的数据交给多个解码线程(cv2.imdecode解码时释放GIL，可以真正并行)，
+再由一个交付线程按接收的顺序把解码结果交给publish(info, img, decode_dur)，因此帧的顺序与单线程解码时相同。
+解码或交付跟不上时(等待交付的帧超过max_pending)，丢弃最旧的帧，保证最新的帧优先，不会越积越多。
+必须按顺序处理的帧(共享内存、分块增量)由接收线程自己处理，再通过put_done()按顺序排入，不进入解码线程。
+"""
+class DecodePool:
+    def __init__(self, workers: int, publish, max_pending: int = None) -> None:
+        if workers < 1:
+            raise ValueError('workers must be >= 1')
+        self.workers = workers
+        self.publish = publish
+        # 至少比解码线程数多1，正在解码的帧之外总有可以丢弃的帧
+        self.max_pending = max(max_pending if max_pending is not None else workers * 2, workers + 1)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='decode')
+        self.pending = deque()      # 按接收顺序排列的(info, future)
+        self.cond = threading.Condition()
+        self.skipped = {}           # stream_id -> 因解码跟不上而丢弃的帧数
+        self.closed = False
+        self.thread = threading.Thread(target=self.deliverThread_func, daemon=True)
+        self.thread.start()
+
+    # 解码并计时，在解码线程中执行
+    @staticmethod
+    def decode_func(codec: int, data):
+        t0 = time.perf_counter()
+        img = decode_payload(codec, data)
+        return img, time.perf_counter() - t0
+
+    # 在接收线程中调用，data必须是调用者不再修改的数据(接收缓冲区会被复用，需要先拷贝)
+    def submit(self, info, data):
+        future = self.executor.submit(self.decode_func, info.codec, data)
+        self.append(info, future)
+
+    # 已在接收线程中处理完的帧(img, decode_dur)，与解码池中的帧一起按顺序交付
+    def put_done(self, info, img, decode_dur: float):
+        future = Future()
+        future.set_result((img, decode_dur))
+        self.append(info, future)
+
+    def append(self, info, future: Future):
+        with self.cond:
+            self.pending.append((info, future))
+            if len(self.pending) > self.max_pending:
+                # 从最旧的开始丢弃: 尚未开始解码的取消解码，已解码完但还没交付的不再交付；
+                # 正在解码的帧保留，否则解码跟不上时可能一帧也交付不了
+                for item in list(self.pending):
+                    if len(self.pending) <= self.max_pending:
+                        break
+                    if item[1].running():
+                        continue
+                    item[1].cancel()
+                    self.pending.remove(item)
+                    stream_id = item[0].stream_id
+                    self.skipped[stream_id] = self.skipped.get(stream_id, 0) + 1
+            self.cond.notify()
+
+    def deliverThread_func(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    break
+                item = self.pending[0]
+            try:
+                img, decode_dur = item[1].result()
+            except CancelledError:
+                img, decode_dur = None, None
+            except Exception as e:
+                print('decode err: %s' % str(e))
+                img, decode_dur = None, 0.0
+            with self.cond:
+                if not self.pending or self.pending[0] is not item:    # 等待期间已被丢弃
+                    continue
+                self.pending.popleft()
+            if decode_dur is not None:
+                self.publish(item[0], img, decode_dur)
+
+    def get_skipped(self, stream_id: int) -> int:
+        return self.skipped.get(stream_id, 0)
+
+    # 交付完已接收的帧后停止；wait为False时丢弃尚未解码的帧
+    def close(self, wait: bool = True):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            if not wait:
+                for item in self.pending:
+                    item[1].cancel()
+            self.cond.notify_all()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+
+from WireFormat import CODEC_RAW, RAW_HEADER
+
+# (缩小倍数, 是否灰度) -> cv2.imdecode的flags，jpeg在解码时直接按1/2、1/4、1/8的尺寸输出(DCT缩放)，
+# 比按原尺寸解码后再缩小快数倍
+REDUCE_FLAGS = {(1, False): cv2.IMREAD_COLOR, (2, False): cv2.IMREAD_REDUCED_COLOR_2,
+                (4, False): cv2.IMREAD_REDUCED_COLOR_4, (8, False): cv2.IMREAD_REDUCED_COLOR_8,
+                (1, True): cv2.IMREAD_GRAYSCALE, (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4, (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8}
+FLAG_REDUCE = {flags: key for key, flags in REDUCE_FLAGS.items()}
+
+
+# reduce为1/2/4/8，gray为True时输出单通道灰度图
+def decode_flags(reduce: int = 1, gray: bool = False) -> int:
+    flags = REDUCE_FLAGS.get((reduce, bool(gray)))
+    if flags is None:
+        raise ValueError('reduce must be 1, 2, 4 or 8')
+    return flags
+
+
+# 对已解码的图像做与decode_flags相同的缩小(尺寸向上取整)和灰度转换，返回新的图像
+def reduce_image(img: np.ndarray, reduce: int = 1, gray: bool = False) -> np.ndarray:
+    if gray and img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if reduce > 1:
+        h, w = img.shape[:2]
+        img = cv2.resize(img, ((w + reduce - 1) // reduce, (h + reduce - 1) // reduce), interpolation=cv2.INTER_AREA)
+    return img
+
+
+"""
+按帧头中的codec解码一帧数据，data为一维uint8数组(可以是接收缓冲区的视图)
+返回的图像不引用data的内存，解码失败返回None；flags见decode_flags，raw格式解码后再缩小
+"""
+def decode_payload(codec: int, data: np.ndarray, flags: int = cv2.IMREAD_COLOR):
+    if codec == CODEC_RAW:
+        h, w, c = RAW_HEADER.unpack_from(data, 0)
+        img = data[RAW_HEADER.size:RAW_HEADER.size + h*w*c]
+        img = img.reshape((h, w) if c == 1 else (h, w, c))
+        reduce, gray = FLAG_REDUCE.get(flags, (1, False))
+        if reduce > 1 or gray:
+            return reduce_image(img, reduce, gray)
+        return img.copy()
+    # jpeg/png/webp均由cv2.imdecode根据数据内容识别
+    return cv2.imdecode(data, flags)
@@ -0,0 +1,91 @@
+from WireFormat import MAGIC, HEADER_V1_REST, HEADER_V2_LEN, HEADER_V2_REST, CODEC_JPEG
+
+
+"""
+读取数据流(data_socket)上每一帧的帧头，各版本帧头的格式见WireFormat
+protocol 2的帧头长度字段使新版本的服务端可以在帧头末尾增加字段(帧头最长65535字节)，客户端读取整个帧头并忽略多出的部分。
+"""
+
+PROTOCOL_VERSION = 2                        # 客户端支持的最高版本
+
+
+"""
+帧头信息，protocol 2以下的帧头中没有的字段为None
+recv_ts为客户端收到该帧的时间(time.time())
+"""
+class FrameInfo:
+    def __init__(self, stream_id: int, payload_len: int, codec: int = CODEC_JPEG, version: int = 0) -> None:
+        self.version = version
+        self.stream_id = stream_id
+        self.payload_len = payload_len
+        self.codec = codec
+        self.seq = None
+        self.capture_ts = None
+        self.encode_dur = None      # 秒
+        self.width = None
+        self.height = None
+        self.pixfmt = None
+        self.recv_ts = None
+        self.encoded = False        # 帧数据仍是压缩的(客户端延迟解码)
+
+    # 从采集到收到该帧的时间(秒)，需要服务端与客户端的时钟一致
+    def latency(self):
+        if self.capture_ts is None or self.recv_ts is None:
+            return None
+        return self.recv_ts - self.capture_ts
+
+    def __repr__(self) -> str:
+        return 'FrameInfo(stream=%d, seq=%s, %sx%s, codec=%d, len=%d)' % (
+            self.stream_id, self.seq, self.width, self.height, self.codec, self.payload_len)
+
+
+"""
+帧头解析器(生成器)：每次yield需要的字节数，通过send()传入这些字节，结束时返回FrameInfo
+先读4字节，若以MAGIC开头再按版本读余下的部分。同步的read_header和异步的read_header_async共用该解析器
+"""
+def parse_header():
+    head = yield 4
+    if head[:2] != MAGIC:
+        return FrameInfo(0, int.from_bytes(head, byteorder='big'))
+    version, codec = head[2], head[3]
+    if version == 1:
+        stream_id, payload_len = HEADER_V1_REST.unpack((yield HEADER_V1_REST.size))
+        return FrameInfo(stream_id, payload_len, codec, 1)
+    if version == 2:
+        stream_id, header_len = HEADER_V2_LEN.unpack((yield HEADER_V2_LEN.size))
+        rest_len = header_len - 4 - HEADER_V2_LEN.size
+        if rest_len < HEADER_V2_REST.size:
+            raise ValueError('frame header too short: %d' % header_len)
+        rest = yield rest_len
+        seq, capture_ts, encode_us, width, height, pixfmt, payload_len = HEADER_V2_REST.unpack_from(rest, 0)
+        info = FrameInfo(stream_id, payload_len, codec, 2)
+        info.seq = seq
+        info.capture_ts = capture_ts
+        info.encode_dur = encode_us / 1e6
+        info.width = width
+        info.height = height
+        info.pixfmt = pixfmt
+        return info
+    raise ValueError('unsupported frame header version: %d' % version)
+
+
+# 从buf_recv中读取一个帧头，buf_recv(n)返回接下来的n字节
+def read_header(buf_recv) -> FrameInfo:
+    parser = parse_header()
+    n = next(parser)
+    try:
+        while True:
+            n = parser.send(bytes(buf_recv(n)))
+    except StopIteration as e:
+        return e.value
+
+
+# read_header的异步版本，readexactly为asyncio.StreamReader.readexactly
+async def read_header_async(readexactly) -> FrameInfo:
+    parser = parse_header()
+    n = next(parser)
+    try:
+        while True:
+            n = parser.send(await readexactly(n))
+    except StopIteration as e:
+        return e.value
@@ -0,0 +1,292 @@
+import mmap
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from FrameHeader import FrameInfo
+from WireFormat import CODEC_SHM, CODEC_TILES, SEGMENT_NAME, INDEX_NAME, INDEX_MAGIC, INDEX_HEADER, INDEX_RECORD, INDEX_DTYPE
+from FrameDecoder import decode_payload
+
+
+"""
+录像：把客户端收到的已压缩的数据(不解码、不重新编码)原样追加到分段文件中，同时写一个紧凑的索引
+目录结构:
+    00000.seg, 00001.seg ...    各帧数据依次拼接，单个文件超过segment_bytes后换下一个文件
+                                (jpeg编码时每个分段文件就是一个MJPEG数据流)
+    stream_<id>.idx             每路视频流一个索引: INDEX_HEADER + 每帧一条INDEX_RECORD(格式见WireFormat)
+段号(run): 服务端重新开始采集后帧序号从1重新计数，追加录像时旧协议的本地序号也从1开始，采集时间也可能因时钟调整而回退，
+因此seq和采集时间只在一段之内递增。每次追加录像、以及seq或采集时间不再递增时段号加1(旧的录像中为0)。
+每帧先写数据再写索引，回放时忽略指向不完整数据的索引(录像时进程异常退出)。
+共享内存('shm')和分块增量('tiles')的数据不能单独解码，不录制。
+"""
+
+def segment_path(path: Path, segment: int) -> Path:
+    return path / (SEGMENT_NAME % segment)
+
+
+def index_path(path: Path, stream_id: int) -> Path:
+    return path / (INDEX_NAME % stream_id)
+
+
+"""
+录像器，由IpCameraClient.start_recording()创建并接入接收线程
+write()只拷贝数据并放入队列，由单独的写线程写入文件，不阻塞接收。
+队列满(磁盘跟不上)时丢弃该帧并计入dropped，不影响实时的显示和处理。
+streams为需要录制的视频流编号集合，None表示全部
+"""
+class FrameRecorder:
+    def __init__(self, path, streams=None, segment_bytes: int = 1 << 30, queue_size: int = 256) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.streams = None if streams is None else set(streams)
+        self.segment_bytes = segment_bytes
+        self.queue = queue.Queue(queue_size)
+        self.segment = -1
+        self.segment_file = None
+        self.segment_size = 0
+        self.index_files = {}       # stream_id -> 索引文件
+        self.local_seqs = {}        # stream_id -> 帧头中没有seq(旧协议)时使用的本地序号
+        self.runs = {}              # stream_id -> 当前的段号
+        self.last_frames = {}       # stream_id -> 上一帧的(seq, 采集时间)，用于判断是否开始新的一段
+        self.written = 0
+        self.written_bytes = 0
+        self.dropped = 0
+        self.skipped = 0            # 不能录制的编码格式
+        self.closed = False
+        # 追加到已有的录像
+        while segment_path(self.path, self.segment + 1).exists():
+            self.segment += 1
+        self.thread = threading.Thread(target=self.writeThread_func, daemon=True)
+        self.thread.start()
+
+    # 在接收线程中调用，data为该帧的数据(可以是接收缓冲区的视图，这里会拷贝)
+    def write(self, info: FrameInfo, data):
+        if self.closed or (self.streams is not None and info.stream_id not in self.streams):
+            return
+        if info.codec in (CODEC_SHM, CODEC_TILES):
+            self.skipped += 1
+            return
+        try:
+            self.queue.put_nowait((info, bytes(data)))
+        except queue.Full:
+            self.dropped += 1
+
+    def open_segment(self):
+        if self.segment_file is not None:
+            self.segment_file.close()
+        self.segment += 1
+        self.segment_file = open(segment_path(self.path, self.segment), 'ab')
+        self.segment_size = self.segment_file.tell()
+
+    def get_index_file(self, stream_id: int):
+        f = self.index_files.get(stream_id)
+        if f is None:
+            p = index_path(self.path, stream_id)
+            f = open(p, 'ab')
+            if f.tell() == 0:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, 1, INDEX_RECORD.size))
+                self.runs[stream_id] = 0
+            else:   # 追加录像，从已有录像最后一帧的段号加1开始
+                self.runs[stream_id] = (self.read_last_run(p) + 1) & 0xffff
+            self.index_files[stream_id] = f
+        return f
+
+    # 已有索引中最后一条完整记录的段号，没有记录时为-1
+    @staticmethod
+    def read_last_run(p: Path) -> int:
+        count = (os.path.getsize(p) - INDEX_HEADER.size) // INDEX_RECORD.size
+        if count <= 0:
+            return -1
+        with open(p, 'rb') as f:
+            f.seek(INDEX_HEADER.size + (count - 1) * INDEX_RECORD.size)
+            return INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[-1]
+
+    def append(self, info: FrameInfo, data: bytes):
+        if self.segment_file is None or (self.segment_size > 0 and self.segment_size + len(data) > self.segment_bytes):
+            self.open_segment()
+        offset = self.segment_size
+        self.segment_file.write(data)
+        self.segment_size += len(data)
+        seq = info.seq
+        if seq is None:
+            seq = self.local_seqs.get(info.stream_id, 0) + 1
+        self.local_seqs[info.stream_id] = seq
+        capture_ts = info.capture_ts if info.capture_ts is not None else info.recv_ts
+        index_file = self.get_index_file(info.stream_id)
+        last = self.last_frames.get(info.stream_id)
+        if last is not None and (seq <= last[0] or capture_ts < last[1]):   # 服务端重新开始采集或时钟回退
+            self.runs[info.stream_id] = (self.runs[info.stream_id] + 1) & 0xffff
+        self.last_frames[info.stream_id] = (seq, capture_ts)
+        index_file.write(INDEX_RECORD.pack(
+            seq, capture_ts, info.recv_ts or 0.0, offset, len(data), self.segment,
+            info.width or 0, info.height or 0, info.codec, info.pixfmt or 0, self.runs[info.stream_id]))
+        self.written += 1
+        self.written_bytes += len(data)
+
+    def flush(self):
+        if self.segment_file is not None:
+            self.segment_file.flush()
+        for f in self.index_files.values():     # 先写数据再写索引
+            f.flush()
+
+    def writeThread_func(self):
+        last_flush = time.monotonic()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.append(*item)
+            if self.queue.empty() or time.monotonic() - last_flush > 1.0:
+                self.flush()
+                last_flush = time.monotonic()
+        self.flush()
+        if self.segment_file is not None:
+            self.segment_file.close()
+        for f in self.index_files.values():
+            f.close()
+
+    def get_stats(self) -> dict:
+        return {'path': str(self.path), 'written': self.written, 'bytes': self.written_bytes,
+                'dropped': self.dropped, 'skipped': self.skipped, 'queue': self.queue.qsize(),
+                'segment': self.segment}
+
+    # 写完队列中的帧后关闭文件
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+
+"""
+回放FrameRecorder录制的一路视频流
+分段文件和索引都通过mmap映射，打开时不扫描数据，只在索引中找出各段的边界(段号变化、或seq/采集时间不再递增的位置)；
+按帧号直接定位，按时间或seq在各段之内二分查找(O(段数 * log n))。
+read()返回的数据是映射内存的只读视图，不拷贝，关闭回放器后不能再使用。
+
+    player = FramePlayer('record_dir', stream_id=0)
+    i = player.find_time(ts)
+    info, data = player.read(i)
+    img = player.decode(i)
+"""
+class FramePlayer:
+    def __init__(self, path, stream_id: int = 0) -> None:
+        self.path = Path(path)
+        self.stream_id = stream_id
+        self.segments = {}          # 分段序号 -> mmap
+        self.segment_files = {}
+        p = index_path(self.path, stream_id)
+        with open(p, 'rb') as f:
+            magic, version, record_size = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+        if magic != INDEX_MAGIC or record_size != INDEX_RECORD.size:
+            raise ValueError('not a recording index: %s' % p)
+        count = (os.path.getsize(p) - INDEX_HEADER.size) // INDEX_RECORD.size
+        if count > 0:
+            self.index = np.memmap(p, INDEX_DTYPE, 'r', INDEX_HEADER.size, (count,))
+        else:
+            self.index = np.zeros(0, INDEX_DTYPE)
+        # 去掉末尾指向不完整数据的记录(只检查最后几条，数据先于索引写入)
+        while len(self.index) > 0:
+            last = self.index[-1]
+            seg = segment_path(self.path, int(last['segment']))
+            if seg.exists() and int(last['offset']) + int(last['length']) <= os.path.getsize(seg):
+                break
+            self.index = self.index[:-1]
+        self.run_starts = self.find_runs(self.index)
+
+    # 各段的起始帧号；旧的录像中没有段号，同样按seq或采集时间回退的位置分段
+    @staticmethod
+    def find_runs(index: np.ndarray) -> np.ndarray:
+        if len(index) == 0:
+            return np.zeros(0, np.int64)
+        run, seq, ts = index['run'], index['seq'], index['capture_ts']
+        breaks = (run[1:] != run[:-1]) | (seq[1:] <= seq[:-1]) | (ts[1:] < ts[:-1])
+        return np.concatenate(([0], np.flatnonzero(breaks) + 1))
+
+    # 各段的帧号范围[(start, stop), ...]，按录制的顺序
+    def runs(self) -> list:
+        stops = list(self.run_starts[1:]) + [len(self.index)]
+        return [(int(start), int(stop)) for start, stop in zip(self.run_starts, stops)]
+
+    # 在第run段(None表示依次在各段)中二分查找第一个field不小于value的帧
+    def search(self, field: str, value, run=None) -> int:
+        runs = self.runs()
+        for start, stop in (runs if run is None else [runs[run]]):
+            i = start + int(np.searchsorted(self.index[field][start:stop], value, 'left'))
+            if i < stop:
+                return i
+        return len(self)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get_segment(self, segment: int) -> mmap.mmap:
+        mm = self.segments.get(segment)
+        if mm is None:
+            f = open(segment_path(self.path, segment), 'rb')
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.segment_files[segment] = f
+            self.segments[segment] = mm
+        return mm
+
+    """
+    采集时间不早于ts的第一帧的帧号，run为段的序号(见runs())，None时按录制顺序在各段中查找，
+    返回第一个有这样的帧的段中的结果；找不到时返回len(self)
+    """
+    def find_time(self, ts: float, run=None) -> int:
+        return self.search('capture_ts', ts, run)
+
+    # 服务端帧序号不小于seq的第一帧的帧号，run的含义同find_time (seq只在一段之内唯一)
+    def find_seq(self, seq: int, run=None) -> int:
+        return self.search('seq', seq, run)
+
+    def info(self, i: int) -> FrameInfo:
+        rec = self.index[i]
+        info = FrameInfo(self.stream_id, int(rec['length']), int(rec['codec']), 2)
+        info.seq = int(rec['seq'])
+        info.capture_ts = float(rec['capture_ts'])
+        info.recv_ts = float(rec['recv_ts'])
+        info.width = int(rec['width'])
+        info.height = int(rec['height'])
+        info.pixfmt = int(rec['pixfmt'])
+        return info
+
+    # 返回(info, data)，data为该帧数据的一维uint8数组(映射内存的视图)
+    def read(self, i: int) -> tuple:
+        rec = self.index[i]
+        mm = self.get_segment(int(rec['segment']))
+        offset, length = int(rec['offset']), int(rec['length'])
+        return self.info(i), np.frombuffer(mm, np.uint8, length, offset)
+
+    def decode(self, i: int):
+        info, data = self.read(i)
+        return decode_payload(info.codec, data)
+
+    # 依次返回[start, stop)的(info, data)
+    def frames(self, start: int = 0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(start, stop):
+            yield self.read(i)
+
+    def duration(self) -> float:
+        if len(self.index) < 2:
+            return 0.0
+        return float(self.index[-1]['capture_ts'] - self.index[0]['capture_ts'])
+
+    def close(self):
+        self.index = np.zeros(0, INDEX_DTYPE)
+        self.run_starts = np.zeros(0, np.int64)
+        for mm in self.segments.values():
+            try:
+                mm.close()
+            except BufferError:     # 仍有read()返回的视图在使用，由垃圾回收释放
+                pass
+        for f in self.segment_files.values():
+            f.close()
+        self.segments = {}
+        self.segment_files = {}
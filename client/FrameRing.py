@@ -0,0 +1,66 @@
+import threading
+import numpy as np
+
+
+"""
+固定容量的图像帧环形缓冲区，每一帧带有单调递增的序号(从1开始)以及帧头信息(FrameInfo)。
+写入端(接收线程)把新解码出的帧直接移交给槽位，不做拷贝，并将其设为只读；
+读取端拿到的是只读视图，需要修改图像时由读取端自行拷贝一次。
+最新帧以(seq, frame, info)元组整体赋值，读取最新帧不需要加锁；只有阻塞等待新帧时才用到条件变量。
+"""
+class FrameRing:
+    def __init__(self, capacity: int = 4) -> None:
+        if capacity < 1:
+            raise ValueError('capacity must be >= 1')
+        self.capacity = capacity
+        self.slots = [(0, None, None)] * capacity   # 预分配的槽位, 每个元素为(seq, frame, info)
+        self.latest = (0, None, None)               # 最新的一帧
+        self.cond = threading.Condition()
+        self.closed = False
+
+    # 写入一帧，返回其序号
+    def publish(self, frame: np.ndarray, info=None) -> int:
+        frame.flags.writeable = False
+        with self.cond:
+            seq = self.latest[0] + 1
+            item = (seq, frame, info)
+            self.slots[seq % self.capacity] = item
+            self.latest = item
+            self.cond.notify_all()
+        return seq
+
+    # 关闭缓冲区，唤醒所有等待中的读取者
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def last_seq(self) -> int:
+        return self.latest[0]
+
+    # 返回最新的一帧(seq, frame, info)，没有帧时frame为None
+    def read_latest(self) -> tuple:
+        return self.latest
+
+    # 返回序号为seq的(seq, frame, info)，若该帧已被覆盖或尚未到达则返回None
+    def read_seq(self, seq: int):
+        item = self.slots[seq % self.capacity]
+        if item[0] != seq:
+            return None
+        return item
+
+    """
+    阻塞等待序号大于seq的帧，返回最新的(seq, frame, info)
+    超时或缓冲区被关闭时返回(seq, None, None)
+    """
+    def wait_newer(self, seq: int, timeout=None) -> tuple:
+        item = self.latest
+        if item[0] > seq:
+            return item
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.latest[0] > seq or self.closed, timeout):
+                return (seq, None, None)
+            item = self.latest
+        if item[0] > seq:
+            return item
+        return (seq, None, None)
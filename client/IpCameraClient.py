@@ -5,24 +5,49 @@ import time
 import socket
 import json
 import threading
-import copy
+import itertools
 
+from RecvBuffer import RecvBuffer
+from FrameRing import FrameRing
+from FrameHeader import read_header, PROTOCOL_VERSION
+from FrameDecoder import decode_payload, decode_flags, reduce_image
+from ShmFrameReader import ShmFrameReader
+from StageStats import StageStats
+from Undistorter import Undistorter
+from TileDecoder import TileDecoder
+from FrameRecorder import FrameRecorder
+from DecodePool import DecodePool
+from WireFormat import encode_message, decode_message, CODEC_SHM, CODEC_TILES
 
 """
 用于wsl的网络相机客户端，初始化完成后，可以像OpenCV一样使用read()函数读取图像帧
+服务端可以同时打开多个相机，每个相机为一路视频流(stream_id)，通过read(stream_id)分别读取
+decode_workers > 0时由DecodePool的多个线程并行解码(高分辨率的MJPEG单线程解码跟不上时)，帧的顺序不变；
+为0时在接收线程中解码
+lazy_decode=True时接收线程不解码，FrameRing中保存压缩的数据，在read()等读取时才解码，从未被读取的帧不消耗解码的CPU，
+适合读取频率远低于相机帧率的使用者(此时不使用解码池)；read(reduce=4, gray=True)等直接按缩小的尺寸解码
 """
 
-
-lock = threading.Lock()
-
 class IpCameraClient:
-    def __init__(self) -> None:
+    def __init__(self, ring_capacity: int = 4, decode_workers: int = 0, lazy_decode: bool = False) -> None:
         self.dataThread = None      # 该线程用于不断地接收来自远端的相机图像数据
         self.handleThread = None    # 当有新图像时，调用处理函数
         self.exitFlag = False
         self.handler = None
-        self.hasNewImg = False
-        self.cur_cvImg = np.array([])   # 判断是否有效：shape==(0,)
+        self.handler_stream = 0     # handler处理的视频流
+        self.ring_capacity = ring_capacity
+        self.rings = {}             # stream_id -> FrameRing, 接收到的图像帧
+        self.read_seq_nos = {}      # stream_id -> read()最后返回的帧序号
+        self.server_seqs = {}       # stream_id -> 最后收到的服务端帧序号(protocol 2)
+        self.dropped = {}           # stream_id -> 根据服务端帧序号统计的丢帧数
+        self.protocol = 0           # 与服务端协商的帧头版本
+        self.stats = {}             # stream_id -> StageStats, 各阶段的耗时和速率
+        self.rings_lock = threading.Lock()
+        self.ctrl_lock = threading.Lock()   # 控制连接上一次完整的请求/应答交换
+        self.req_ids = itertools.count(1)   # 控制命令的请求ID
+        self.ctrl_features = []             # 服务端控制协议支持的功能(id/batch/pipelining)
+        self.ctrl_encodings = ['json']      # 服务端支持的控制数据包编码
+        self.ctrl_encoding = 'json'
         # 创建 socket 对象
         self.data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.ctrl_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -33,9 +58,20 @@ class IpCameraClient:
         self.data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024*1024)
         self.recv_bufsize = self.data_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
         print(self.recv_bufsize)
+        self.recv_buf = RecvBuffer(self.recv_bufsize)   # 可复用的接收缓冲区
+        self.shm_reader = ShmFrameReader()              # 共享内存传输
+        self.tile_decoders = {}                         # stream_id -> TileDecoder, 分块增量传输
+        self.decode_workers = decode_workers
+        self.decode_pool = None                         # DecodePool, 并行解码
+        self.lazy_decode = lazy_decode
 
         self.matrix = np.array([])
         self.distortion = np.array([])
+        self.undistorter = None     # 载入相机校正参数后创建，缓存各分辨率的映射表
+        self.undist_bufs = {}       # stream_id -> read()中预先分配并复用的校正输出图像
+        self.recorder = None        # FrameRecorder, 录制收到的原始数据
+        self.batch_buf = None       # read_batch()复用的(key, 批数组)
+        self.batch_scratch = None   # read_batch()转换为float时复用的uint8图像
 
         self.cam_idx = 0
         self.width = 1280
@@ -52,6 +88,10 @@ class IpCameraClient:
             self.ctrl_socket.connect((ip, port+1))
             self.data_socket.settimeout(99999.0)        # 
             self.ctrl_socket.settimeout(99999.0)
+            self.get_ctrl_features()
+            self.subscribe()    # 使用带stream_id的帧头，旧版本的服务端会忽略该命令
+            if self.decode_workers > 0 and not self.lazy_decode:
+                self.decode_pool = DecodePool(self.decode_workers, self.publish_frame)
             self.dataThread = threading.Thread(target=self.dataThread_func)
             self.dataThread.start()
             self.mode = mode
@@ -63,44 +103,141 @@ class IpCameraClient:
             return False
  
     def disconnect(self):
-        self.data_socket.close()
-        self.ctrl_socket.close()
         self.exitFlag = True
-        if self.dataThread is not None and self.dataThread.is_alive():
+        # 先shutdown唤醒阻塞在recv中的接收线程，等它退出后再关闭socket，不在已关闭的socket上recv(EBADF)
+        for sock in (self.data_socket, self.ctrl_socket):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:     # 未连接或已断开
+                pass
+        self.close_rings()
+        if self.dataThread is not None and self.dataThread.is_alive() \
+                and self.dataThread is not threading.current_thread():
             self.dataThread.join()
+        self.data_socket.close()
+        self.ctrl_socket.close()
+        if self.handleThread is not None and self.handleThread.is_alive() \
+                and self.handleThread is not threading.current_thread():
+            self.handleThread.join()
+
+    """
+    发送多个控制命令，不等待应答就连续发送(流水线)，再按请求ID匹配应答，返回与cmds顺序一致的应答列表
+    多个命令只需要一次往返；旧版本的服务端不返回ID，按顺序匹配
+    """
+    def request_many(self, cmds: list) -> list:
+        with self.ctrl_lock:
+            ids = []
+            packets = bytearray()
+            for cmd in cmds:
+                cmd = dict(cmd)
+                cmd['id'] = next(self.req_ids)
+                ids.append(cmd['id'])
+                send_data = encode_message(cmd, self.ctrl_encoding)
+                packets += send_data.__len__().to_bytes(4, byteorder='big') + send_data
+            self.ctrl_socket.sendall(packets)
+            responses = {}
+            for req_id in ids:
+                response = self.recv_ctrl_pack(self.ctrl_socket)
+                responses[response.get('id', req_id)] = response
+        return [responses.get(req_id, {'result': False, 'msg': 'no response'}) for req_id in ids]
+
+    def request(self, cmd: dict) -> dict:
+        return self.request_many([cmd])[0]
+
+    """
+    在服务端按顺序执行多个命令，一次往返完成，返回各命令的应答列表，例如:
+        client.batch([{'cmd': 'set_camera', 'cam_idx': 0, 'width': 1280, 'height': 960, 'stream_id': 0},
+                      {'cmd': 'set_camera', 'cam_idx': 1, 'width': 1280, 'height': 960, 'stream_id': 1},
+                      {'cmd': 'capture'}])
+    stop_on_error为True时遇到失败的命令即停止。服务端不支持batch命令时改为流水线发送
+    """
+    def batch(self, cmds: list, stop_on_error: bool = False) -> list:
+        if 'batch' not in self.ctrl_features:
+            if not stop_on_error:
+                return self.request_many(cmds)
+            responses = []
+            for cmd in cmds:    # 需要根据结果决定是否继续，只能逐个发送
+                responses.append(self.request(cmd))
+                if not responses[-1]['result']:
+                    break
+            return responses
+        response = self.request({'cmd': 'batch', 'cmds': cmds, 'stop_on_error': stop_on_error})
+        print(response)
+        return response.get('responses', [])
+
+    # 查询服务端控制协议支持的功能，旧版本的服务端不认识该命令，此时只使用json
+    def get_ctrl_features(self) -> list:
+        response = self.request({'cmd': 'get_ctrl_features'})
+        if response['result']:
+            self.ctrl_features = response.get('features', [])
+            self.ctrl_encodings = response.get('encodings', ['json'])
+        return self.ctrl_features
+
+    # 控制数据包的编码: 'json' 或 'binary'(紧凑的二进制编码，见WireFormat)，服务端不支持时返回False
+    def set_ctrl_encoding(self, encoding: str) -> bool:
+        if encoding not in self.ctrl_encodings:
+            return False
+        with self.ctrl_lock:
+            self.ctrl_encoding = encoding
+        return True
 
-    # 返回dict, cam_name -> cam_idx
-    def get_cameras(self) ->dict:
+    # 返回dict, cam_name -> cam_idx; refresh为True时服务端重新枚举相机
+    def get_cameras(self, refresh: bool = False) ->dict:
         cmd = {'cmd':'get_cameras'}
-        self.send_ctrl_pack(self.ctrl_socket, cmd)
-        response = self.recv_ctrl_pack(self.ctrl_socket)
+        if refresh:
+            cmd['refresh'] = True
+        response = self.request(cmd)
         print(response)
         if response['result']:
             return response['cameras']
         else:
             return {}
 
-    def set_camera(self, cam_idx, width, height)->bool:
-        cam_info = {'cmd':'set_camera', 'cam_idx': cam_idx, 'width': width, 'height': height}
-        self.send_ctrl_pack(self.ctrl_socket, cam_info)
-        response = self.recv_ctrl_pack(self.ctrl_socket)
+    # 设置视频流stream_id使用的相机及其分辨率
+    def set_camera(self, cam_idx, width, height, stream_id: int = 0)->bool:
+        cam_info = {'cmd':'set_camera', 'cam_idx': cam_idx, 'width': width, 'height': height, 'stream_id': stream_id}
+        response = self.request(cam_info)
         print(response)
         return response['result']
 
-    def get_camera_formats(self, cam_name:str, min_width=640, min_fps = 30, min_height=0, max_height=10000) ->list:
+    # structured为True时返回dict的列表(name/width/height/fps/max_fps/pixel_format)，否则返回格式字串
+    def get_camera_formats(self, cam_name:str, min_width=640, min_fps = 30, min_height=0, max_height=10000,
+                           structured: bool = False, **filters) ->list:
         cmd = {'cmd': 'get_camera_formats', 'cam_name': cam_name, 'min_width':min_width, 'min_fps': min_fps, 'min_height':min_height, 'max_height': max_height}
-        self.send_ctrl_pack(self.ctrl_socket, cmd)
-        response = self.recv_ctrl_pack(self.ctrl_socket)
+        cmd.update(filters)     # max_width, max_fps, pixel_format
+        if structured:
+            cmd['structured'] = True
+        response = self.request(cmd)
         print(response)
         if response['result']:
             return response['formats']
         else:
             return []
 
-    # 载入相机校正参数, 目前仅用于'cv'模式
-    def load_undist_params(self, filePathStr):
+    """
+    开始录像: 把收到的已压缩数据原样写入path目录(分段文件 + 索引)，不解码也不重新编码，
+    用FrameRecorder.FramePlayer回放。streams为需要录制的视频流编号列表，None表示全部
+    """
+    def start_recording(self, path, streams=None, segment_bytes: int = 1 << 30) -> FrameRecorder:
+        self.stop_recording()
+        self.recorder = FrameRecorder(path, streams, segment_bytes)
+        return self.recorder
+
+    # 停止录像，写完缓存的帧后返回录像的统计(写入的帧数、字节数、因磁盘跟不上而丢弃的帧数)
+    def stop_recording(self) -> dict:
+        recorder = self.recorder
+        if recorder is None:
+            return {}
+        self.recorder = None
+        recorder.close()
+        return recorder.get_stats()
+
+    # 载入相机校正参数, 目前仅用于'cv'模式; alpha见Undistorter，为None时与cv2.undistort的结果相同
+    def load_undist_params(self, filePathStr, alpha=None):
         self.matrix = np.array([])
         self.distortion = np.array([])
+        self.undistorter = None
+        self.undist_bufs = {}
         with open(str(filePathStr), 'r') as f:
             params = json.load(f)
         if len(params)==0:
@@ -120,115 +257,468 @@ class IpCameraClient:
             self.matrix = np.array([])
             self.distortion = np.array([])
             return False
+        self.undistorter = Undistorter(self.matrix, self.distortion, alpha)
         return True
 
-    def set_handler(self, handler):
+    def set_handler(self, handler, stream_id: int = 0):
         self.handler = handler
+        self.handler_stream = stream_id
 
-    def start_capture(self)->bool:
+    # stream_id为None时启动所有已设置的视频流
+    def start_capture(self, stream_id=None)->bool:
         cmd={'cmd': 'capture'}
-        self.send_ctrl_pack(self.ctrl_socket, cmd)
-        response = self.recv_ctrl_pack(self.ctrl_socket)
+        if stream_id is not None:
+            cmd['stream_id'] = stream_id
+        response = self.request(cmd)
         print(response)
         return response['result']
     
-    def stop_capture(self)->bool:
+    def stop_capture(self, stream_id=None)->bool:
         cmd={'cmd': 'stop_capture'}
-        self.send_ctrl_pack(self.ctrl_socket, cmd)
-        response = self.recv_ctrl_pack(self.ctrl_socket)
+        if stream_id is not None:
+            cmd['stream_id'] = stream_id
+        response = self.request(cmd)
         print(response)
         return response['result']       
 
-    def get_last_cvImg(self):
-        lock.acquire()
-        cvImg =  copy.deepcopy(self.cur_cvImg)
-        lock.release()
+    """
+    服务端可以有多个数据流订阅者(如录像、视觉处理和预览)，每一帧只编码一次后分发给所有订阅者。
+    新建立的数据连接默认接收图像，unsubscribe()暂停接收，subscribe()恢复接收
+    streams为需要接收的视频流编号列表，None表示全部
+    """
+    def subscribe(self, streams=None)->bool:
+        # 从客户端支持的最高版本开始协商帧头，服务端不支持时降低版本
+        for protocol in range(PROTOCOL_VERSION, 0, -1):
+            cmd = {'cmd': 'subscribe', 'data_port': self.data_socket.getsockname()[1],
+                   'protocol': protocol, 'streams': streams}
+            response = self.request(cmd)
+            print(response)
+            if response['result']:
+                self.protocol = protocol
+                return True
+            if response.get('msg') != 'unsupported protocol':
+                return False
+        return False
+
+    """
+    设置本连接使用的编码参数，同一台机器上可以使用'raw'省去编码和解码，远程连接可以降低jpeg的quality
+        codec: 'jpeg' | 'png' | 'webp' | 'raw'
+               | 'tiles'(只传输变化的图像块，基本静止的场景可以大幅减少带宽和解码耗时)
+        quality: jpeg/webp/tiles的质量(1~100); subsampling: jpeg色度采样'444'/'422'/'420'
+        optimize: jpeg优化霍夫曼表; compression: png压缩级别(0~9)
+        scale: 服务端缩小图像的比例(0~1]，None表示原尺寸
+    """
+    def set_codec(self, codec='jpeg', quality=None, subsampling=None, optimize=False, compression=None,
+                  scale=None)->bool:
+        cmd = {'cmd': 'set_codec', 'data_port': self.data_socket.getsockname()[1], 'codec': codec,
+               'quality': quality, 'subsampling': subsampling, 'optimize': optimize, 'compression': compression,
+               'scale': scale}
+        response = self.request(cmd)
+        print(response)
+        return response['result']
+
+    """
+    只接收采集图像中的roi=(x, y, 宽, 高)区域(None为整幅图像)，并由服务端按scale(0~1]缩小，
+    在服务端编码之前完成，编码耗时、传输量和解码耗时都相应减少，不需要重新打开相机，下一帧即生效。
+    只需要局部区域或低分辨率预览的使用者(如视觉处理)不必再接收整幅图像后自己裁剪或缩放
+    """
+    def set_roi(self, roi=None, scale=None)->bool:
+        cmd = {'cmd': 'set_roi', 'data_port': self.data_socket.getsockname()[1],
+               'roi': None if roi is None else list(roi), 'scale': scale}
+        response = self.request(cmd)
+        print(response)
+        return response['result']
+
+    """
+    由服务端根据发送的背压自动调整本连接的jpeg/webp质量以及图像尺寸(先降质量，再缩小尺寸)，
+    使从采集到发送完成的延迟保持在target_latency_ms以内(以及帧率不低于target_fps)，带宽恢复后逐级回升。
+    以set_codec设置的编码参数为基础，再次调用set_codec停止自适应控制。
+    返回当前的工作点(quality/scale等)，失败时返回None；收到的图像尺寸以read(with_info=True)的info为准
+    """
+    def set_adaptive(self, enabled: bool = True, target_latency_ms: float = 200, target_fps=None,
+                     min_quality: int = 30, max_quality: int = 90, quality_step: int = 10,
+                     min_scale: float = 0.5) -> dict:
+        cmd = {'cmd': 'set_adaptive', 'data_port': self.data_socket.getsockname()[1], 'enabled': enabled,
+               'target_latency_ms': target_latency_ms, 'target_fps': target_fps,
+               'min_quality': min_quality, 'max_quality': max_quality, 'quality_step': quality_step,
+               'min_scale': min_scale}
+        response = self.request(cmd)
+        print(response)
+        return response.get('adaptive') if response['result'] else None
+
+    # 自适应控制当前的工作点，以及服务端测量的帧率和延迟
+    def get_adaptive(self) -> dict:
+        response = self.request({'cmd': 'get_adaptive', 'data_port': self.data_socket.getsockname()[1]})
+        return response.get('adaptive') if response['result'] else None
+
+    """
+    设置图像的传输方式: 'tcp'(默认) 或 'shm'
+    'shm'仅用于与服务端在同一台机器上的客户端: 图像不压缩，写入共享内存，数据流中只传输槽位通知。
+    此时read()返回的是共享内存的只读视图，服务端写满一圈槽位后会被覆盖，需要长期保存时请拷贝。
+    设置'shm'后先打开应答中的探测共享内存，打不开(例如WSL的mirrored网络下连接Windows的服务端，
+    地址是回环地址但不共享内存)时改回'tcp'并返回False
+    """
+    def set_transport(self, transport: str = 'shm')->bool:
+        cmd = {'cmd': 'set_transport', 'data_port': self.data_socket.getsockname()[1], 'transport': transport}
+        response = self.request(cmd)
+        print(response)
+        if response['result'] and transport == 'shm' and not self.probe_shm(response):
+            self.set_transport('tcp')
+            return False
+        return response['result']
+
+    def probe_shm(self, response: dict) -> bool:
+        if 'shm_probe' not in response:     # 旧版本的服务端
+            return True
+        try:
+            return self.shm_reader.probe(response['shm_probe'], response['shm_token'])
+        except (OSError, ValueError) as e:
+            print('shm probe err: %s' % str(e))
+            return False
+
+    def unsubscribe(self)->bool:
+        cmd = {'cmd': 'unsubscribe', 'data_port': self.data_socket.getsockname()[1]}
+        response = self.request(cmd)
+        print(response)
+        return response['result']
+
+    # 返回视频流对应的FrameRing，不存在时创建
+    def get_ring(self, stream_id: int) -> FrameRing:
+        ring = self.rings.get(stream_id)
+        if ring is None:
+            with self.rings_lock:
+                ring = self.rings.get(stream_id)
+                if ring is None:
+                    ring = FrameRing(self.ring_capacity)
+                    if self.exitFlag:
+                        ring.close()
+                    self.rings[stream_id] = ring
+        return ring
+
+    def close_rings(self):
+        with self.rings_lock:
+            for ring in self.rings.values():
+                ring.close()
+
+    """
+    把FrameRing中的一帧转换为图像: 延迟解码的帧在这里按reduce/gray解码(见FrameDecoder.decode_flags)，
+    已解码的帧在需要时缩小或转为灰度。不需要转换时返回FrameRing中的只读图像本身，解码失败返回None
+    """
+    def decode_item(self, frame, info, reduce: int = 1, gray: bool = False):
+        if frame is None:
+            return None
+        if info is not None and info.encoded:
+            t0 = time.perf_counter()
+            img = decode_payload(info.codec, frame, decode_flags(reduce, gray))
+            self.get_stream_stats(info.stream_id).hist('decode').record(time.perf_counter() - t0)
+            return img
+        if reduce > 1 or gray:
+            return reduce_image(frame, reduce, gray)
+        return frame
+
+    # 返回最新的一帧(只读)，若还没有图像则返回shape==(0,)的数组
+    def get_last_cvImg(self, stream_id: int = 0):
+        _, cvImg, info = self.get_ring(stream_id).read_latest()
+        cvImg = self.decode_item(cvImg, info)
+        if cvImg is None:
+            return np.array([])
         return cvImg
-    
-    # 用于OpenCV阻塞式读取图像帧
-    def read(self):
-        while not self.exitFlag:
-            if self.hasNewImg:
-                lock.acquire()
-                cvImg =  copy.deepcopy(self.cur_cvImg)
-                if self.matrix.shape==(3,3):
-                    cvImg = cv2.undistort(cvImg, self.matrix, self.distortion)
-                lock.release()
-                return cvImg
-            time.sleep(0.02)
+
+    # 返回最新的(seq, frame, info)，不阻塞, info为帧头信息(FrameHeader.FrameInfo)
+    def read_latest(self, stream_id: int = 0, reduce: int = 1, gray: bool = False) -> tuple:
+        seq, frame, info = self.get_ring(stream_id).read_latest()
+        return seq, self.decode_item(frame, info, reduce, gray), info
+
+    # 返回序号为seq的帧，已被覆盖时返回None; with_info=True时返回(frame, info)
+    def read_seq(self, seq: int, stream_id: int = 0, with_info: bool = False, reduce: int = 1, gray: bool = False):
+        item = self.get_ring(stream_id).read_seq(seq)
+        if item is None:
+            return None
+        img = self.decode_item(item[1], item[2], reduce, gray)
+        return (img, item[2]) if with_info else img
+
+    # 根据服务端帧序号统计的丢帧数(服务端丢弃的以及未及时发送的)，需要protocol 2
+    def get_dropped(self, stream_id: int = 0) -> int:
+        return self.dropped.get(stream_id, 0)
+
+    def get_stream_stats(self, stream_id: int) -> StageStats:
+        stats = self.stats.get(stream_id)
+        if stats is None:
+            stats = self.stats.setdefault(stream_id, StageStats())
+        return stats
+
+    """
+    客户端各阶段的统计，按视频流返回dict: stream_id -> {'latency': {...}, 'rate': {...}, 'dropped': n}
+    latency中: recv为接收帧头之后的数据传输耗时，decode为解码耗时(并行解码时为单帧在解码线程中的耗时)，undistort为read()中的校正耗时，
+    handler为处理函数的耗时，e2e为服务端采集到客户端接收完成的延迟(需要protocol 2，且两端时钟一致)
+    rate中: frames为接收的帧率，bytes为接收的字节率
+    decode_skipped为并行解码跟不上时丢弃的帧数(只在decode_workers > 0时有)
+    """
+    def get_stats(self) -> dict:
+        result = {}
+        for stream_id, stats in list(self.stats.items()):
+            stream_stats = stats.to_dict()
+            stream_stats['dropped'] = self.get_dropped(stream_id)
+            if self.decode_pool is not None:
+                stream_stats['decode_skipped'] = self.decode_pool.get_skipped(stream_id)
+            result[stream_id] = stream_stats
+        return result
+
+    """
+    服务端的统计，返回get_stats应答中除result和id以外的全部内容: streams为各视频流的采集/编码耗时、队列深度、丢帧数，
+    subscribers为各订阅者的发送耗时和速率，capture_pool为相机池的状态；服务端之后增加的统计也原样返回
+    """
+    def get_server_stats(self) -> dict:
+        response = self.request({'cmd': 'get_stats'})
+        if response['result']:
+            return {key: value for key, value in response.items() if key not in ('result', 'id')}
+        return {}
+
+    """
+    用于OpenCV阻塞式读取图像帧, 每次返回比上一次更新的一帧，超时或断开时返回None
+    返回的图像为只读视图，需要修改图像时设置copy=True(仅拷贝一次)；载入了校正参数时返回的是该视频流复用的校正输出图像，
+    下一次read()时被覆盖，需要长期持有时同样设置copy=True
+    with_info=True时返回(img, info)，info中有服务端的帧序号、采集时间、编码耗时、尺寸和编码格式(原尺寸)
+    reduce为2/4/8时返回缩小为1/reduce的图像，gray为True时返回灰度图；延迟解码(lazy_decode)的jpeg帧
+    直接按缩小的尺寸解码，比原尺寸解码后再缩小快数倍。载入了校正参数时先在原尺寸上校正再缩小
+    """
+    def read(self, stream_id: int = 0, timeout=None, copy: bool = False, with_info: bool = False,
+             reduce: int = 1, gray: bool = False):
+        last_seq = self.read_seq_nos.get(stream_id, 0)
+        seq, frame, info = self.get_ring(stream_id).wait_newer(last_seq, timeout)
+        if frame is None:
+            return (None, None) if with_info else None
+        self.read_seq_nos[stream_id] = seq
+        undistorter = self.undistorter
+        # 相机参数对应原尺寸的图像，需要校正时先按原尺寸解码
+        cvImg = self.decode_item(frame, info, 1 if undistorter is not None else reduce, gray)
+        if cvImg is None:   # 解码失败
+            return (None, None) if with_info else None
+        if undistorter is not None:
+            t0 = time.perf_counter()
+            buf = self.undist_bufs.get(stream_id)
+            if buf is None or buf.shape != cvImg.shape or buf.dtype != cvImg.dtype:
+                buf = self.undist_bufs[stream_id] = np.empty_like(cvImg)
+            cvImg = undistorter.undistort(cvImg, buf)
+            self.get_stream_stats(stream_id).hist('undistort').record(time.perf_counter() - t0)
+            if reduce > 1:
+                cvImg = reduce_image(cvImg, reduce)
+        if copy and (cvImg is frame or cvImg is self.undist_bufs.get(stream_id)):
+            cvImg = cvImg.copy()
+        return (cvImg, info) if with_info else cvImg
+
+    """
+    读取一批图像，缩放后直接写入预分配并复用的数组，用于推理:
+        batch, infos = client.read_batch(8, size=(640, 480), dtype=np.float32, channels_first=True)
+    每路视频流依次读取n帧比上一次更新的帧(与read()相同)，streams为视频流编号列表(默认[stream_id])，
+    第k次读取的各路视频流排在一起，即batch[k*len(streams) + j]来自streams[j]，批大小N = n * len(streams)。
+    size=(宽, 高)为输出尺寸，None时使用第一帧的尺寸；gray为True时C=1
+    数组为(N, H, W, C)，channels_first为True时为(N, C, H, W)；dtype为np.uint8且不是channels_first时
+    每帧由cv2.resize直接写入数组，dtype为float时像素值先乘以scale，再按通道减mean、除以std(可选)。
+    延迟解码(lazy_decode)的jpeg帧按不小于size的最小尺寸缩小解码(IMREAD_REDUCED_*)。
+    返回(batch, infos)，infos为各帧的FrameInfo(stream_id、服务端帧序号、采集时间等)；超时或断开时返回(None, [])，
+    已读取的帧不会放回。n < 1或streams为空时抛出ValueError
+    返回的数组在下一次相同形状的read_batch()时被覆盖，需要保存时请拷贝
+    """
+    def read_batch(self, n: int = 1, size=None, dtype=np.uint8, stream_id: int = 0, streams=None,
+                   channels_first: bool = False, scale: float = 1.0 / 255, mean=None, std=None,
+                   gray: bool = False, timeout=None):
+        streams = [stream_id] if streams is None else list(streams)
+        if n < 1 or len(streams) == 0:
+            raise ValueError('empty batch')
+        dtype = np.dtype(dtype)
+        c = 1 if gray else 3
+        batch = None
+        infos = []
+        for k in range(n):
+            for sid in streams:
+                img, info = self.read(sid, timeout, with_info=True, reduce=self.batch_reduce(sid, size), gray=gray)
+                if img is None:
+                    return None, []
+                if batch is None:
+                    w, h = size if size is not None else (img.shape[1], img.shape[0])
+                    batch = self.get_batch_buf(n * len(streams), h, w, c, dtype, channels_first)
+                self.fill_batch(batch, len(infos), img, dtype, channels_first, scale, mean, std)
+                infos.append(info)
+        return batch, infos
+
+    # 延迟解码的帧可以直接按缩小的尺寸解码，选取输出不小于size的最大缩小倍数
+    def batch_reduce(self, stream_id: int, size) -> int:
+        info = self.get_ring(stream_id).read_latest()[2]
+        if size is None or self.undistorter is not None or info is None or not info.encoded or not info.width:
+            return 1
+        for reduce in (8, 4, 2):
+            if (info.width + reduce - 1) // reduce >= size[0] and (info.height + reduce - 1) // reduce >= size[1]:
+                return reduce
+        return 1
+
+    def get_batch_buf(self, n: int, h: int, w: int, c: int, dtype: np.dtype, channels_first: bool) -> np.ndarray:
+        shape = (n, c, h, w) if channels_first else (n, h, w, c)
+        key = (shape, dtype)
+        if self.batch_buf is None or self.batch_buf[0] != key:
+            self.batch_buf = (key, np.empty(shape, dtype))
+        return self.batch_buf[1]
+
+    # 把一帧缩放到批数组的第i项: uint8的(N, H, W, C)直接写入，其他情况经由复用的uint8图像转换
+    def fill_batch(self, batch: np.ndarray, i: int, img: np.ndarray, dtype: np.dtype, channels_first: bool,
+                   scale: float, mean, std):
+        direct = dtype == np.uint8 and not channels_first
+        h, w, c = batch.shape[2:] + batch.shape[1:2] if channels_first else batch.shape[1:]
+        if direct:
+            dst = batch[i]
+        else:
+            if self.batch_scratch is None or self.batch_scratch.shape != (h, w, c):
+                self.batch_scratch = np.empty((h, w, c), np.uint8)
+            dst = self.batch_scratch
+        if c == 3 and img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        elif c == 1 and img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        dst2 = dst.reshape(h, w) if c == 1 else dst
+        if img.shape[:2] == (h, w):
+            np.copyto(dst2, img)
+        else:
+            cv2.resize(img, (w, h), dst=dst2, interpolation=cv2.INTER_AREA)
+        if direct:
+            return
+        out = batch[i]
+        if dtype == np.uint8:
+            np.copyto(out, dst.transpose(2, 0, 1))
+            return
+        np.multiply(dst.transpose(2, 0, 1) if channels_first else dst, scale, out=out, casting='unsafe')
+        shape = (c, 1, 1) if channels_first else (c,)
+        if mean is not None:
+            out -= np.asarray(mean, dtype).reshape(shape)
+        if std is not None:
+            out /= np.asarray(std, dtype).reshape(shape)
 
     def dataThread_func(self):
         print('dataThread_func')
         while not self.exitFlag:
             try:
-                frame = self.recv_data_pack(self.data_socket)
-                # print(time.asctime(), frame.shape)
-                lock.acquire()
-                self.cur_cvImg = copy.deepcopy(frame)
-                self.hasNewImg = True
-                lock.release()
+                info, data = self.recv_frame(self.data_socket)
+                self.count_dropped(info)
+                if self.lazy_decode and info.codec not in (CODEC_SHM, CODEC_TILES):
+                    info.encoded = True     # 保存压缩的数据，读取时再解码
+                    self.get_ring(info.stream_id).publish(data.copy(), info)
+                    continue
+                pool = self.decode_pool
+                if pool is not None and info.codec not in (CODEC_SHM, CODEC_TILES):
+                    pool.submit(info, data.copy())  # 接收缓冲区会被下一帧覆盖
+                    continue
+                t0 = time.perf_counter()
+                frame = self.decode_frame(info, data)
+                if pool is not None:    # 排在解码池中先收到的帧之后
+                    pool.put_done(info, frame, time.perf_counter() - t0)
+                else:
+                    self.publish_frame(info, frame, time.perf_counter() - t0)
             except Exception as e:
-                print(f"Error: {e}")
+                if not self.exitFlag:   # disconnect()时的断开是正常退出
+                    print(f"Error: {e}")
                 self.exitFlag = True
                 break
+        if self.decode_pool is not None:
+            self.decode_pool.close(wait=False)
+        self.close_rings()
+        self.shm_reader.close()
+        self.stop_recording()
         print('dataThread_func exit')
 
     def handleThread_func(self):
+        seq = 0
+        ring = self.get_ring(self.handler_stream)
+        stats = self.get_stream_stats(self.handler_stream)
         while not self.exitFlag:
-            if self.hasNewImg:
-                if self.handler is not None:
-                    lock.acquire()
-                    self.handler(self.cur_cvImg)
-                    self.hasNewImg = False
-                    lock.release()
-            else:
-                time.sleep(0.01)
+            seq, cvImg, info = ring.wait_newer(seq, 0.5)
+            if self.handler is None:
+                continue
+            cvImg = self.decode_item(cvImg, info)
+            if cvImg is not None:
+                t0 = time.perf_counter()
+                self.handler(cvImg)
+                stats.hist('handler').record(time.perf_counter() - t0)
         print('handleThread_func exit')
 
     # 用于ctrl_socket，发送一个控制数据包
     def send_ctrl_pack(self, cli_socket:socket.socket, data: dict):
-        jsonObj = json.dumps(data)
-        print("send json:", jsonObj)
-        send_data = bytes(jsonObj, 'utf-8')
-        print("length: ", send_data.__len__())
-        # 先发送4字节长度信息
-        length_info = send_data.__len__().to_bytes(4, byteorder='big')
-        print('sent:', cli_socket.send(length_info))
-        # 再发送实际数据
-        print('sent:', cli_socket.send(send_data))
-        pass
+        print("send:", data)
+        send_data = encode_message(data, self.ctrl_encoding)
+        # 4字节长度信息和实际数据一起发送
+        cli_socket.sendall(send_data.__len__().to_bytes(4, byteorder='big') + send_data)
+
+    # 从socket中精确地读取n字节，recv可能只返回一部分数据(如较长的相机格式列表)
+    @staticmethod
+    def recv_exactly(cli_socket: socket.socket, n: int) -> bytes:
+        buf = bytearray(n)
+        RecvBuffer.recv_exact(cli_socket, memoryview(buf), n)
+        return bytes(buf)
 
     # 用于ctrl_socket, 接收一个应答数据包
     def recv_ctrl_pack(self, cli_socket:socket.socket)->dict:
         # 先接受4字节长度信息
-        recv_bytes = cli_socket.recv(4)
-        data_len = int.from_bytes(recv_bytes, byteorder='big')
+        data_len = int.from_bytes(self.recv_exactly(cli_socket, 4), byteorder='big')
         # 接收实际的数据
-        recv_bytes = cli_socket.recv(data_len)
-        json_txt = recv_bytes.decode('utf-8')
-        data = json.loads(json_txt)
-        # print(f"Received message:", print(data))
+        data, encoding = decode_message(self.recv_exactly(cli_socket, data_len))
         return data
 
-    # 用于data_socket, 接收一个相机图像帧
+    # 根据服务端帧序号的间隔统计丢帧
+    def count_dropped(self, info):
+        if info.seq is None:
+            return
+        last = self.server_seqs.get(info.stream_id)
+        if last is not None and info.seq > last + 1:
+            self.dropped[info.stream_id] = self.dropped.get(info.stream_id, 0) + info.seq - last - 1
+        self.server_seqs[info.stream_id] = info.seq
+
+    # 用于data_socket, 接收一个相机图像帧, 返回(info, img), info为帧头信息
     def recv_data_pack(self, cli_socket:socket.socket):
-        # 先接受4字节长度信息
-        recv_bytes = cli_socket.recv(4)
-        total_len = int.from_bytes(recv_bytes, byteorder='big')
-        # print('img data len:', total_len)
-        # 接收实际的图像数据
-        recv_bytes =b''
-        while len(recv_bytes) < total_len:
-            to_read = total_len - len(recv_bytes)
-            recv_bytes += cli_socket.recv(
-                self.recv_bufsize if to_read > self.recv_bufsize else to_read)
-        img_arr = np.frombuffer(recv_bytes, np.uint8)
-        if True:     # 启用压缩的话，需解压缩
-            # opencv method
-            img = cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
-        else:
-            img =img.reshape([self.height, self.width, 3])
-        return img
+        info, img_arr = self.recv_frame(cli_socket)
+        t1 = time.perf_counter()
+        img = self.decode_frame(info, img_arr)
+        self.get_stream_stats(info.stream_id).hist('decode').record(time.perf_counter() - t1)
+        return info, img
+
+    # 接收帧头以及实际的图像数据，返回(info, data)，data为接收缓冲区的视图，在下一次接收之前有效
+    def recv_frame(self, cli_socket:socket.socket):
+        # 数据直接写入可复用的缓冲区
+        info = read_header(lambda n: self.recv_buf.recv_head(cli_socket, n))
+        stats = self.get_stream_stats(info.stream_id)
+        t0 = time.perf_counter()
+        total_len = self.recv_buf.recv_payload(cli_socket, info.payload_len)
+        info.recv_ts = time.time()
+        stats.hist('recv').record(time.perf_counter() - t0)
+        img_arr = self.recv_buf.as_array(total_len)     # 缓冲区的视图，无拷贝
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write(info, img_arr)
+        stats.rate('frames').add()
+        stats.rate('bytes').add(total_len)
+        latency = info.latency()
+        if latency is not None:
+            stats.hist('e2e').record(max(latency, 0.0))
+        return info, img_arr
+
+    # 解码一帧数据，共享内存和分块增量的帧必须在接收线程中按顺序处理
+    def decode_frame(self, info, img_arr):
+        if info.codec == CODEC_SHM:     # 图像位于共享内存中，直接映射
+            try:
+                return self.shm_reader.read(img_arr)
+            except OSError as e:        # 打不开服务端的共享内存，丢弃该帧，不结束接收线程
+                print('shm attach err: %s' % str(e))
+                return None
+        if info.codec == CODEC_TILES:   # 变化的块覆盖到该视频流保存的完整图像上
+            decoder = self.tile_decoders.get(info.stream_id)
+            if decoder is None:
+                decoder = self.tile_decoders[info.stream_id] = TileDecoder()
+            return decoder.decode(img_arr)
+        return decode_payload(info.codec, img_arr)
+
+    # 把解码后的帧放入该视频流的FrameRing，接收线程或DecodePool的交付线程按接收顺序调用
+    def publish_frame(self, info, img, decode_dur: float):
+        self.get_stream_stats(info.stream_id).hist('decode').record(decode_dur)
+        if img is None:     # 解码失败，丢弃该帧
+            return
+        self.get_ring(info.stream_id).publish(img, info)
 
     def __del__(self):  
         self.disconnect()
@@ -15,6 +15,7 @@ from PySide6.QtGui import QCloseEvent, QPixmap, QImage
 import sys
 
 from IpCameraClient import IpCameraClient
+from Undistorter import Undistorter
 
 import ImageFuncs
 # lock = threading.Lock()
@@ -31,6 +32,8 @@ class QCameraMan:
         self.handler = None
         self.camParams = {}                         # 相机参数，包括相机内参矩阵('matrix')，畸变系数('distortion')等
         self.needRectification = False                # 若此项为False则输出的图像不进行校正
+        self.undistorter = None                     # 根据camParams创建，缓存校正映射表
+        self.undist_buf = None                      # 预先分配的校正输出图像
         self.cam_name = ""                          # 当前相机的名称
         self.cur_format = ""                        # 当前相机当前使用的格式
         self.formats = []                           # 当前相机支持的格式
@@ -93,6 +96,9 @@ class QCameraMan:
         if self.client.set_camera(cam_idx, w, h):
             self.cur_format = formatStr
             self.resolution =(w, h)
+            if self.undistorter is not None:    # 分辨率改变，原来的映射表不再使用
+                self.undistorter.invalidate()
+            self.undist_buf = None
             return True
         else:
             return False
@@ -129,6 +135,8 @@ class QCameraMan:
         self.camParams = params
         self.camParams['distortion'] = distortion
         self.camParams['matrix'] = matrix
+        self.undistorter = Undistorter(matrix, distortion)
+        self.undist_buf = None
         return True
 
     def LoadParamFromDir(self, dir: Path,  camName:str, fmtStr: str):
@@ -169,9 +177,11 @@ class QCameraMan:
     # 预处理图像
     def img_preHandle(self, cvImg):
         # 进行图像校正
-        if self.needRectification and self.camParams is not None and len(self.camParams)!=0:
-            cvImg = cv2.undistort(cvImg, self.camParams['matrix'],
-                                self.camParams['distortion'])        
+        # 处理函数在本线程中同步调用，输出图像可以每帧复用，处理函数需要保存图像时请拷贝
+        if self.needRectification and self.undistorter is not None:
+            if self.undist_buf is None or self.undist_buf.shape != cvImg.shape:
+                self.undist_buf = np.empty_like(cvImg)
+            cvImg = self.undistorter.undistort(cvImg, self.undist_buf)
 
         if self.handler is not None:
             # print(time.asctime(), cvImg.shape)
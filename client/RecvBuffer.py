@@ -0,0 +1,64 @@
+import socket
+import numpy as np
+
+
+"""
+数据流的接收缓冲区：用recv_into直接把数据写入可复用的bytearray，避免 bytes += recv() 的反复拷贝。
+缓冲区只在收到更大的帧时才扩容（按2的幂次增长），返回给调用者的是缓冲区的视图，
+因此在下一次recv_pack之前有效，需要长期保存时调用者需自行拷贝。
+"""
+class RecvBuffer:
+    def __init__(self, init_size: int = 1024*1024) -> None:
+        self.buf = bytearray(init_size)
+        self.view = memoryview(self.buf)
+        self.head = bytearray(256)              # 帧头，收到更长的帧头时扩大(protocol 2的帧头长度最大为65535字节)
+        self.head_view = memoryview(self.head)
+        self.grow_count = 0                     # 扩容次数，用于统计
+
+    def capacity(self) -> int:
+        return len(self.buf)
+
+    # 保证缓冲区至少有size字节
+    def reserve(self, size: int):
+        if size <= len(self.buf):
+            return
+        new_size = len(self.buf) if len(self.buf) > 0 else 4096
+        while new_size < size:
+            new_size *= 2
+        # 不能原地resize（已导出memoryview），直接换一块新的缓冲区
+        self.buf = bytearray(new_size)
+        self.view = memoryview(self.buf)
+        self.grow_count += 1
+
+    # 从socket中精确地读取n字节到view中
+    @staticmethod
+    def recv_exact(cli_socket: socket.socket, view: memoryview, n: int):
+        got = 0
+        while got < n:
+            cnt = cli_socket.recv_into(view[got:n], n - got)
+            if cnt == 0:    # 远端关闭了连接
+                raise ConnectionError('connection closed by peer')
+            got += cnt
+
+    # 接收n字节的帧头，返回其视图
+    def recv_head(self, cli_socket: socket.socket, n: int) -> memoryview:
+        if n > len(self.head):      # 新版本的服务端在帧头末尾增加了字段
+            self.head = bytearray(n)
+            self.head_view = memoryview(self.head)
+        self.recv_exact(cli_socket, self.head_view, n)
+        return self.head_view[:n]
+
+    # 接收n字节的数据，数据位于self.buf[:n]
+    def recv_payload(self, cli_socket: socket.socket, n: int) -> int:
+        self.reserve(n)
+        self.recv_exact(cli_socket, self.view, n)
+        return n
+
+    # 接收一个数据包（4字节长度+数据），返回数据长度，数据位于self.buf[:n]
+    def recv_pack(self, cli_socket: socket.socket) -> int:
+        total_len = int.from_bytes(self.recv_head(cli_socket, 4), byteorder='big')
+        return self.recv_payload(cli_socket, total_len)
+
+    # 以numpy数组的形式返回缓冲区前n字节（无拷贝）
+    def as_array(self, n: int) -> np.ndarray:
+        return np.frombuffer(self.buf, np.uint8, count=n)
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+from multiprocessing import shared_memory
+
+from WireFormat import SLOT_HEADER, SLOT_HEADER_SIZE, NOTIFY, SHM_NAME_PREFIX
+
+
+"""
+读取服务端写入共享内存的图像帧，与服务端的ShmFrameRing对应
+根据数据流中的通知把槽位映射为numpy数组，不做拷贝。
+返回的数组在服务端写满一圈槽位(默认8帧)后会被覆盖，需要长期保存时请拷贝。
+服务端因图像变大或重新开始采集而换用新的共享内存后，通知中不再出现旧的名称，
+收到同一视频流新名称的通知时关闭旧的共享内存(仍有数组引用时等引用释放后再关闭)。
+"""
+
+
+# 共享内存名称中去掉随机部分，同一服务端进程的同一视频流相同(格式见ShmFrameRing)
+def stream_key(name: str) -> str:
+    return name.rsplit('_', 1)[0]
+
+
+class ShmFrameReader:
+    def __init__(self) -> None:
+        self.shms = {}      # 名称 -> SharedMemory
+        self.retired = []   # 已被替换、但仍有数组引用而暂未关闭的SharedMemory
+
+    def attach(self, name: str) -> shared_memory.SharedMemory:
+        shm = self.shms.get(name)
+        if shm is None:
+            key = stream_key(name)
+            for old in [n for n in self.shms if stream_key(n) == key]:
+                self.retired.append(self.shms.pop(old))
+            shm = shared_memory.SharedMemory(name=name)
+            # 共享内存由服务端管理，不能让本进程的resource_tracker在退出时删除它；
+            # 与服务端在同一进程中时(名称中的pid为本进程)由服务端unlink时注销，这里不能重复注销
+            if not name.startswith(SHM_NAME_PREFIX % os.getpid()):
+                try:
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(shm._name, 'shared_memory')
+                except Exception:
+                    pass
+            self.shms[name] = shm
+        return shm
+
+    # 打开服务端set_transport('shm')应答中的探测共享内存，读到相同的token时返回True，
+    # 打开失败(与服务端不在同一台机器上，不共享内存)时抛出异常
+    def probe(self, name: str, token: str) -> bool:
+        shm = self.attach(name)
+        try:
+            return bytes(shm.buf[:len(token)]) == token.encode('ascii')
+        finally:
+            self.detach(name)
+
+    def detach(self, name: str):
+        shm = self.shms.pop(name, None)
+        if shm is not None:
+            shm.close()
+
+    # 根据通知返回图像，槽位已被覆盖时返回None
+    def read(self, data) -> np.ndarray:
+        if len(self.retired) > 0:
+            self.close_retired()
+        name, stride, slot, seq, nbytes, h, w, c = NOTIFY.unpack_from(data, 0)
+        shm = self.attach(name.rstrip(b'\0').decode('ascii'))
+        offset = slot * stride
+        if SLOT_HEADER.unpack_from(shm.buf, offset)[0] != seq:
+            return None
+        shape = (h, w) if c == 1 else (h, w, c)
+        return np.ndarray(shape, np.uint8, buffer=shm.buf, offset=offset + SLOT_HEADER_SIZE)
+
+    # 关闭已被替换的共享内存，仍有图像引用的留到下一次
+    def close_retired(self):
+        busy = []
+        for shm in self.retired:
+            try:
+                shm.close()
+            except BufferError:
+                busy.append(shm)
+        self.retired = busy
+
+    def close(self):
+        self.close_retired()
+        busy = {}
+        for name, shm in self.shms.items():
+            try:
+                shm.close()
+            except BufferError:     # 仍有图像引用该共享内存，暂不关闭
+                busy[name] = shm
+        self.shms = busy
@@ -0,0 +1,47 @@
+import threading
+
+import cv2
+import numpy as np
+
+from WireFormat import TILES_HEADER, TILE_ENTRY
+
+
+"""
+分块增量传输('tiles'编码)的解码，与服务端的TileEncoder对应，数据格式见WireFormat(TILES_HEADER)
+每路视频流一个TileDecoder，保存完整的图像，收到的块覆盖到对应的位置上。
+服务端认为客户端收到了发出的每一帧，因此每一帧都必须按顺序交给decode()，不能跳过。
+"""
+
+class TileDecoder:
+    def __init__(self) -> None:
+        self.image = None           # 当前完整的图像
+        self.lock = threading.Lock()
+
+    """
+    data为一维uint8数组(可以是接收缓冲区的视图)，返回完整图像的拷贝(之后的帧不会修改它)
+    还没有收到关键帧或数据损坏时返回None
+    """
+    def decode(self, data: np.ndarray):
+        with self.lock:
+            width, height, tile_w, tile_h, base_len, count = TILES_HEADER.unpack_from(data, 0)
+            pos = TILES_HEADER.size
+            if base_len > 0:
+                self.image = cv2.imdecode(data[pos:pos + base_len], cv2.IMREAD_COLOR)
+                pos += base_len
+            image = self.image
+            if image is None or image.shape[0] != height or image.shape[1] != width:
+                self.image = None   # 等待下一个关键帧
+                return None
+            cols = (width + tile_w - 1) // tile_w
+            for _ in range(count):
+                idx, n = TILE_ENTRY.unpack_from(data, pos)
+                pos += TILE_ENTRY.size
+                tile = cv2.imdecode(data[pos:pos + n], cv2.IMREAD_COLOR)
+                pos += n
+                if tile is None:
+                    self.image = None
+                    return None
+                y0 = (idx // cols) * tile_h
+                x0 = (idx % cols) * tile_w
+                image[y0:y0 + tile.shape[0], x0:x0 + tile.shape[1]] = tile
+            return image.copy()
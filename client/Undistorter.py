@@ -0,0 +1,68 @@
+import threading
+import cv2
+import numpy as np
+
+
+"""
+图像畸变校正：用initUndistortRectifyMap生成的映射表和cv2.remap代替每帧调用cv2.undistort
+cv2.undistort每次都会重新计算整幅图像的映射表，映射表只与相机参数、分辨率以及新的内参矩阵有关，
+这里按(宽, 高, alpha, 新内参矩阵)缓存映射表，默认使用定点格式(CV_16SC2)，remap更快、占用内存更少。
+    alpha: 为None时与cv2.undistort相同，使用原内参矩阵；否则由getOptimalNewCameraMatrix计算新的内参矩阵，
+           0表示只保留有效像素，1表示保留全部原始像素
+    new_matrix: 直接指定新的内参矩阵，优先于alpha
+"""
+class Undistorter:
+    def __init__(self, matrix: np.ndarray, distortion: np.ndarray, alpha=None, new_matrix=None,
+                 fixed_point: bool = True) -> None:
+        self.matrix = np.asarray(matrix, np.float64)
+        self.distortion = np.asarray(distortion, np.float64)
+        self.alpha = alpha
+        self.new_matrix = None if new_matrix is None else np.asarray(new_matrix, np.float64)
+        self.map_type = cv2.CV_16SC2 if fixed_point else cv2.CV_32FC1
+        self.maps = {}      # (宽, 高, alpha, 新内参矩阵) -> (map1, map2)
+        self.lock = threading.Lock()
+
+    def set_alpha(self, alpha):
+        self.alpha = alpha
+        self.new_matrix = None
+
+    def set_new_matrix(self, new_matrix):
+        self.new_matrix = None if new_matrix is None else np.asarray(new_matrix, np.float64)
+
+    # 清除缓存的映射表，分辨率改变后调用以释放旧的映射表
+    def invalidate(self):
+        with self.lock:
+            self.maps = {}
+
+    # 分辨率为(width, height)时使用的新内参矩阵
+    def new_camera_matrix(self, width: int, height: int) -> np.ndarray:
+        if self.new_matrix is not None:
+            return self.new_matrix
+        if self.alpha is None:
+            return self.matrix
+        new_matrix, _ = cv2.getOptimalNewCameraMatrix(self.matrix, self.distortion, (width, height),
+                                                      self.alpha, (width, height))
+        return new_matrix
+
+    def get_maps(self, width: int, height: int) -> tuple:
+        new_matrix = self.new_matrix
+        key = (width, height, self.alpha, None if new_matrix is None else new_matrix.tobytes())
+        maps = self.maps.get(key)
+        if maps is None:
+            with self.lock:
+                maps = self.maps.get(key)
+                if maps is None:
+                    maps = cv2.initUndistortRectifyMap(self.matrix, self.distortion, None,
+                                                       self.new_camera_matrix(width, height),
+                                                       (width, height), self.map_type)
+                    self.maps[key] = maps
+        return maps
+
+    # 校正一帧图像，out为预先分配的输出图像(与img的尺寸和类型相同)，为None时新建
+    def undistort(self, img: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        height, width = img.shape[:2]
+        map1, map2 = self.get_maps(width, height)
+        if out is None:
+            return cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
+        cv2.remap(img, map1, map2, cv2.INTER_LINEAR, dst=out)
+        return out
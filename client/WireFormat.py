@@ -0,0 +1,210 @@
+import json
+import struct
+
+import numpy as np
+
+
+"""
+服务端与客户端之间传输的所有数据格式(以及客户端录像、服务端回放共用的索引格式)，两端都导入本模块，不再各自定义。
+client/WireFormat.py是本文件的拷贝(客户端可以不带server目录单独部署)，两份必须完全相同，
+修改后复制到client目录，tests/test_wire_format.py检查两者是否一致。
+"""
+
+
+"""
+数据流(data_socket)上每一帧的帧头，客户端通过subscribe命令的protocol参数选择
+protocol 0(旧协议): 4字节大端的数据长度 + 数据，只能传输0号视频流
+protocol 1: 10字节帧头 + 数据
+    magic(2字节, b'IC') | version(1字节, =1) | codec(1字节) | stream_id(2字节) | 数据长度(4字节)
+protocol 2: 38字节帧头 + 数据
+    magic(2字节, b'IC') | version(1字节, =2) | codec(1字节) | stream_id(2字节) | 帧头长度(2字节)
+    | seq(8字节) | 采集时间(8字节double, unix时间, 秒) | 编码耗时(4字节, 微秒)
+    | 宽(2字节) | 高(2字节) | 像素格式(1字节) | 保留(1字节) | 数据长度(4字节)
+旧协议的长度字段不可能以b'IC'开头(需要>1GB的帧)，据此区分帧头。
+protocol 2的帧头长度字段使新版本的服务端可以在帧头末尾增加字段(帧头最长65535字节)，客户端读取整个帧头并忽略多出的部分。
+客户端先读4字节(magic | version | codec)，再按版本读余下的部分(*_REST)。
+"""
+
+MAGIC = b'IC'
+HEADER_V1 = struct.Struct('>2sBBHI')
+HEADER_V2 = struct.Struct('>2sBBHHQdIHHBxI')
+HEADER_V1_REST = struct.Struct('>HI')           # 前4字节之后的部分
+HEADER_V2_LEN = struct.Struct('>HH')            # stream_id | 帧头长度
+HEADER_V2_REST = struct.Struct('>QdIHHBxI')
+PROTOCOLS = (0, 1, 2)
+
+# 数据的编码格式
+CODEC_JPEG = 0
+CODEC_PNG = 1
+CODEC_WEBP = 2
+CODEC_RAW = 3       # 不压缩的图像数据，以RAW_HEADER开头
+CODEC_SHM = 4       # 图像位于共享内存中，数据为共享内存的通知(SHM_NOTIFY)
+CODEC_TILES = 5     # 分块增量传输，格式见下面的TILES_HEADER
+
+# 像素格式(解码后的图像)
+PIXFMT_BGR = 0
+PIXFMT_GRAY = 1
+
+# raw格式的数据以 高(2字节)|宽(2字节)|通道数(2字节) 开头
+RAW_HEADER = struct.Struct('>HHH')
+
+
+"""
+分块增量传输('tiles'编码)的数据格式(服务端TileEncoder，客户端TileDecoder):
+    TILES_HEADER: 宽|高|块宽|块高(各2字节) | 关键帧JPEG的长度(4字节, 0表示没有) | 块个数(4字节)
+    关键帧的JPEG数据(整幅图像)
+    块个数 x (TILE_ENTRY: 块序号(4字节, 按行排列) | 数据长度(4字节) + 块的JPEG数据)
+"""
+
+TILES_HEADER = struct.Struct('>HHHHII')
+TILE_ENTRY = struct.Struct('>II')
+
+
+"""
+共享内存传输(服务端ShmFrameRing，客户端ShmFrameReader)
+每个槽位: 槽位头(SLOT_HEADER，对齐到64字节) + 图像数据
+共享内存的名称为 ipcam_<创建者的pid>_<stream_id>_<随机串>
+"""
+
+SLOT_HEADER = struct.Struct('>QIHHH')       # seq | 数据长度 | 高 | 宽 | 通道数
+SLOT_HEADER_SIZE = 64
+# 通知: 共享内存名称(32字节) | 槽位大小 | 槽位号 | seq | 数据长度 | 高 | 宽 | 通道数
+NOTIFY = struct.Struct('>32sIIQIHHH')
+SHM_NAME_PREFIX = 'ipcam_%d_'               # % pid
+
+
+"""
+录像(客户端FrameRecorder录制，服务端CompressedReplayCapture回放)的文件
+    00000.seg, 00001.seg ...    各帧数据依次拼接(SEGMENT_NAME)
+    stream_<id>.idx             每路视频流一个索引(INDEX_NAME): INDEX_HEADER + 每帧一条INDEX_RECORD
+INDEX_RECORD(小端): seq(8) | 采集时间(8, double) | 接收时间(8, double) | 分段内的偏移(8) | 长度(4)
+                    | 分段序号(4) | 宽(2) | 高(2) | codec(1) | 像素格式(1) | 段号(2)
+"""
+
+SEGMENT_NAME = '%05d.seg'
+INDEX_NAME = 'stream_%d.idx'
+INDEX_MAGIC = b'IPCR'
+INDEX_HEADER = struct.Struct('<4sHH')         # magic | 版本 | 每条记录的长度
+INDEX_RECORD = struct.Struct('<QddQIIHHBBH')
+INDEX_DTYPE = np.dtype([('seq', '<u8'), ('capture_ts', '<f8'), ('recv_ts', '<f8'), ('offset', '<u8'),
+                        ('length', '<u4'), ('segment', '<u4'), ('width', '<u2'), ('height', '<u2'),
+                        ('codec', 'u1'), ('pixfmt', 'u1'), ('run', '<u2')])
+assert INDEX_DTYPE.itemsize == INDEX_RECORD.size
+
+
+"""
+控制连接数据包的编码，数据包为 4字节大端长度 + 内容，内容有两种编码:
+    json:   utf-8的json文本(以'{'开头)，与旧版本兼容
+    binary: BINARY_MAGIC + 一个值的紧凑二进制编码，省去json的文本格式化和解析
+服务端按收到的命令的编码返回应答。二进制编码每个值以1字节类型开头(大端):
+    'N' None | 'T' True | 'F' False | 'i' int32 | 'q' int64 | 'd' double
+    's' 字符串(4字节长度 + utf-8) | 'l' 列表(4字节个数 + 元素) | 'm' dict(4字节个数 + (1字节长度的键 + 值)...)
+"""
+
+BINARY_MAGIC = b'\xb1'
+ENCODINGS = ('json', 'binary')
+
+_I32 = struct.Struct('>i')
+_I64 = struct.Struct('>q')
+_F64 = struct.Struct('>d')
+_U32 = struct.Struct('>I')
+
+
+def _encode_value(value, out: bytearray):
+    if value is None:
+        out += b'N'
+    elif value is True:
+        out += b'T'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, int):
+        if -0x80000000 <= value <= 0x7fffffff:
+            out += b'i' + _I32.pack(value)
+        else:
+            out += b'q' + _I64.pack(value)
+    elif isinstance(value, float):
+        out += b'd' + _F64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out += b's' + _U32.pack(len(data)) + data
+    elif isinstance(value, (list, tuple, set)):
+        out += b'l' + _U32.pack(len(value))
+        for item in value:
+            _encode_value(item, out)
+    elif isinstance(value, dict):
+        out += b'm' + _U32.pack(len(value))
+        for key, item in value.items():
+            key = str(key).encode('utf-8')
+            if len(key) > 255:
+                raise ValueError('key too long')
+            out.append(len(key))
+            out += key
+            _encode_value(item, out)
+    else:
+        raise ValueError('cannot encode %s' % type(value).__name__)
+
+
+# 数据被截断时struct.unpack_from抛出struct.error，统一转为ValueError
+def _decode_value(data: bytes, pos: int):
+    try:
+        return _decode_item(data, pos)
+    except (struct.error, IndexError) as e:
+        raise ValueError('truncated binary message: %s' % str(e))
+
+
+def _decode_item(data: bytes, pos: int):
+    tag = data[pos:pos + 1]
+    pos += 1
+    if tag == b'N':
+        return None, pos
+    if tag == b'T':
+        return True, pos
+    if tag == b'F':
+        return False, pos
+    if tag == b'i':
+        return _I32.unpack_from(data, pos)[0], pos + 4
+    if tag == b'q':
+        return _I64.unpack_from(data, pos)[0], pos + 8
+    if tag == b'd':
+        return _F64.unpack_from(data, pos)[0], pos + 8
+    if tag == b's':
+        n = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        return data[pos:pos + n].decode('utf-8'), pos + n
+    if tag == b'l':
+        n = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        items = []
+        for _ in range(n):
+            item, pos = _decode_item(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == b'm':
+        n = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        result = {}
+        for _ in range(n):
+            key_len = data[pos]
+            key = data[pos + 1:pos + 1 + key_len].decode('utf-8')
+            result[key], pos = _decode_item(data, pos + 1 + key_len)
+        return result, pos
+    raise ValueError('unknown type tag: %r' % tag)
+
+
+# 编码一个数据包的内容(不含4字节长度)
+def encode_message(data: dict, encoding: str = 'json') -> bytes:
+    if encoding == 'binary':
+        out = bytearray(BINARY_MAGIC)
+        _encode_value(data, out)
+        return bytes(out)
+    return bytes(json.dumps(data), 'utf-8')
+
+
+# 解码一个数据包的内容，返回(dict, 编码方式)
+def decode_message(data: bytes) -> tuple:
+    if data[:1] == BINARY_MAGIC:
+        value, pos = _decode_value(data, 1)
+        if not isinstance(value, dict) or pos != len(data):
+            raise ValueError('bad binary message')
+        return value, 'binary'
+    return json.loads(data.decode('utf-8')), 'json'
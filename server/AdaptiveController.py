@@ -0,0 +1,149 @@
+import time
+
+from FrameCodec import CodecConfig
+
+
+"""
+根据发送背压自适应调整一个订阅者的编码参数(jpeg/webp的质量以及输出图像的缩放比例)
+慢速连接(如远程的WiFi)上固定的编码参数要么浪费带宽，要么导致排队延迟增加和丢帧。
+控制器在事件循环线程中由DataSubscriber调用:
+    on_sent(frame): 一帧发送完成，记录从采集到发送完成的延迟
+    update(dropped, queued): 每interval秒评估一次，返回新的CodecConfig(无变化时返回None)
+拥塞(发送队列丢帧、延迟超过target_latency，或帧率低于target_fps)时降一级，
+连续多个周期延迟低于target_latency的一半且不丢帧时升一级。
+所有的工作点组成一条链: 先在原尺寸下从max_quality逐级降低质量到min_quality，再逐级缩小尺寸到min_scale，
+升级时沿同一条链返回(先恢复尺寸，再提高质量)，因此每一级的数据量都是单调变化的。
+升级后很快又拥塞时，下一次升级前需要等待的周期数加倍，避免在带宽的边缘来回振荡。
+"""
+
+SCALE_STEPS = (1.0, 0.75, 0.5, 0.375, 0.25)
+
+
+class AdaptiveController:
+    def __init__(self, base: CodecConfig, target_latency: float = 0.2, target_fps=None,
+                 min_quality: int = 30, max_quality: int = 90, quality_step: int = 10,
+                 min_scale: float = 0.5, interval: float = 0.5) -> None:
+        if base.codec not in ('jpeg', 'webp'):
+            raise ValueError('adaptive control requires jpeg or webp codec')
+        if not 1 <= min_quality <= max_quality <= 100:
+            raise ValueError('quality bounds must satisfy 1 <= min_quality <= max_quality <= 100')
+        if not 0 < min_scale <= 1:
+            raise ValueError('min_scale must be in (0, 1]')
+        if target_latency <= 0 or (target_fps is not None and target_fps <= 0):
+            raise ValueError('targets must be positive')
+        self.base = base.replace(quality=None, scale=None)
+        self.target_latency = float(target_latency)
+        self.target_fps = None if target_fps is None else float(target_fps)
+        self.min_quality = int(min_quality)
+        self.max_quality = int(max_quality)
+        self.interval = float(interval)
+        # 工作点(quality, scale)，0为最好
+        qualities = list(range(self.max_quality, self.min_quality, -max(1, int(quality_step)))) + [self.min_quality]
+        self.levels = [(q, 1.0) for q in qualities] + \
+                      [(self.min_quality, s) for s in SCALE_STEPS if min_scale <= s < 1.0]
+        self.level = 0
+        self.codec = self.make_codec()
+        self.up_hold = 2                # 升级前需要连续良好的周期数
+        self.good_periods = 0
+        self.last_up = None             # 上一次升级的时间，用于判断升级是否失败
+        self.changes = 0
+        # 当前周期的统计
+        self.period_start = time.monotonic()
+        self.sent = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.last_dropped = None
+        self.skip_period = False        # 刚改变工作点，队列中还有旧参数的帧，本周期不评估
+        # 最近一个周期的结果
+        self.fps = 0.0
+        self.latency = None
+
+    def make_codec(self) -> CodecConfig:
+        quality, scale = self.levels[self.level]
+        return self.base.replace(quality=quality, scale=scale)
+
+    # 基础参数改变(如set_roi修改了裁剪区域)，保持当前的工作点
+    def rebase(self, base: CodecConfig) -> CodecConfig:
+        self.base = base.replace(quality=None, scale=None)
+        self.codec = self.make_codec()
+        self.skip_period = True
+        return self.codec
+
+    # 一帧发送完成
+    def on_sent(self, frame):
+        latency = time.time() - frame.capture_ts
+        self.sent += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    """
+    dropped: 订阅者发送队列累计的丢帧数; queued: 发送队列中等待的帧数
+    返回新的编码参数，不需要调整时返回None
+    """
+    def update(self, dropped: int, queued: int):
+        now = time.monotonic()
+        elapsed = now - self.period_start
+        if elapsed < self.interval:
+            return None
+        drops = 0 if self.last_dropped is None else dropped - self.last_dropped
+        self.last_dropped = dropped
+        self.fps = self.sent / elapsed
+        self.latency = self.latency_sum / self.sent if self.sent > 0 else None
+        latency_max = self.latency_max
+        self.period_start = now
+        self.sent = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        if self.skip_period:
+            self.skip_period = False
+            return None
+
+        offered = self.fps + drops / elapsed     # 到达该订阅者的帧率
+        congested = drops > 0 or (self.latency is not None and self.latency > self.target_latency)
+        if self.target_fps is not None and offered >= self.target_fps * 0.9 and self.fps < self.target_fps * 0.9:
+            congested = True
+        if self.latency is None and queued > 0:     # 整个周期一帧都没有发完
+            congested = True
+
+        if congested:
+            self.good_periods = 0
+            if self.last_up is not None and now - self.last_up < self.interval * 3:
+                self.up_hold = min(self.up_hold * 2, 64)    # 刚升级就拥塞，推迟下一次升级
+            self.last_up = None
+            # 严重拥塞时一次降两级
+            severe = self.latency is None or latency_max > self.target_latency * 3 or drops > self.fps * elapsed
+            return self.set_level(self.level + (2 if severe else 1))
+
+        if self.latency is not None and self.latency < self.target_latency * 0.5:
+            self.good_periods += 1
+            if self.good_periods >= self.up_hold and self.level > 0:
+                self.good_periods = 0
+                self.last_up = now
+                return self.set_level(self.level - 1)
+        else:
+            self.good_periods = 0
+        if self.last_up is not None and now - self.last_up >= self.interval * 3:
+            self.last_up = None
+            self.up_hold = max(2, self.up_hold // 2)    # 升级成功，逐渐恢复升级的速度
+        return None
+
+    def set_level(self, level: int):
+        level = min(max(level, 0), len(self.levels) - 1)
+        if level == self.level:
+            return None
+        self.level = level
+        self.codec = self.make_codec()
+        self.changes += 1
+        self.skip_period = True
+        return self.codec
+
+    # 当前的工作点以及测量结果
+    def to_dict(self) -> dict:
+        quality, scale = self.levels[self.level]
+        return {'enabled': True, 'codec': self.base.codec, 'quality': quality, 'scale': scale,
+                'level': self.level, 'levels': len(self.levels),
+                'fps': round(self.fps, 2),
+                'latency_ms': None if self.latency is None else round(self.latency * 1000, 2),
+                'target_latency_ms': round(self.target_latency * 1000, 2), 'target_fps': self.target_fps,
+                'min_quality': self.min_quality, 'max_quality': self.max_quality,
+                'min_scale': self.levels[-1][1], 'changes': self.changes}
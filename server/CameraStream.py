@@ -0,0 +1,262 @@
+import cv2
+import threading
+import time
+
+from FramePipeline import FramePipeline
+from FrameSource import is_jpeg_buffer
+from FrameCodec import DEFAULT_CODEC
+from WireFormat import PIXFMT_BGR, PIXFMT_GRAY
+from ShmFrameRing import ShmFrameRing
+from StageStats import StageStats
+from CapturePool import CapturePool
+from TileEncoder import TileEncoder
+
+
+# 默认的相机打开方式
+def open_dshow_camera(cam_idx: int):
+    return cv2.VideoCapture(cam_idx, cv2.CAP_DSHOW)
+
+
+"""
+一路视频流：对应一个相机及其分辨率，拥有自己的采集/编码流水线
+多个视频流各自使用独立的线程，可以同时利用多个CPU核。
+capture_factory(cam_idx)返回一个类似cv2.VideoCapture的对象，测试时可以用FrameSource中的合成数据源代替
+on_frame(frame)在流水线输出每一帧编码后的图像时调用
+get_codecs(stream_id)返回当前需要的编码参数(CodecConfig)集合，每一帧对每一组参数编码一次
+capture_pool为多个视频流共用的相机池(CapturePool)，停止采集后相机保持打开，None时停止采集即关闭相机
+"""
+class CameraStream:
+    def __init__(self, stream_id: int, on_frame, capture_factory=None, get_codecs=None,
+                 capture_pool: CapturePool = None) -> None:
+        self.stream_id = stream_id
+        self.on_frame = on_frame
+        self.get_codecs = get_codecs if get_codecs is not None else lambda stream_id: [DEFAULT_CODEC]
+        self.capture_factory = capture_factory if capture_factory is not None else open_dshow_camera
+        self.capture_pool = capture_pool if capture_pool is not None else CapturePool(self.capture_factory, 1, 0)
+        self.pooled = None                  # 当前使用的相机(PooledCapture)
+        self.cam_idx = -1
+        self.width = 640
+        self.height = 480
+        # 流水线参数
+        self.encoder_num = 0                # 编码线程数，0表示根据CPU核数自动选择
+        self.queue_size = 2                 # 采集队列长度
+        self.drop_policy = 'drop_oldest'    # 采集队列满时的策略，'drop_oldest'或'block'
+        # 相机输出MJPG时直接转发相机的JPEG数据，省去一次解码和一次编码
+        self.passthrough = True
+        self.passthrough_active = False     # 当前相机是否能提供原始JPEG数据
+        self.frame_size = (self.width, self.height)
+
+        self.shm_slot_num = 8               # 共享内存传输的槽位数
+        self.shm_ring = None                # 共享内存传输, 有客户端使用时才创建
+        self.retired_shm_rings = []         # 因图像变大而被替换的共享内存，停止采集时释放
+        self.shm_lock = threading.Lock()
+        self.tile_encoders = {}             # CodecConfig -> TileEncoder, 分块增量传输
+        self.tile_lock = threading.Lock()
+
+        self.pipeline = None
+        self.outputThread = None
+        self.lock = threading.Lock()        # 保护流水线的启停
+        self.stats = StageStats()           # 采集、编码的耗时和帧率，重启流水线后继续累计
+        self.dropped = 0                    # 之前的流水线丢弃的帧数
+        self.corrupt = 0                    # 相机输出的JPEG数据不能解码的帧数
+
+    # 设置使用的相机以及分辨率，正在采集时用新的参数重新打开相机
+    def configure(self, cam_idx: int, width: int, height: int):
+        with self.lock:
+            self.cam_idx = cam_idx
+            self.width = width
+            self.height = height
+            if self.pipeline is not None:
+                self._stop()
+                self._start()
+
+    def is_running(self) -> bool:
+        return self.pipeline is not None
+
+    def start(self) -> bool:
+        with self.lock:
+            if self.cam_idx < 0:
+                return False
+            if self.pipeline is None:
+                self._start()
+        return True
+
+    def stop(self):
+        with self.lock:
+            self._stop()
+
+    def _start(self):
+        with self.tile_lock:    # 新的流水线从1开始重新编号帧序号
+            self.tile_encoders.clear()
+        self.pipeline = FramePipeline(self.open_capture, self.encode_frame, self.encoder_num,
+                                      self.queue_size, self.drop_policy, self.stream_id, self.stats,
+                                      self.release_capture)
+        self.pipeline.start()
+        self.outputThread = threading.Thread(target=self.outputThread_func,
+                                             args=(self.pipeline,), daemon=True)
+        self.outputThread.start()
+
+    def _stop(self):
+        if self.pipeline is None:
+            return
+        self.pipeline.stop()
+        self.outputThread.join()
+        self.dropped += self.pipeline.dropped()
+        self.pipeline = None
+        self.outputThread = None
+        self.close_shm()
+
+    def close_shm(self):
+        with self.shm_lock:
+            rings = self.retired_shm_rings
+            if self.shm_ring is not None:
+                rings.append(self.shm_ring)
+            self.shm_ring = None
+            self.retired_shm_rings = []
+        for ring in rings:
+            ring.close()
+
+    # 把图像写入共享内存，返回通知数据; 图像大于槽位时换一块更大的共享内存
+    # 写入时持有shm_lock，close_shm()不会在写入过程中关闭共享内存
+    def write_shm(self, image, seq: int) -> bytes:
+        with self.shm_lock:
+            ring = self.shm_ring
+            if ring is None or not ring.fits(image.nbytes):
+                if ring is not None:
+                    ring.unlink()
+                    self.retired_shm_rings.append(ring)
+                ring = ShmFrameRing(self.stream_id, image.nbytes, self.shm_slot_num)
+                self.shm_ring = ring
+            return ring.write(image, seq)
+
+    # 从相机池中取出(或打开)并配置相机，在流水线的采集线程中调用
+    def open_capture(self):
+        entry = self.capture_pool.acquire(self.cam_idx, self.width, self.height)
+        self.pooled = entry
+        cap = entry.cap
+        if entry.configured:    # 新打开或分辨率改变的相机，重新检查其实际输出
+            # 相机实际输出的尺寸，直接转发JPEG数据时不解码，用它填写帧头
+            entry.meta['frame_size'] = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            entry.meta['passthrough'] = False
+            entry.meta['probed'] = False
+        if self.passthrough and not entry.meta['probed']:
+            entry.meta['passthrough'] = self.enable_raw_output(cap)
+            entry.meta['probed'] = True
+        elif not self.passthrough and entry.meta['passthrough']:
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            entry.meta['passthrough'] = False
+            entry.meta['probed'] = False
+        self.frame_size = entry.meta['frame_size']
+        self.passthrough_active = entry.meta['passthrough']
+        return cap
+
+    # 采集结束时把相机归还给相机池
+    def release_capture(self, cap):
+        entry = self.pooled
+        self.pooled = None
+        if entry is None or entry.cap is not cap:
+            cap.release()
+            return
+        self.capture_pool.release(entry)
+
+    """
+    设置CAP_PROP_CONVERT_RGB=0后，MJPG相机的read()直接返回JPEG数据(1xN的uint8数组)
+    读一帧检查，若后端不能提供原始数据，则恢复为解码输出
+    """
+    def enable_raw_output(self, cap) -> bool:
+        if not cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+            return False
+        ret, buf = cap.read()
+        if ret and is_jpeg_buffer(buf):
+            print('stream %d: mjpeg passthrough' % self.stream_id)
+            return True
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        return False
+
+    # 编码一帧图像，在流水线的编码线程中调用
+    def encode_frame(self, frame):
+        raw_jpeg = frame.image if is_jpeg_buffer(frame.image) else None
+        image = None if raw_jpeg is not None else frame.image
+        frame.width, frame.height = self.frame_size
+        frame.pixfmt = PIXFMT_BGR
+        scaled = {}     # (roi, scale) -> 裁剪和缩放后的图像
+        corrupt = False # 相机输出的JPEG数据不能解码
+        codecs = self.get_codecs(self.stream_id)
+        for codec in codecs:
+            t0 = time.perf_counter()
+            if raw_jpeg is not None and codec.is_default_jpeg():    # 相机输出的JPEG数据，直接转发
+                frame.payloads[codec] = raw_jpeg.reshape(-1)
+                frame.encode_durs[codec] = 0.0
+                continue
+            if corrupt:
+                continue
+            if image is None:   # 需要其他编码参数时才解码相机的JPEG数据, 且只解码一次
+                image = cv2.imdecode(raw_jpeg, cv2.IMREAD_COLOR)
+                if image is None:   # 数据损坏或不完整，只原样转发给默认jpeg的订阅者，其他订阅者跳过这一帧
+                    print('stream %d: cannot decode camera jpeg, frame %d' % (self.stream_id, frame.seq))
+                    corrupt = True
+                    with self.stats.lock:   # 在多个编码线程中调用
+                        self.corrupt += 1
+                    continue
+            if codec.codec == 'shm':
+                frame.payloads[codec] = self.write_shm(image, frame.seq)
+                frame.encode_durs[codec] = time.perf_counter() - t0
+                continue
+            src = image
+            if codec.transforms():      # roi和缩放比例相同的订阅者共用一次裁剪和缩放
+                src = scaled.get((codec.roi, codec.scale))
+                if src is None:
+                    src = scaled[(codec.roi, codec.scale)] = codec.transform(image)
+                frame.sizes[codec] = (src.shape[1], src.shape[0])
+            if codec.codec == 'tiles':
+                payload = self.get_tile_encoder(codec).encode(src, frame.seq)
+                if payload is None:     # 比已编码的帧更旧，使用该编码参数的订阅者跳过这一帧
+                    continue
+                frame.payloads[codec] = payload
+            else:
+                frame.payloads[codec] = codec.encode(src)
+            frame.encode_durs[codec] = time.perf_counter() - t0
+        if len(self.tile_encoders) > 0:
+            self.prune_tile_encoders(codecs)
+        if image is not None:
+            frame.height, frame.width = image.shape[:2]
+            frame.pixfmt = PIXFMT_GRAY if image.ndim == 2 else PIXFMT_BGR
+
+    # 编码参数对应的分块编码器，保存着上一次编码的块，因此每组参数一个
+    def get_tile_encoder(self, codec) -> TileEncoder:
+        with self.tile_lock:
+            encoder = self.tile_encoders.get(codec)
+            if encoder is None:
+                encoder = self.tile_encoders[codec] = TileEncoder(codec.imwrite_params())
+            return encoder
+
+    # 释放已经没有订阅者使用的分块编码器
+    def prune_tile_encoders(self, codecs):
+        with self.tile_lock:
+            for codec in [c for c in self.tile_encoders if c not in codecs]:
+                del self.tile_encoders[codec]
+
+    def get_stats(self) -> dict:
+        stats = self.stats.to_dict()
+        pipeline = self.pipeline
+        stats['running'] = pipeline is not None
+        stats['cam_idx'] = self.cam_idx
+        stats['size'] = list(self.frame_size)
+        stats['passthrough'] = self.passthrough_active
+        stats['corrupt'] = self.corrupt
+        if pipeline is not None:
+            stats['queues'] = pipeline.queue_stats()
+            stats['capture_error'] = pipeline.capture_error
+            stats['dropped'] = self.dropped + pipeline.dropped()
+        else:
+            stats['dropped'] = self.dropped
+        return stats
+
+    # 将流水线输出的图像交给on_frame，流水线停止时get()立即返回None
+    def outputThread_func(self, pipeline: FramePipeline):
+        while pipeline.running.is_set():
+            frame = pipeline.get()
+            if frame is None:
+                continue
+            self.on_frame(frame)
+        print('stream %d: exit from outputThread_func' % self.stream_id)
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+
+
+"""
+池中的一个相机，meta用于保存与该相机配置相关的信息(如是否能直接输出JPEG数据)，
+重新配置分辨率后由使用者重新填写
+"""
+class PooledCapture:
+    def __init__(self, cam_idx: int, cap) -> None:
+        self.cam_idx = cam_idx
+        self.cap = cap
+        self.size = None            # 当前设置的(宽, 高)
+        self.configured = False     # 刚打开或刚修改过分辨率，使用者需要重新检查相机的输出
+        self.meta = {}
+        self.idle_since = 0.0
+
+
+"""
+相机(VideoCapture)池：停止采集后相机不关闭，保持打开和配置好的状态，再次开始采集(包括客户端重新连接后)时直接使用。
+DirectShow打开相机并设置分辨率/FOURCC需要数秒，使用池后start_capture几乎是立即生效的。
+    max_open:     同时打开的相机个数上限，超过时关闭最久未使用的空闲相机
+    idle_timeout: 空闲超过该时间(秒)的相机被关闭，0表示停止采集后立即关闭(即不使用池)
+只有分辨率改变时，在已打开的相机上直接修改分辨率，不重新打开。
+capture_factory(cam_idx)返回一个类似cv2.VideoCapture的对象
+"""
+class CapturePool:
+    def __init__(self, capture_factory, max_open: int = 4, idle_timeout: float = 60.0) -> None:
+        self.capture_factory = capture_factory
+        self.max_open = max(1, max_open)
+        self.idle_timeout = idle_timeout
+        self.idle = OrderedDict()       # id(PooledCapture) -> PooledCapture, 按释放时间排序(LRU)
+        self.in_use = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.reaper = None              # 关闭超时空闲相机的线程，有空闲相机时才启动
+        self.opened = 0                 # 统计: 打开相机的次数
+        self.reused = 0                 # 统计: 复用空闲相机的次数
+
+    # 设置分辨率以及FOURCC
+    @staticmethod
+    def configure(cap, width: int, height: int):
+        """
+        opencv在获取相机图像时发现一个问题，即常规的cap=VideoCapture(0)不能获得1280x960分辨率的图像。
+        单独只改用CAP_DSHOW后端会出现低帧率的情况，还需要设置CAP_PROP_FOURCC。
+        """
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
+
+    # 取出cam_idx对应的相机并设置为给定的分辨率，没有空闲的相机时打开一个
+    def acquire(self, cam_idx: int, width: int, height: int) -> PooledCapture:
+        to_close = []
+        with self.cond:
+            entry = None
+            # 优先选择分辨率相同的空闲相机
+            for key, idle in reversed(self.idle.items()):
+                if idle.cam_idx == cam_idx and (entry is None or idle.size == (width, height)):
+                    entry = idle
+                    if idle.size == (width, height):
+                        break
+            if entry is not None:
+                del self.idle[id(entry)]
+                self.reused += 1
+            else:
+                # 为新打开的相机腾出位置
+                while len(self.idle) > 0 and len(self.idle) + self.in_use >= self.max_open:
+                    to_close.append(self.idle.popitem(last=False)[1])
+                self.opened += 1
+            self.in_use += 1
+        for old in to_close:
+            self.release_device(old)
+        if entry is None:
+            try:
+                entry = PooledCapture(cam_idx, self.capture_factory(cam_idx))
+            except Exception:
+                with self.cond:
+                    self.in_use -= 1
+                raise
+        elif hasattr(entry.cap, 'grab'):   # 丢弃空闲期间缓存在驱动中的旧图像
+            entry.cap.grab()
+        if entry.size != (width, height):
+            self.configure(entry.cap, width, height)
+            entry.size = (width, height)
+            entry.configured = True
+            entry.meta = {}
+        else:
+            entry.configured = False
+        return entry
+
+    # 停止采集时归还相机
+    def release(self, entry: PooledCapture):
+        with self.cond:
+            self.in_use -= 1
+            if self.closed or self.idle_timeout <= 0 or not entry.cap.isOpened():
+                keep = False
+            else:
+                keep = True
+                entry.idle_since = time.monotonic()
+                self.idle[id(entry)] = entry
+                if self.reaper is None:
+                    self.reaper = threading.Thread(target=self.reaperThread_func, daemon=True)
+                    self.reaper.start()
+                self.cond.notify_all()
+        if not keep:
+            self.release_device(entry)
+
+    @staticmethod
+    def release_device(entry: PooledCapture):
+        try:
+            entry.cap.release()
+        except Exception as e:
+            print('release camera %d err: %s' % (entry.cam_idx, str(e)))
+
+    # 关闭空闲超时的相机，只在最早的超时时刻醒来
+    def reaperThread_func(self):
+        while True:
+            with self.cond:
+                expired = []
+                while not self.closed:
+                    now = time.monotonic()
+                    while len(self.idle) > 0:
+                        entry = next(iter(self.idle.values()))
+                        if now - entry.idle_since < self.idle_timeout:
+                            break
+                        expired.append(self.idle.popitem(last=False)[1])
+                    if len(expired) > 0:
+                        break
+                    if len(self.idle) == 0:
+                        self.cond.wait()
+                    else:
+                        entry = next(iter(self.idle.values()))
+                        self.cond.wait(entry.idle_since + self.idle_timeout - now)
+                if self.closed and len(expired) == 0:
+                    return
+            for entry in expired:
+                print('camera %d idle timeout, closed' % entry.cam_idx)
+                self.release_device(entry)
+
+    def get_stats(self) -> dict:
+        with self.cond:
+            return {'idle': [entry.cam_idx for entry in self.idle.values()], 'in_use': self.in_use,
+                    'max_open': self.max_open, 'idle_timeout': self.idle_timeout,
+                    'opened': self.opened, 'reused': self.reused}
+
+    # 关闭所有空闲的相机，正在使用的相机在归还时关闭
+    def close(self):
+        with self.cond:
+            self.closed = True
+            idle = list(self.idle.values())
+            self.idle.clear()
+            self.cond.notify_all()
+        for entry in idle:
+            self.release_device(entry)
@@ -0,0 +1,107 @@
+import selectors
+import socket
+import threading
+from collections import deque
+
+
+"""
+基于selectors的单线程事件循环，服务端的所有控制连接和数据连接都在这一个线程中收发(非阻塞)
+    register(sock, events, handler): socket就绪时在循环线程中调用handler(mask)
+    call_soon_threadsafe(func, *args): 从其他线程(采集流水线、命令处理线程)把func交给循环线程执行，
+        通过socketpair唤醒select，不需要轮询
+"""
+class EventLoop:
+    def __init__(self) -> None:
+        self.selector = selectors.DefaultSelector()
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ, self.on_wakeup)
+        self.callbacks = deque()
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.thread_id = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def close(self):
+        for key in list(self.selector.get_map().values()):
+            if key.fileobj is not self.wake_r:
+                key.fileobj.close()
+        self.selector.close()
+        self.wake_r.close()
+        self.wake_w.close()
+
+    def in_loop(self) -> bool:
+        return threading.get_ident() == self.thread_id
+
+    def register(self, sock: socket.socket, events: int, handler):
+        self.selector.register(sock, events, handler)
+
+    def modify(self, sock: socket.socket, events: int, handler):
+        self.selector.modify(sock, events, handler)
+
+    def unregister(self, sock: socket.socket):
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    # 在循环线程中执行func；循环未运行时(已停止)直接在当前线程中执行
+    def call_soon_threadsafe(self, func, *args):
+        if not self.running:
+            func(*args)
+            return
+        with self.lock:
+            need_wakeup = len(self.callbacks) == 0 and not self.in_loop()
+            self.callbacks.append((func, args))
+        if need_wakeup:     # 队列中已有回调时循环已经被唤醒过了
+            self.wakeup()
+
+    def wakeup(self):
+        try:
+            self.wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def on_wakeup(self, mask: int):
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def run_callbacks(self):
+        with self.lock:
+            callbacks = self.callbacks
+            self.callbacks = deque()
+        for func, args in callbacks:
+            try:
+                func(*args)
+            except Exception as e:
+                print('event loop callback err: %s' % str(e))
+
+    def run(self):
+        self.thread_id = threading.get_ident()
+        print('event loop started')
+        while self.running:
+            timeout = 0 if len(self.callbacks) > 0 else None
+            for key, mask in self.selector.select(timeout):
+                try:
+                    key.data(mask)
+                except Exception as e:
+                    print('event loop handler err: %s' % str(e))
+            self.run_callbacks()
+        self.run_callbacks()
+        print('event loop exit')
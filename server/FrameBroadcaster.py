@@ -0,0 +1,281 @@
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+from FramePipeline import BoundedQueue
+from FrameProtocol import pack_header
+from FrameCodec import CodecConfig, DEFAULT_CODEC
+from StageStats import StageStats
+from TileEncoder import TileFrame
+
+SNDBUF_SIZE = 1024*1024
+ADAPTIVE_SNDBUF_SIZE = 128*1024
+
+
+"""
+一个数据流订阅者(即一个data_socket客户端连接)
+每个订阅者有自己的发送队列，队列满时丢弃最旧的帧，
+因此慢速的订阅者只会丢自己的帧，不会拖慢其他订阅者以及采集/编码。
+发送在事件循环(EventLoop)中以非阻塞方式进行，不占用单独的线程：
+push()把帧放入队列后唤醒事件循环，socket发送缓冲区满时等待可写事件再继续发送。
+"""
+class DataSubscriber:
+    def __init__(self, cli_socket: socket.socket, addr, queue_size: int = 2, loop=None) -> None:
+        self.socket = cli_socket
+        self.addr = addr                    # (ip, port)
+        self.loop = loop
+        self.queue = BoundedQueue(queue_size, 'drop_oldest')
+        self.active = True                  # 是否接收图像, 由subscribe/unsubscribe命令控制
+        self.protocol = 0                   # 帧头格式，见WireFormat
+        self.streams = None                 # 订阅的视频流编号集合，None表示全部
+        self.codec = DEFAULT_CODEC          # 编码参数，由set_codec命令设置(旧协议只能使用默认的jpeg)
+        self.prev_codec = None              # 自适应控制改变编码参数前的参数，队列中的帧可能只有该参数的编码结果
+        self.adaptive = None                # AdaptiveController，由set_adaptive命令设置
+        self.tile_state = {}                # stream_id -> (分块编码器的id, 上一次发送的帧序号)
+        self.closed = False
+        self.sent = 0                       # 已发送的帧数
+        self.stats = StageStats()           # 发送耗时、帧率和字节率
+        self.pending = deque()              # 当前帧尚未发送的部分(memoryview)
+        self.pending_bytes = 0
+        self.send_t0 = 0.0
+        self.send_frame = None              # 正在发送的帧
+        self.writing = False                # 是否在等待可写事件
+        self.flush_scheduled = False        # 是否已经请求事件循环发送
+
+    # 在事件循环线程中调用
+    def start(self):
+        self.socket.setblocking(False)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SNDBUF_SIZE)
+        self.loop.register(self.socket, selectors.EVENT_READ, self.on_event)
+
+    # 放入一帧待发送的图像，所有订阅者共享同一个frame对象，不做拷贝
+    def push(self, frame):
+        if not self.wants(frame.stream_id):
+            return
+        self.queue.put(frame)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon_threadsafe(self.flush)
+
+    # 是否需要接收视频流stream_id的图像
+    def wants(self, stream_id: int) -> bool:
+        if not self.active or self.closed:
+            return False
+        if self.protocol == 0 and stream_id != 0:     # 旧协议无法区分视频流
+            return False
+        return self.streams is None or stream_id in self.streams
+
+    def set_active(self, active: bool):
+        self.active = active
+        if not active:
+            self.queue.clear()
+
+    def dropped(self) -> int:
+        return self.queue.dropped
+
+    """
+    设置固定的编码参数，同时停止自适应控制
+    """
+    def set_codec(self, codec):
+        self.adaptive = None
+        self.prev_codec = None
+        self.codec = codec
+
+    """
+    只发送采集图像中roi([x, y, 宽, 高]，None为整幅图像)区域，按scale缩小，其他编码参数不变，下一帧即生效
+    自适应控制时scale由控制器决定，只修改roi
+    """
+    def set_roi(self, roi, scale=None) -> CodecConfig:
+        adaptive = self.adaptive
+        if adaptive is not None:
+            codec = adaptive.rebase(adaptive.base.replace(roi=roi))
+        else:
+            codec = self.codec.replace(roi=roi, scale=scale)
+        self.prev_codec = None      # 旧区域的图像不再发送
+        self.codec = codec
+        return codec
+
+    """
+    启用(controller为AdaptiveController)或停止(None)自适应控制
+    启用时减小socket发送缓冲区，使带宽不足能尽快表现为发送队列的背压，而不是积压在内核中的延迟
+    """
+    def set_adaptive(self, controller):
+        self.adaptive = controller
+        if controller is None:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SNDBUF_SIZE)
+        else:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, ADAPTIVE_SNDBUF_SIZE)
+            self.prev_codec = self.codec
+            self.codec = controller.codec
+
+    def get_stats(self) -> dict:
+        stats = self.stats.to_dict()
+        stats['addr'] = '%s:%d' % (self.addr[0], self.addr[1])
+        stats['active'] = self.active
+        stats['protocol'] = self.protocol
+        stats['codec'] = self.codec.to_dict()
+        adaptive = self.adaptive
+        stats['adaptive'] = {'enabled': False} if adaptive is None else adaptive.to_dict()
+        stats['streams'] = None if self.streams is None else sorted(self.streams)
+        stats['sent'] = self.sent
+        stats['dropped'] = self.dropped()
+        stats['queue'] = len(self.queue)
+        return stats
+
+    # 可以在任意线程中调用，socket在事件循环线程中关闭
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.close()
+        self.loop.call_soon_threadsafe(self.close_socket)
+
+    def close_socket(self):
+        self.loop.unregister(self.socket)
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+        self.pending.clear()
+        print('data subscriber %s closed.' % str(self.addr))
+
+    def on_event(self, mask: int):
+        if mask & selectors.EVENT_READ:     # 客户端不会在数据流上发送数据，可读表示连接已关闭
+            try:
+                data = self.socket.recv(4096)
+            except BlockingIOError:
+                data = b'-'
+            except OSError:
+                data = b''
+            if len(data) == 0:
+                self.close()
+                return
+        if mask & selectors.EVENT_WRITE:
+            self.flush()
+
+    # 取出下一帧，准备好帧头和数据，返回False表示队列已空
+    def next_frame(self) -> bool:
+        while True:
+            frame = self.queue.get(timeout=0)
+            if frame is None:
+                return False
+            codec = self.codec
+            send_bytes = frame.payloads.get(codec)
+            if send_bytes is None and self.prev_codec is not None:     # 自适应控制刚刚改变了参数
+                codec = self.prev_codec
+                send_bytes = frame.payloads.get(codec)
+            if send_bytes is None:      # 编码参数刚刚改变，该帧没有对应的编码结果
+                continue
+            if isinstance(send_bytes, TileFrame):   # 分块增量传输，只发送该订阅者上一帧之后变化的块
+                state = self.tile_state.get(frame.stream_id)
+                last_seq = state[1] if state is not None and state[0] == send_bytes.encoder_id else None
+                send_bytes = send_bytes.build(last_seq)
+                self.tile_state[frame.stream_id] = (frame.payloads[codec].encoder_id, frame.seq)
+            header = pack_header(self.protocol, frame, send_bytes.__len__(), codec.codec_id(),
+                                 frame.encode_durs.get(codec, 0.0), frame.sizes.get(codec))
+            self.pending.append(memoryview(header))
+            self.pending.append(memoryview(send_bytes).cast('B'))
+            self.pending_bytes = len(header) + len(send_bytes)
+            self.send_t0 = time.perf_counter()
+            self.send_frame = frame
+            return True
+
+    # 在事件循环线程中发送队列中的帧，直到队列为空或socket发送缓冲区已满
+    def flush(self):
+        self.flush_scheduled = False
+        if self.closed:
+            return
+        adaptive = self.adaptive
+        if adaptive is not None:
+            codec = adaptive.update(self.dropped(), len(self.queue))
+            if codec is not None and self.adaptive is adaptive:    # 期间没有被set_codec停止
+                self.prev_codec = self.codec
+                self.codec = codec
+        try:
+            while True:
+                if len(self.pending) == 0:
+                    if not self.next_frame():
+                        break
+                view = self.pending[0]
+                n = self.socket.send(view)
+                if n < len(view):
+                    self.pending[0] = view[n:]
+                    continue
+                self.pending.popleft()
+                if len(self.pending) == 0:      # 一帧发送完成
+                    self.stats.hist('send').record(time.perf_counter() - self.send_t0)
+                    self.stats.rate('send').add()
+                    self.stats.rate('bytes').add(self.pending_bytes)
+                    self.sent += 1
+                    if self.adaptive is not None:
+                        self.adaptive.on_sent(self.send_frame)
+                    self.send_frame = None
+        except BlockingIOError:     # 发送缓冲区已满，等待可写事件
+            self.set_writing(True)
+            return
+        except OSError as e:     # 发送通信错误，关闭该连接
+            print('data_socket %s send err: %s' % (str(self.addr), str(e)))
+            self.close()
+            return
+        self.set_writing(False)
+
+    def set_writing(self, writing: bool):
+        if writing == self.writing:
+            return
+        self.writing = writing
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+        self.loop.modify(self.socket, events, self.on_event)
+
+
+# 将编码一次的图像分发给所有订阅者
+class FrameBroadcaster:
+    def __init__(self) -> None:
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def add(self, subscriber: DataSubscriber):
+        with self.lock:
+            self.subscribers.append(subscriber)
+        subscriber.start()
+
+    def remove(self, subscriber: DataSubscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+        subscriber.close()
+
+    # 根据地址查找订阅者
+    def find(self, addr):
+        with self.lock:
+            for subscriber in self.subscribers:
+                if subscriber.addr == addr and not subscriber.closed:
+                    return subscriber
+        return None
+
+    # 视频流stream_id当前需要的编码参数集合
+    def codecs_for(self, stream_id: int) -> set:
+        with self.lock:
+            return {s.codec for s in self.subscribers if s.wants(stream_id)}
+
+    def broadcast(self, frame):
+        with self.lock:
+            # 顺便清理已关闭的订阅者
+            self.subscribers = [s for s in self.subscribers if not s.closed]
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.push(frame)
+
+    def get_stats(self) -> list:
+        with self.lock:
+            subscribers = list(self.subscribers)
+        return [s.get_stats() for s in subscribers if not s.closed]
+
+    def close_all(self):
+        with self.lock:
+            subscribers = self.subscribers
+            self.subscribers = []
+        for subscriber in subscribers:
+            subscriber.close()
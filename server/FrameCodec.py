@@ -0,0 +1,157 @@
+import cv2
+import numpy as np
+
+from WireFormat import CODEC_JPEG, CODEC_PNG, CODEC_WEBP, CODEC_RAW, CODEC_SHM, CODEC_TILES, RAW_HEADER
+
+
+"""
+图像的编码参数，由客户端通过set_codec命令设置
+    codec:       'jpeg' | 'png' | 'webp' | 'raw'(不压缩的BGR数据，适合同一台机器上带宽充足的连接)
+                 | 'shm'(不压缩的BGR数据写入共享内存，由set_transport命令设置，仅用于同一台机器)
+                 | 'tiles'(分块增量传输，只发送变化的块，适合基本静止的场景，见TileEncoder)
+    quality:     jpeg/webp/tiles的质量(1~100)，None表示OpenCV的默认值
+    subsampling: jpeg/tiles的色度采样 '444' | '422' | '420'，None表示默认值
+    optimize:    jpeg是否优化霍夫曼表(数据更小，编码稍慢)
+    compression: png的压缩级别(0~9)，None表示默认值
+    roi:         [x, y, 宽, 高]，只编码采集图像中的该区域(超出图像的部分被裁掉)，None表示整幅图像，由set_roi命令设置
+    scale:       输出图像相对于采集图像(或roi)的缩放比例(0~1]，None表示不缩放，
+                 由set_roi命令或自适应控制(AdaptiveController)设置
+裁剪和缩放在编码之前进行，编码耗时、传输的数据量以及客户端的解码耗时都相应减少。
+参数相同的订阅者共享同一份编码结果，每一帧对每一组参数只编码一次。
+"""
+
+CODEC_IDS = {'jpeg': CODEC_JPEG, 'png': CODEC_PNG, 'webp': CODEC_WEBP, 'raw': CODEC_RAW, 'shm': CODEC_SHM,
+             'tiles': CODEC_TILES}
+SUBSAMPLINGS = {'444': 0x111111, '422': 0x211111, '420': 0x221111}
+
+
+class CodecConfig:
+    def __init__(self, codec: str = 'jpeg', quality=None, subsampling=None, optimize: bool = False,
+                 compression=None, scale=None, roi=None) -> None:
+        if codec not in CODEC_IDS:
+            raise ValueError('unknown codec: %s' % codec)
+        if quality is not None and not 1 <= int(quality) <= 100:
+            raise ValueError('quality must be in 1~100')
+        if subsampling is not None and str(subsampling) not in SUBSAMPLINGS:
+            raise ValueError('subsampling must be one of 444/422/420')
+        if compression is not None and not 0 <= int(compression) <= 9:
+            raise ValueError('compression must be in 0~9')
+        if scale is not None and not 0 < float(scale) <= 1:
+            raise ValueError('scale must be in (0, 1]')
+        if roi is not None:
+            if len(roi) != 4 or int(roi[0]) < 0 or int(roi[1]) < 0 or int(roi[2]) <= 0 or int(roi[3]) <= 0:
+                raise ValueError('roi must be [x, y, width, height] with x, y >= 0 and width, height > 0')
+        if (scale is not None or roi is not None) and codec == 'shm':
+            raise ValueError('shm frames cannot be cropped or scaled')
+        self.codec = codec
+        self.quality = None if quality is None else int(quality)
+        self.subsampling = None if subsampling is None else str(subsampling)
+        self.optimize = bool(optimize)
+        self.compression = None if compression is None else int(compression)
+        self.scale = None if scale is None or float(scale) == 1 else float(scale)
+        self.roi = None if roi is None else tuple(int(v) for v in roi)
+        self.key = (self.codec, self.quality, self.subsampling, self.optimize, self.compression, self.scale,
+                    self.roi)
+
+    # 根据set_codec命令创建
+    @staticmethod
+    def from_cmd(cmd: dict):
+        return CodecConfig(cmd.get('codec', 'jpeg'), cmd.get('quality'), cmd.get('subsampling'),
+                           cmd.get('optimize', False), cmd.get('compression'), cmd.get('scale'),
+                           cmd.get('roi'))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CodecConfig) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __repr__(self) -> str:
+        return 'CodecConfig%s' % str(self.key)
+
+    def to_dict(self) -> dict:
+        return {'codec': self.codec, 'quality': self.quality, 'subsampling': self.subsampling,
+                'optimize': self.optimize, 'compression': self.compression, 'scale': self.scale,
+                'roi': None if self.roi is None else list(self.roi)}
+
+    # 修改部分参数，返回新的CodecConfig
+    def replace(self, **kwargs):
+        params = self.to_dict()
+        params.update(kwargs)
+        return CodecConfig(**params)
+
+    def codec_id(self) -> int:
+        return CODEC_IDS[self.codec]
+
+    # 是否可以直接转发相机输出的JPEG数据
+    def is_default_jpeg(self) -> bool:
+        return self.codec == 'jpeg' and self.quality is None and self.subsampling is None \
+            and not self.optimize and self.scale is None and self.roi is None
+
+    # 是否需要裁剪或缩放
+    def transforms(self) -> bool:
+        return self.scale is not None or self.roi is not None
+
+    # roi限制在图像范围内，返回(x0, y0, x1, y1)
+    def crop_rect(self, width: int, height: int) -> tuple:
+        if self.roi is None:
+            return 0, 0, width, height
+        x, y, w, h = self.roi
+        x0, y0 = min(x, width - 1), min(y, height - 1)
+        return x0, y0, min(x + w, width), min(y + h, height)
+
+    # 采集图像为width x height时输出图像的(宽, 高)
+    def output_size(self, width: int, height: int) -> tuple:
+        x0, y0, x1, y1 = self.crop_rect(width, height)
+        width, height = x1 - x0, y1 - y0
+        if self.scale is None:
+            return width, height
+        return max(1, int(round(width * self.scale))), max(1, int(round(height * self.scale)))
+
+    def imwrite_params(self) -> list:
+        params = []
+        if self.codec in ('jpeg', 'tiles'):
+            if self.quality is not None:
+                params += [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+            if self.subsampling is not None and hasattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR'):
+                params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, SUBSAMPLINGS[self.subsampling]]
+            if self.optimize:
+                params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        elif self.codec == 'webp':
+            if self.quality is not None:
+                params += [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        elif self.codec == 'png':
+            if self.compression is not None:
+                params += [cv2.IMWRITE_PNG_COMPRESSION, self.compression]
+        return params
+
+    # 按roi裁剪(无拷贝的视图)后按scale缩放，都不需要时返回原图像
+    def transform(self, image):
+        height, width = image.shape[:2]
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.crop_rect(width, height)
+            image = image[y0:y1, x0:x1]
+        if self.scale is None:
+            return image
+        # 输出尺寸按裁剪前的图像尺寸计算，output_size中已经包含了roi
+        return cv2.resize(image, self.output_size(width, height), interpolation=cv2.INTER_AREA)
+
+    # 编码一帧BGR图像(已经裁剪和缩放过)
+    def encode(self, image):
+        if self.codec == 'shm':
+            raise ValueError('shm frames are written by CameraStream')
+        if self.codec == 'tiles':
+            raise ValueError('tile frames are encoded by TileEncoder')
+        if self.codec == 'raw':
+            h, w = image.shape[:2]
+            c = 1 if image.ndim == 2 else image.shape[2]
+            payload = bytearray(RAW_HEADER.size + image.nbytes)
+            RAW_HEADER.pack_into(payload, 0, h, w, c)
+            np.frombuffer(payload, np.uint8, offset=RAW_HEADER.size).reshape(image.shape)[...] = image
+            return payload
+        ext = {'jpeg': '.jpg', 'png': '.png', 'webp': '.webp'}[self.codec]
+        result = cv2.imencode(ext, image, self.imwrite_params())[1]     # result为压缩后的numpy数组
+        return result.reshape(-1)
+
+
+DEFAULT_CODEC = CodecConfig()
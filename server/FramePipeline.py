@@ -0,0 +1,268 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+from StageStats import StageStats
+
+
+"""
+相机图像的流水线：采集线程 -> 编码线程池 -> 发送端
+采集与编码、编码与发送之间用有界队列连接，采集、编码和发送可以同时进行。
+cv2.imencode在编码时会释放GIL，因此多个编码线程可以利用多核。
+"""
+
+
+"""
+有界队列，队列满时的策略:
+'drop_oldest' -> 丢弃最旧的元素后放入新元素（适合实时视频，永远发送最新的图像）
+'block'       -> 阻塞直到队列有空位
+"""
+class BoundedQueue:
+    def __init__(self, maxsize: int, policy: str = 'drop_oldest') -> None:
+        if policy not in ('drop_oldest', 'block'):
+            raise ValueError('unknown queue policy: %s' % policy)
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0            # 因队列满而被丢弃的元素个数
+
+    # 放入一个元素，返回被丢弃的元素（没有则返回None）
+    def put(self, item):
+        dropped = None
+        with self.cond:
+            if self.policy == 'block':
+                self.cond.wait_for(lambda: len(self.items) < self.maxsize or self.closed)
+                if self.closed:
+                    return item
+            elif len(self.items) >= self.maxsize:
+                dropped = self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify_all()
+        return dropped
+
+    # 取出一个元素，超时或队列关闭时返回None
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: len(self.items) > 0 or self.closed, timeout):
+                return None
+            if len(self.items) == 0:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def clear(self):
+        with self.cond:
+            self.items.clear()
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.items.clear()
+            self.cond.notify_all()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+# 在流水线中传递的一帧图像
+class Frame:
+    def __init__(self, seq: int, image, capture_ts: float, stream_id: int = 0) -> None:
+        self.stream_id = stream_id      # 所属的视频流
+        self.seq = seq                  # 帧序号，由采集线程分配
+        self.image = image              # (h,w,3)的numpy数组
+        self.capture_ts = capture_ts    # 采集时间, time.time()
+        self.payloads = {}              # CodecConfig -> 编码后待发送的数据
+        self.encode_durs = {}           # CodecConfig -> 编码耗时(秒)
+        self.sizes = {}                 # CodecConfig -> 缩放后的(宽, 高)，只记录缩放过的编码参数
+        self.width = 0                  # 图像尺寸以及像素格式，在编码时填写
+        self.height = 0
+        self.pixfmt = 0
+
+
+"""
+open_capture: 无参数的函数，返回一个类似cv2.VideoCapture的对象(read()/release())
+release_capture: release_capture(cap)，采集结束时调用，默认为cap.release()，使用相机池时把相机归还给池
+encode:       encode(frame)，将frame.image编码后写入frame.payloads
+encoder_num:  编码线程的个数
+queue_size:   采集队列的长度，满时按policy处理
+stream_id:    写入每一帧的视频流编号
+stats:        StageStats, 记录采集和编码的耗时及帧率
+相机读取失败(设备出错或被拔出)时等待retry_interval秒后重试，连续失败reopen_after次后关闭并重新打开相机；
+打开失败时同样等待后重试，间隔逐次加倍(最长max_retry_interval秒)。最近的错误记录在capture_error中，恢复后清除。
+"""
+class FramePipeline:
+    def __init__(self, open_capture, encode, encoder_num: int = 0, queue_size: int = 2,
+                 policy: str = 'drop_oldest', stream_id: int = 0, stats: StageStats = None,
+                 release_capture=None, retry_interval: float = 0.1, reopen_after: int = 10,
+                 max_retry_interval: float = 2.0) -> None:
+        if encoder_num <= 0:
+            encoder_num = min(4, os.cpu_count() or 1)
+        self.open_capture = open_capture
+        self.release_capture = release_capture if release_capture is not None else lambda cap: cap.release()
+        self.encode = encode
+        self.encoder_num = encoder_num
+        self.stream_id = stream_id
+        self.stats = stats if stats is not None else StageStats()
+        self.capture_queue = BoundedQueue(queue_size, policy)
+        # 已提交编码的帧(future)按采集顺序排队，其长度限制了同时编码的帧数
+        self.encoded_queue = BoundedQueue(encoder_num * 2, 'block')
+        self.executor = None
+        self.encode_failed = 0      # 编码出错而丢弃的帧数
+        self.retry_interval = retry_interval
+        self.reopen_after = max(1, reopen_after)
+        self.max_retry_interval = max_retry_interval
+        self.capture_failed = 0     # 读取或打开相机失败的次数
+        self.reopened = 0           # 因连续读取失败而重新打开相机的次数
+        self.capture_error = None   # 最近一次采集错误，正常采集时为None
+        self.running = threading.Event()
+        self.stopping = threading.Event()   # stop()时唤醒等待重试的采集线程
+        self.captureThread = None
+        self.dispatchThread = None
+
+    def start(self):
+        self.stopping.clear()
+        self.running.set()
+        self.executor = ThreadPoolExecutor(max_workers=self.encoder_num)
+        self.captureThread = threading.Thread(target=self.captureThread_func, daemon=True)
+        self.dispatchThread = threading.Thread(target=self.dispatchThread_func, daemon=True)
+        self.captureThread.start()
+        self.dispatchThread.start()
+
+    def stop(self):
+        self.running.clear()
+        self.stopping.set()
+        self.capture_queue.close()
+        self.encoded_queue.close()
+        for th in (self.captureThread, self.dispatchThread):
+            if th is not None and th.is_alive() and th is not threading.current_thread():
+                th.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def captureThread_func(self):
+        cap = None
+        seq = 0
+        failures = 0        # 连续读取失败的次数
+        open_retry = self.retry_interval
+        capture_hist = self.stats.hist('capture')
+        capture_rate = self.stats.rate('capture')
+        try:
+            while self.running.is_set():
+                if cap is None:
+                    cap = self._open()
+                    if cap is None:
+                        self.stopping.wait(open_retry)
+                        open_retry = min(open_retry * 2, self.max_retry_interval)
+                        continue
+                    open_retry = self.retry_interval
+                t0 = time.perf_counter()
+                ret, image = cap.read()     # image为(h,w,3)的numpy数组，类型为uint8
+                if not ret or image is None:
+                    failures += 1
+                    self._capture_error('read failed')
+                    if failures >= self.reopen_after:
+                        print('stream %d: %d read failures, reopen camera' % (self.stream_id, failures))
+                        self._close(cap)
+                        cap = None
+                        failures = 0
+                        self.reopened += 1
+                    self.stopping.wait(self.retry_interval)
+                    continue
+                if failures > 0 or self.capture_error is not None:
+                    failures = 0
+                    self.capture_error = None
+                capture_hist.record(time.perf_counter() - t0)
+                capture_rate.add()
+                seq += 1
+                self.capture_queue.put(Frame(seq, image, time.time(), self.stream_id))
+        finally:
+            if cap is not None:
+                self.release_capture(cap)
+        print('exit from captureThread_func')
+
+    # 打开相机，失败(抛出异常或未打开)时记录错误并返回None
+    def _open(self):
+        try:
+            cap = self.open_capture()
+        except Exception as e:
+            self._capture_error('open failed: %s' % str(e))
+            return None
+        if not cap.isOpened():
+            self._close(cap)
+            self._capture_error('camera not opened')
+            return None
+        return cap
+
+    # 关闭出错的相机，先release()使相机池不再保留它
+    def _close(self, cap):
+        try:
+            cap.release()
+        except Exception as e:
+            print('stream %d: release camera err: %s' % (self.stream_id, str(e)))
+        self.release_capture(cap)
+
+    def _capture_error(self, msg: str):
+        if self.capture_error != msg:
+            print('stream %d: capture err: %s' % (self.stream_id, msg))
+        self.capture_error = msg
+        self.capture_failed += 1
+
+    # 按采集顺序把帧提交给编码线程池，stop()关闭队列时被唤醒
+    def dispatchThread_func(self):
+        while self.running.is_set():
+            frame = self.capture_queue.get()
+            if frame is None:
+                continue
+            future = self.executor.submit(self._encode, frame)
+            self.encoded_queue.put(future)
+
+    # 编码出错时丢弃该帧并返回None，不影响后续的帧
+    def _encode(self, frame: Frame):
+        t0 = time.perf_counter()
+        try:
+            self.encode(frame)
+        except Exception as e:
+            print('stream %d: encode err: %s' % (self.stream_id, str(e)))
+            self.count_failed()
+            return None
+        self.stats.hist('encode').record(time.perf_counter() - t0)
+        self.stats.rate('encode').add()
+        frame.image = None      # 编码后不再需要原始图像
+        return frame
+
+    # 在多个编码线程中调用，借用stats的锁计数
+    def count_failed(self):
+        with self.stats.lock:
+            self.encode_failed += 1
+
+    # 按采集顺序取出一帧编码完成的图像，超时或流水线停止时返回None
+    def get(self, timeout=None):
+        future = self.encoded_queue.get(timeout)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except CancelledError:     # 流水线停止时未开始编码的帧被取消
+            return None
+        except Exception as e:
+            print('stream %d: encode err: %s' % (self.stream_id, str(e)))
+            self.count_failed()
+            return None
+
+    # 因队列满以及编码出错而丢弃的帧数
+    def dropped(self) -> int:
+        return self.capture_queue.dropped + self.encode_failed
+
+    # 队列深度以及丢帧数
+    def queue_stats(self) -> dict:
+        return {'capture_queue': len(self.capture_queue), 'encode_queue': len(self.encoded_queue),
+                'encoder_num': self.encoder_num, 'dropped': self.dropped(), 'encode_failed': self.encode_failed,
+                'capture_failed': self.capture_failed, 'reopened': self.reopened, 'capture_error': self.capture_error}
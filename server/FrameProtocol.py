@@ -0,0 +1,21 @@
+from WireFormat import MAGIC, HEADER_V1, HEADER_V2, CODEC_JPEG
+
+
+"""
+打包数据流(data_socket)上每一帧的帧头，各版本帧头的格式见WireFormat
+客户端通过subscribe命令的protocol参数选择版本(WireFormat.PROTOCOLS)
+"""
+
+
+# size: 缩放后的(宽, 高)，None表示与frame的尺寸相同
+def pack_header(protocol: int, frame, payload_len: int, codec: int = CODEC_JPEG, encode_dur: float = 0.0,
+                size=None) -> bytes:
+    if protocol == 0:
+        return payload_len.to_bytes(4, byteorder='big')
+    if protocol == 1:
+        return HEADER_V1.pack(MAGIC, 1, codec, frame.stream_id, payload_len)
+    encode_us = min(int(encode_dur * 1e6), 0xFFFFFFFF)
+    width, height = (frame.width, frame.height) if size is None else size
+    return HEADER_V2.pack(MAGIC, 2, codec, frame.stream_id, HEADER_V2.size, frame.seq,
+                          frame.capture_ts, encode_us, width, height,
+                          frame.pixfmt, payload_len)
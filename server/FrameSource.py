@@ -0,0 +1,478 @@
+import mmap
+import struct
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+
+from WireFormat import SEGMENT_NAME, INDEX_NAME, INDEX_MAGIC, INDEX_HEADER, INDEX_DTYPE
+
+
+"""
+可以代替cv2.VideoCapture的图像来源，用于在没有实体相机的机器上测试和评测服务端
+包括合成数据源、录制的MJPEG数据源、文件回放数据源以及压缩数据回放数据源，capture_factory_for()按名称选择
+接口与cv2.VideoCapture一致: isOpened()/set()/get()/read()/release()
+"""
+
+JPEG_SOI = b'\xff\xd8\xff'
+JPEG_EOI = b'\xff\xd9'
+RIFF_CHUNK = struct.Struct('<I')
+
+
+# 按fps控制输出速率的数据源基类(fps<=0表示不限速)
+class PacedCapture:
+    def __init__(self, fps: float) -> None:
+        self.fps = fps
+        self.opened = True
+        self.frame_cnt = 0
+        self.next_ts = 0.0
+
+    def isOpened(self) -> bool:
+        return self.opened
+
+    def release(self):
+        self.opened = False
+
+    # period为到下一帧的间隔(秒)，None表示1/fps
+    def _pace(self, period=None):
+        if self.fps <= 0:
+            return
+        now = time.perf_counter()
+        if self.next_ts > now:
+            time.sleep(self.next_ts - now)
+        else:   # 读取不及时，不再追赶落下的帧
+            self.next_ts = now
+        self.next_ts += 1.0 / self.fps if period is None else period
+
+
+"""
+合成数据源：生成随时间移动的渐变条纹图像
+cam_idx不同的数据源生成的图案颜色不同，便于区分多路视频流
+"""
+class SyntheticCapture(PacedCapture):
+    def __init__(self, cam_idx: int = 0, fps: float = 30.0) -> None:
+        super().__init__(fps)
+        self.cam_idx = cam_idx
+        self.width = 640
+        self.height = 480
+        self.base = None        # 预先生成的图案，每帧只做平移
+
+    def set(self, prop: int, value) -> bool:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+            self.base = None
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+            self.base = None
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+        else:   # 不支持CAP_PROP_CONVERT_RGB等属性
+            return prop == cv2.CAP_PROP_FOURCC
+        return True
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def _make_base(self) -> np.ndarray:
+        x = np.arange(self.width * 2, dtype=np.uint32)
+        y = np.arange(self.height, dtype=np.uint32)
+        base = np.empty((self.height, self.width * 2, 3), np.uint8)
+        base[:, :, 0] = ((x[None, :] + y[:, None]) % 256).astype(np.uint8)
+        base[:, :, 1] = ((x[None, :] // 4 + self.cam_idx * 60) % 256).astype(np.uint8)[None, :]
+        base[:, :, 2] = ((y[:, None] // 2 + self.cam_idx * 90) % 256).astype(np.uint8)
+        return base
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        if self.base is None:
+            self.base = self._make_base()
+        self._pace()
+        offset = (self.frame_cnt * 8) % self.width
+        self.frame_cnt += 1
+        frame = np.ascontiguousarray(self.base[:, offset:offset + self.width])
+        return True, frame
+
+
+# 判断是否为相机直接输出的JPEG数据(CAP_PROP_CONVERT_RGB=0时read()得到的一维缓冲区)
+def is_jpeg_buffer(image) -> bool:
+    if image is None or image.dtype != np.uint8 or image.size < 4:
+        return False
+    if image.ndim == 3 or (image.ndim == 2 and image.shape[0] != 1 and image.shape[1] != 1):
+        return False
+    flat = image.reshape(-1)
+    return flat[0] == 0xFF and flat[1] == 0xD8
+
+
+"""
+录制的MJPEG数据源：循环播放一组JPEG数据，模拟输出MJPG格式的USB相机
+CAP_PROP_CONVERT_RGB为1(默认)时与OpenCV一样解码为BGR图像，为0时直接输出JPEG数据(1xN的uint8数组)
+"""
+class RecordedMjpegCapture(PacedCapture):
+    def __init__(self, jpeg_list: list, fps: float = 30.0) -> None:
+        if len(jpeg_list) == 0:
+            raise ValueError('jpeg_list is empty')
+        super().__init__(fps)
+        self.jpeg_list = [np.frombuffer(jpeg, np.uint8).reshape(1, -1) for jpeg in jpeg_list]
+        self.convert_rgb = True
+        first = cv2.imdecode(self.jpeg_list[0], cv2.IMREAD_COLOR)
+        self.height, self.width = first.shape[:2]
+
+    # 用合成数据源生成n帧JPEG数据
+    @staticmethod
+    def from_synthetic(width: int, height: int, n: int = 30, fps: float = 30.0, quality: int = 90):
+        src = SyntheticCapture(0, 0)
+        src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        jpeg_list = []
+        for _ in range(n):
+            frame = src.read()[1]
+            jpeg_list.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+        return RecordedMjpegCapture(jpeg_list, fps)
+
+    def set(self, prop: int, value) -> bool:
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+            return True
+        if prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+            return True
+        # 录制数据的分辨率是固定的
+        return prop == cv2.CAP_PROP_FOURCC
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            return 1.0 if self.convert_rgb else 0.0
+        return 0.0
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        self._pace()
+        jpeg = self.jpeg_list[self.frame_cnt % len(self.jpeg_list)]
+        self.frame_cnt += 1
+        if self.convert_rgb:
+            return True, cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+        return True, jpeg
+
+
+"""
+文件回放数据源：循环播放视频文件或图片目录(按文件名排序)中的图像
+打开时把最多max_frames帧预先读入内存，并缩放到set()设置的分辨率(未设置时使用原始分辨率)，
+回放时不再有解码和缩放的开销，测得的是服务端和传输路径本身的性能。
+"""
+class FileReplayCapture(PacedCapture):
+    IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, path: str, fps: float = 30.0, max_frames: int = 120) -> None:
+        super().__init__(fps)
+        self.path = Path(path)
+        self.max_frames = max_frames
+        self.width = 0
+        self.height = 0
+        self.frames = None      # 预先读入的图像
+
+    def _load_raw(self) -> list:
+        frames = []
+        if self.path.is_dir():
+            for file in sorted(self.path.iterdir()):
+                if len(frames) >= self.max_frames:
+                    break
+                if file.suffix.lower() in self.IMAGE_SUFFIXES:
+                    image = cv2.imread(str(file), cv2.IMREAD_COLOR)
+                    if image is not None:
+                        frames.append(image)
+        else:
+            cap = cv2.VideoCapture(str(self.path))
+            try:
+                while len(frames) < self.max_frames:
+                    ret, image = cap.read()
+                    if not ret:
+                        break
+                    frames.append(image)
+            finally:
+                cap.release()
+        if len(frames) == 0:
+            raise ValueError('no frame can be read from %s' % str(self.path))
+        return frames
+
+    def _load(self):
+        frames = self._load_raw()
+        height, width = frames[0].shape[:2]
+        if self.width > 0 and self.height > 0 and (self.width, self.height) != (width, height):
+            frames = [cv2.resize(image, (self.width, self.height), interpolation=cv2.INTER_AREA)
+                      for image in frames]
+        else:
+            self.width, self.height = width, height
+        self.frames = frames
+
+    def set(self, prop: int, value) -> bool:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+            self.frames = None
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+            self.frames = None
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+        else:
+            return prop == cv2.CAP_PROP_FOURCC
+        return True
+
+    def get(self, prop: int) -> float:
+        if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT) and self.frames is None:
+            self._load()
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        if self.frames is None:
+            self._load()
+        self._pace()
+        image = self.frames[self.frame_cnt % len(self.frames)]
+        self.frame_cnt += 1
+        return True, image
+
+
+"""
+压缩数据回放数据源：把已经压缩好的JPEG数据原样交给服务端，不解码也不重新编码，
+与CameraStream的MJPEG直通配合，客户端看到的与实体相机完全相同(帧头中的采集时间为回放时刻)。
+支持的数据:
+    录像目录(客户端FrameRecorder录制的，含stream_<id>.idx，stream_id为其中的视频流):
+        按索引直接定位，可按原始的时间间隔回放
+    MJPEG编码的AVI文件: 只遍历RIFF块头，不读取图像数据
+    拼接的JPEG数据(如相机的MJPEG数据流、FrameRecorder的分段文件、单个JPEG文件)
+    JPEG图片目录(按文件名排序，每帧读取一个文件)
+文件通过mmap映射，read()返回映射内存的视图。
+timing: 'fps'(按fps) | 'original'(按录像中的采集时间或AVI的帧间隔) | 'max'(不限速，用于测试客户端的最大吞吐)
+回放数据的分辨率是固定的，set()设置的分辨率被忽略。
+CAP_PROP_CONVERT_RGB为1时解码为BGR图像(与OpenCV一致)，为0时直接输出JPEG数据
+"""
+class CompressedReplayCapture(PacedCapture):
+    TIMINGS = ('fps', 'original', 'max')
+
+    def __init__(self, path: str, fps: float = 30.0, timing: str = 'fps', stream_id: int = 0) -> None:
+        if timing not in self.TIMINGS:
+            raise ValueError('timing must be one of %s' % str(self.TIMINGS))
+        super().__init__(0.0 if timing == 'max' else fps)
+        self.path = Path(path)
+        self.timing = timing
+        self.maps = []              # 映射的文件
+        self.files = None           # 图片目录中的文件，每帧一个
+        self.seg_idx = None         # 每帧所在的映射文件
+        self.offsets = None
+        self.lengths = None
+        self.codecs = None          # 录像中各帧的编码格式，None表示都是JPEG
+        self.periods = None         # 到下一帧的时间间隔(秒)，None表示按fps
+        self.convert_rgb = True
+        if self.path.is_dir() and (self.path / (INDEX_NAME % stream_id)).exists():
+            self._index_recording(stream_id)
+        elif self.path.is_dir():
+            self.files = [f for f in sorted(self.path.iterdir()) if f.suffix.lower() in ('.jpg', '.jpeg')]
+            self.lengths = np.array([f.stat().st_size for f in self.files], np.int64)
+        else:
+            mm = self._map(self.path)
+            if mm[:4] == b'RIFF':
+                self._index_avi(mm)
+            else:
+                self._index_jpeg_blob(mm)
+        if self.lengths is None or len(self.lengths) == 0:
+            self.release()
+            raise ValueError('no jpeg frame found in %s' % str(self.path))
+        first = cv2.imdecode(self._data(0), cv2.IMREAD_COLOR)
+        if first is None:
+            self.release()
+            raise ValueError('cannot decode the first frame of %s' % str(self.path))
+        self.height, self.width = first.shape[:2]
+
+    def _map(self, file: Path) -> mmap.mmap:
+        with open(file, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mm)
+        return mm
+
+    # FrameRecorder的录像，索引格式见WireFormat
+    def _index_recording(self, stream_id: int):
+        with open(self.path / (INDEX_NAME % stream_id), 'rb') as f:
+            magic, version, record_size = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC or record_size != INDEX_DTYPE.itemsize:
+                raise ValueError('not a recording index: %s' % str(self.path))
+            index = np.fromfile(f, INDEX_DTYPE)
+        segments = {}
+        for seg in np.unique(index['segment']):
+            seg_path = self.path / (SEGMENT_NAME % seg)
+            if seg_path.exists():
+                segments[int(seg)] = len(self.maps)
+                self._map(seg_path)
+        # 去掉指向不存在或不完整数据的记录
+        seg_ids = index['segment'].astype(np.int64)
+        seg_idx = np.full(len(index), -1, np.int64)
+        seg_sizes = np.zeros(len(index), np.int64)
+        for seg, k in segments.items():
+            seg_idx[seg_ids == seg] = k
+            seg_sizes[seg_ids == seg] = len(self.maps[k])
+        valid = (seg_idx >= 0) & (index['offset'].astype(np.int64) + index['length'] <= seg_sizes)
+        index = index[valid]
+        self.seg_idx = seg_idx[valid]
+        self.offsets = index['offset'].astype(np.int64)
+        self.lengths = index['length'].astype(np.int64)
+        self.codecs = index['codec'].copy()
+        if len(index) > 1:
+            periods = np.diff(index['capture_ts'])
+            period = float(np.median(periods))
+            self.periods = np.append(np.clip(periods, 0.0, 1.0), period)   # 循环回到开头时用中位数间隔
+
+    # MJPEG编码的AVI: 遍历RIFF/LIST块，记录'##dc'块中的JPEG数据
+    def _index_avi(self, mm: mmap.mmap):
+        offsets, lengths = [], []
+        usec_per_frame = 0
+        pending = [(0, len(mm))]
+        while len(pending) > 0:
+            pos, end = pending.pop()
+            while pos + 8 <= end:
+                chunk_id = mm[pos:pos + 4]
+                size = RIFF_CHUNK.unpack_from(mm, pos + 4)[0]
+                body = pos + 8
+                if chunk_id in (b'RIFF', b'LIST'):      # 跳过4字节的类型后是子块(AVIX为超过1GB的后续部分)
+                    pending.append((body + 4, min(body + size, end)))
+                elif chunk_id == b'avih':
+                    usec_per_frame = RIFF_CHUNK.unpack_from(mm, body)[0]
+                elif chunk_id[2:] in (b'dc', b'db') and size > 2 and body + size <= end \
+                        and mm[body:body + 2] == JPEG_SOI[:2]:      # 文件末尾不完整的帧被忽略
+                    offsets.append(body)
+                    lengths.append(size)
+                pos = body + size + (size & 1)
+        order = np.argsort(offsets, kind='stable')      # 子块的处理顺序与文件中的顺序不同
+        self.offsets = np.array(offsets, np.int64)[order]
+        self.lengths = np.array(lengths, np.int64)[order]
+        self.seg_idx = np.zeros(len(offsets), np.int64)
+        if usec_per_frame > 0:
+            self.periods = np.full(len(offsets), usec_per_frame / 1e6)
+
+    """
+    拼接的JPEG数据: 从SOI开始，找到EOI后的下一个SOI作为下一帧的开始
+    (EXIF缩略图的EOI之后仍是本帧的数据，其中不会出现新的SOI)
+    """
+    def _index_jpeg_blob(self, mm: mmap.mmap):
+        offsets, lengths = [], []
+        pos = mm.find(JPEG_SOI, 0)
+        while pos >= 0:
+            eoi = mm.find(JPEG_EOI, pos + 2)
+            if eoi < 0:
+                break
+            nxt = mm.find(JPEG_SOI, eoi + 2)
+            offsets.append(pos)
+            lengths.append((nxt if nxt >= 0 else eoi + 2) - pos)
+            pos = nxt
+        self.offsets = np.array(offsets, np.int64)
+        self.lengths = np.array(lengths, np.int64)
+        self.seg_idx = np.zeros(len(offsets), np.int64)
+
+    # 第i帧的数据(1xN的uint8数组)
+    def _data(self, i: int) -> np.ndarray:
+        if self.files is not None:
+            return np.fromfile(self.files[i], np.uint8).reshape(1, -1)
+        return np.frombuffer(self.maps[self.seg_idx[i]], np.uint8, int(self.lengths[i]),
+                             int(self.offsets[i])).reshape(1, -1)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def set(self, prop: int, value) -> bool:
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+            return True
+        if prop == cv2.CAP_PROP_FPS:
+            if self.timing != 'max':
+                self.fps = float(value)
+            return True
+        return prop == cv2.CAP_PROP_FOURCC
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            return 1.0 if self.convert_rgb else 0.0
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self))
+        return 0.0
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        i = self.frame_cnt % len(self)
+        self._pace(self.periods[i] if self.timing == 'original' and self.periods is not None else None)
+        self.frame_cnt += 1
+        data = self._data(i)
+        # 录像中非JPEG编码(png/webp)的帧只能解码后输出
+        if self.convert_rgb or (self.codecs is not None and self.codecs[i] != 0):
+            return True, cv2.imdecode(data, cv2.IMREAD_COLOR)
+        return True, data
+
+    def release(self):
+        super().release()
+        for mm in self.maps:
+            try:
+                mm.close()
+            except BufferError:     # 仍有帧在发送队列中引用映射的内存，由垃圾回收释放
+                pass
+        self.maps = []
+
+
+# 是否可以不解码地回放: 录像目录、JPEG图片目录、MJPEG的AVI文件或拼接的JPEG数据
+def is_compressed_source(path: Path) -> bool:
+    if path.is_dir():
+        return any(f.suffix.lower() in ('.idx', '.jpg', '.jpeg') for f in path.iterdir())
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    return head[:3] == JPEG_SOI or (head[:4] == b'RIFF' and head[8:12] == b'AVI ')
+
+
+"""
+根据数据源名称返回CameraSocketServer使用的capture_factory
+    'camera': 实体相机(DirectShow)，返回None即使用默认方式
+    'synthetic': 合成数据源
+    其他: 文件或目录的路径。已压缩的JPEG数据使用CompressedReplayCapture原样回放(按timing控制速率)，
+         其他格式(如H.264视频、png图片目录)使用FileReplayCapture解码后回放
+         MJPEG以外编码的AVI文件在打开时发现没有JPEG数据，同样改用FileReplayCapture
+         回放录像目录时相机编号cam_idx对应录像中的视频流
+"""
+def capture_factory_for(source: str = 'camera', fps: float = 30.0, timing: str = 'fps'):
+    if source == 'camera':
+        return None
+    if source == 'synthetic':
+        return lambda cam_idx: SyntheticCapture(cam_idx, fps)
+    if not Path(source).exists():
+        raise FileNotFoundError(source)
+    if is_compressed_source(Path(source)):
+        def open_replay(cam_idx: int):
+            try:
+                return CompressedReplayCapture(source, fps, timing, cam_idx)
+            except ValueError as e:
+                print('%s, decode frames instead' % str(e))
+                return FileReplayCapture(source, fps)
+        return open_replay
+    return lambda cam_idx: FileReplayCapture(source, fps)
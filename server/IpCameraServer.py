@@ -1,252 +1,562 @@
 
 
-import cv2
+import selectors
 import socket
-import json
 import threading
-import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-from QCameraInfo import QCameraInfo
+from CameraStream import CameraStream, open_dshow_camera
+from FrameBroadcaster import FrameBroadcaster, DataSubscriber
+from FrameCodec import CodecConfig, DEFAULT_CODEC
+from AdaptiveController import AdaptiveController
+from FrameSource import capture_factory_for
+from EventLoop import EventLoop
+from CapturePool import CapturePool
+from ShmFrameRing import ShmProbe
+from WireFormat import encode_message, decode_message, ENCODINGS, PROTOCOLS
 
 """
-根据给定的相机以及分辨率，创建Tcp Server, 当有客户端连接时，开始采集相机图像并传输给客户端
+一个控制连接(ctrl_socket客户端)的状态
+连接在事件循环中以非阻塞方式收发，命令按收到的顺序逐个执行:
+    'idle'   -> 等待命令，收到完整的命令后交给命令线程池执行，进入'busy'
+    'busy'   -> 命令执行中，期间收到的命令暂存在recv_buf中，应答放入send_buf后回到'idle'
+    'closing'-> 命令执行中连接断开，等命令执行完成后再释放该连接的采集请求和订阅者
+    'closed' -> 连接已关闭，迟到的应答被丢弃
+客户端不必等待应答就可以连续发送多个命令，命令中的'id'会原样放入应答，客户端据此匹配应答。
+命令可以使用json或二进制编码(见WireFormat)，应答使用与命令相同的编码。
+"""
+class CtrlSession:
+    def __init__(self, cli_socket: socket.socket, addr) -> None:
+        self.socket = cli_socket
+        self.addr = addr
+        self.capturing = set()      # 该客户端请求采集的视频流编号
+        self.subscriber = None      # 通过subscribe命令与之配对的数据流订阅者
+        self.shm_probe = None       # set_transport('shm')时创建的探测用共享内存(ShmProbe)
+        self.state = 'idle'
+        self.recv_buf = bytearray()
+        self.send_buf = bytearray()
+        self.writing = False        # 是否在等待可写事件
+
+    # 从recv_buf中取出一个完整的命令，返回(cmd, 编码方式)，不完整时返回None
+    def pop_command(self):
+        while len(self.recv_buf) >= 4:
+            data_len = int.from_bytes(self.recv_buf[:4], byteorder='big')
+            if len(self.recv_buf) < 4 + data_len:
+                return None
+            data = bytes(self.recv_buf[4:4 + data_len])
+            del self.recv_buf[:4 + data_len]
+            if data_len > 0:    # 忽略空的数据包
+                return decode_message(data)
+        return None
+
+    def queue_response(self, response: dict, encoding: str = 'json'):
+        send_data = encode_message(response, encoding)
+        self.send_buf += send_data.__len__().to_bytes(4, byteorder='big')
+        self.send_buf += send_data
+
 
+"""
+根据给定的相机以及分辨率，创建Tcp Server, 当有客户端连接时，开始采集相机图像并传输给客户端
+可以同时打开多个相机，每个相机为一路视频流(CameraStream)，用stream_id区分，
+各路视频流的图像通过同一个data_socket连接复用传输(帧头中带有stream_id)。
+数据流可以有多个客户端(订阅者)，每一帧图像只编码一次，然后分发给所有订阅者。
+只要有一个控制连接请求了某路视频流的采集，对应的相机就保持采集状态。
+capture_factory(cam_idx)返回一个类似cv2.VideoCapture的对象，默认使用DirectShow打开相机，
+也可以使用FrameSource中的合成数据源或文件回放数据源(见capture_factory_for)
+所有连接都在一个事件循环(EventLoop)线程中以非阻塞方式收发，不再为每个连接创建线程；
+命令在一个小的线程池中执行(打开相机等操作可能耗时较长)，执行完成后把应答交回事件循环。
 """
 class CameraSocketServer:
-    def __init__(self) -> None:
-        self.cameraInfo = QCameraInfo()
-        self.dataThread = None
-        self.ctrlThread = None
-        """
-        'close' -> 未建立连接时的状态
-        'idle' -> 已建立连接，但还未启动发送
-        'running' -> 正在进行发送
-        """
-        self.dataThread_state = "idle"    
-        self.exitFlag = False
+    def __init__(self, host='localhost', port=30000, capture_factory=None) -> None:
+        self.cameraInfo = None      # QCameraInfo依赖PySide6，使用真实相机时在Start()中创建，否则第一次查询相机时才创建
+        self.loop = EventLoop()
+        self.executor = None        # 执行控制命令的线程池
+        self.stopped = threading.Event()
 
         # 创建 socket 对象
         self.data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)    # 相机数据流
         self.data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.ctrl_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)    # 相机控制流
         self.ctrl_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.ctrl_cli_socket = None
+        self.ctrl_sessions = []
         # 绑定端口
-        self.data_socket.bind(("localhost", 30000))
-        self.ctrl_socket.bind(("localhost", 30001))
+        self.data_socket.bind((host, port))
+        self.ctrl_socket.bind((host, port+1))
         # 设置最大连接数，超过后排队
-        self.data_socket.listen(2)
-        # self.data_socket.settimeout(0.5)
-        self.data_socket.setblocking(True)
-        self.ctrl_socket.listen(2)
-        # self.ctrl_socket.settimeout(0.5)
-        self.ctrl_socket.setblocking(True)
-
-        self.cam_idx = -1
-        self.width = 640
-        self.height = 480
+        self.data_socket.listen(64)
+        self.data_socket.setblocking(False)
+        self.ctrl_socket.listen(64)
+        self.ctrl_socket.setblocking(False)
+
+        self.capture_factory = capture_factory if capture_factory is not None else open_dshow_camera
+        # 停止采集后相机保持打开，再次采集时立即可用; 空闲超过idle_timeout秒或超过max_open个时关闭
+        self.capture_pool = CapturePool(self.capture_factory, max_open=4, idle_timeout=60.0)
+        self.streams = {}                   # stream_id -> CameraStream
+        # 流水线参数，对每一路视频流分别生效
+        self.encoder_num = 0                # 编码线程数，0表示根据CPU核数自动选择
+        self.queue_size = 2                 # 采集队列长度
+        self.drop_policy = 'drop_oldest'    # 采集队列满时的策略，'drop_oldest'或'block'
+        self.send_queue_size = 2            # 每个订阅者的发送队列长度
+
+        self.broadcaster = FrameBroadcaster()
+        self.lock = threading.Lock()        # 保护ctrl_sessions和streams
         pass
 
-    # 设置使用的相机以及分辨率
-    def SetCamera(self, camNum: int, width: int, height: int)->bool:
-        print('SetCamera')
-        self.cam_idx = camNum
-        self.width = width
-        self.height = height
+    # 命令在线程池中执行，多个连接可能同时查询相机，加锁保证只创建一个QCameraInfo(QObject)
+    def get_camera_info(self):
+        if self.cameraInfo is None:
+            with self.lock:
+                if self.cameraInfo is None:
+                    from QCameraInfo import QCameraInfo
+                    self.cameraInfo = QCameraInfo()
+        return self.cameraInfo
+
+    # 设置视频流使用的相机以及分辨率
+    def SetCamera(self, camNum: int, width: int, height: int, stream_id: int = 0)->bool:
+        print('SetCamera', stream_id)
+        with self.lock:
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                stream = CameraStream(stream_id, self.broadcaster.broadcast, self.capture_factory,
+                                      self.broadcaster.codecs_for, self.capture_pool)
+                stream.encoder_num = self.encoder_num
+                stream.queue_size = self.queue_size
+                stream.drop_policy = self.drop_policy
+                self.streams[stream_id] = stream
+        stream.configure(camNum, width, height)
         return True
 
     """
-    Socket处于侦听状态，当有客户端连接时启动线程采集相机图像
+    Socket处于侦听状态，在事件循环中接受连接和处理命令
     """
     def Start(self):
-        self.dataThread = threading.Thread(target=self.dataThread_func)
-        self.dataThread.start()
-        self.ctrlThread = threading.Thread(target=self.ctrlThread_func)
-        self.ctrlThread.start()
+        if self.capture_factory is open_dshow_camera:   # 使用真实的相机时在调用Start()的线程中创建
+            self.get_camera_info()
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ctrl_cmd')
+        self.stopped.clear()
+        self.loop.register(self.data_socket, selectors.EVENT_READ, self.on_data_accept)
+        self.loop.register(self.ctrl_socket, selectors.EVENT_READ, self.on_ctrl_accept)
+        self.loop.start()
 
     def Stop(self):
-        self.exitFlag = True
-        self.data_socket.close()
-        if self.dataThread is not None and self.dataThread.is_alive():
-            self.dataThread.join()
-        self.ctrl_socket.close()
-        if self.ctrl_cli_socket:
-            self.ctrl_cli_socket.close()
-        if self.ctrlThread is not None and self.ctrlThread.is_alive():
-            self.ctrlThread.join()
-
-    def dataThread_func(self):
-        print('dataThread_func')
-        while not self.exitFlag:
-            # 建立客户端连接
-            try:
-                print('data_socket listening...')
-                client_socket, addr = self.data_socket.accept()
-            except:
-                # print('data_socket accept time out')
-                # time.sleep(0.5)
-                continue
-            print('data_socket got a connection.')
-            self.dataThread_state = 'idle'
-            while not self.exitFlag:
-                if self.dataThread_state == 'running':
-                    try:
-                        self.sending_loop(client_socket)
-                    except:     #发送通信错误，关闭该连接
-                        self.dataThread_state = 'close'
-                elif self.dataThread_state == 'close':
-                    client_socket.close()
-                    break
-                else:
-                    # print('idle')
-                    time.sleep(0.2)
+        # 先停止采集和命令处理，事件循环在此期间继续运行，以便订阅者在循环线程中关闭
+        # 先置为None，之后事件循环中收到的命令不再提交(见submit)
+        executor = self.executor
+        self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            streams = list(self.streams.values())
+        for stream in streams:
+            stream.stop()
+        self.capture_pool.close()
+        self.broadcaster.close_all()
+        self.loop.stop()
+        with self.lock:
+            sessions = list(self.ctrl_sessions)
+            self.ctrl_sessions = []
+        for session in sessions:
+            session.state = 'closed'
+            self.close_socket(session.socket)
+        self.loop.close()
+        self.stopped.set()
 
-            # 关闭客户端连接
-            client_socket.close()
-        print('dataThread_func exit.')
+    # 等待服务端停止，timeout为None时一直等待
+    def Wait(self, timeout=None) -> bool:
+        return self.stopped.wait(timeout)
 
-    def ctrlThread_func(self):
-        print('ctrlThread_func')
-        while not self.exitFlag:
-            # 建立客户端连接
+    # linux下仅close()不能唤醒阻塞在accept()/recv()中的线程，需要先shutdown()
+    @staticmethod
+    def close_socket(sock: socket.socket):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    # 接受数据流的连接，每个连接作为一个订阅者
+    def on_data_accept(self, mask: int):
+        try:
+            client_socket, addr = self.data_socket.accept()
+        except (BlockingIOError, OSError):
+            return
+        print('data_socket got a connection:', addr)
+        self.broadcaster.add(DataSubscriber(client_socket, addr, self.send_queue_size, self.loop))
+
+    # 接受控制流的连接
+    def on_ctrl_accept(self, mask: int):
+        try:
+            cli_socket, addr = self.ctrl_socket.accept()
+        except (BlockingIOError, OSError):
+            return
+        print('ctrl_socket got a connection:', addr)
+        cli_socket.setblocking(False)
+        session = CtrlSession(cli_socket, addr)
+        with self.lock:
+            self.ctrl_sessions.append(session)
+        self.loop.register(cli_socket, selectors.EVENT_READ, partial(self.on_ctrl_event, session))
+
+    def on_ctrl_event(self, session: CtrlSession, mask: int):
+        if mask & selectors.EVENT_READ:
             try:
-                print('ctrl_socket listening...')
-                self.ctrl_cli_socket = None
-                self.ctrl_cli_socket, addr = self.ctrl_socket.accept()
-            except:
-                # print('ctrl_socket accept time out')
-                continue
-            print('ctrl_socket got a connection.')
-            while not self.exitFlag:
-                try:
-                    # 接受客户端的命令
-                    recv_data = self.recv_ctrl_pack(self.ctrl_cli_socket)
-                except socket.error as e:   # 接受发生错误，则断开连接
-                    print("socket err: ", str(e))   
-                    self.ctrl_cli_socket.close()
-                    self.dataThread_state = 'close'    # 当控制流断开时，也通知数据流断开
-                    break
-                if len(recv_data)==0:   # 表示socket的recv函数收到了0字节，一般表示远端关闭了连接
+                data = session.socket.recv(65536)
+            except BlockingIOError:
+                data = None
+            except OSError as e:
+                print("socket err: ", str(e))
+                data = b''
+            if data is not None:
+                if len(data) == 0:  # 远端关闭了连接
                     print('client connection closed.')
-                    self.ctrl_cli_socket.close()
-                    self.dataThread_state = 'close'
-                    break
-                print('recv data:', recv_data)
-                response = self.handle_ctrl_cmd(recv_data)
-                print('send response:', response)
-                self.send_ctrl_pack(self.ctrl_cli_socket, response)
-        print('ctrlThread_func exit.')
+                    self.drop_session(session)
+                    return
+                session.recv_buf += data
+        if mask & selectors.EVENT_WRITE:
+            self.flush_session(session)
+        self.dispatch_cmd(session)
+
+    # 把func交给命令线程池执行，服务端已停止(或正在停止)时返回False
+    def submit(self, func, *args) -> bool:
+        executor = self.executor
+        if executor is None:
+            return False
+        try:
+            executor.submit(func, *args)
+        except RuntimeError:    # 线程池已关闭
+            return False
+        return True
+
+    # 空闲时取出下一个命令交给线程池执行
+    def dispatch_cmd(self, session: CtrlSession):
+        if session.state != 'idle':
+            return
+        try:
+            item = session.pop_command()
+        except (ValueError, IndexError) as e:     # 无法解码，断开连接
+            print("socket err: ", str(e))
+            self.drop_session(session)
+            return
+        if item is None:
+            return
+        cmd, encoding = item
+        print('recv data:', cmd)
+        session.state = 'busy'
+        if not self.submit(self.run_ctrl_cmd, session, cmd, encoding):
+            session.state = 'idle'      # 服务端正在停止，不再执行命令，连接由Stop()关闭
+
+    # 在命令线程池中执行
+    def run_ctrl_cmd(self, session: CtrlSession, cmd: dict, encoding: str):
+        response = self.exec_ctrl_cmd(cmd, session)
+        self.loop.call_soon_threadsafe(self.on_ctrl_response, session, response, encoding)
+
+    # 执行一个命令，命令中的'id'原样放入应答
+    def exec_ctrl_cmd(self, cmd: dict, session: CtrlSession) -> dict:
+        try:
+            response = self.handle_ctrl_cmd(cmd, session)
+        except Exception as e:
+            response = {'result': False, 'msg': str(e)}
+        if isinstance(cmd, dict) and 'id' in cmd:
+            response['id'] = cmd['id']
+        return response
+
+    def on_ctrl_response(self, session: CtrlSession, response: dict, encoding: str):
+        if session.state == 'closing':  # 命令执行期间连接断开，现在才能释放
+            self.close_session_later(session)
+            return
+        if session.state == 'closed':
+            return
+        print('send response:', response)
+        session.queue_response(response, encoding)
+        session.state = 'idle'
+        self.flush_session(session)
+        self.dispatch_cmd(session)
+
+    def flush_session(self, session: CtrlSession):
+        if session.state in ('closing', 'closed'):
+            return
+        try:
+            while len(session.send_buf) > 0:
+                n = session.socket.send(session.send_buf)
+                del session.send_buf[:n]
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            print("socket err: ", str(e))
+            self.drop_session(session)
+            return
+        writing = len(session.send_buf) > 0
+        if writing != session.writing:
+            session.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self.loop.modify(session.socket, events, partial(self.on_ctrl_event, session))
+
+    """
+    在事件循环中关闭控制连接，释放采集请求可能需要等待相机关闭，交给线程池
+    有命令正在执行时先标记为'closing'，命令完成后(on_ctrl_response)再释放，
+    否则命令可能在释放之后才登记采集请求或订阅者，使相机在没有客户端时仍保持打开
+    """
+    def drop_session(self, session: CtrlSession):
+        if session.state in ('closing', 'closed'):
+            return
+        self.loop.unregister(session.socket)
+        if session.state == 'busy':
+            session.state = 'closing'
+            return
+        self.close_session_later(session)
+
+    def close_session_later(self, session: CtrlSession):
+        session.state = 'closed'
+        if not self.submit(self.close_session, session):
+            self.close_session(session)     # 服务端正在停止，直接释放
+
+    # 关闭控制连接，同时释放其采集请求，并断开与之配对的数据流
+    def close_session(self, session: CtrlSession):
+        session.socket.close()
+        self.stop_capture(session, None)
+        with self.lock:
+            if session in self.ctrl_sessions:
+                self.ctrl_sessions.remove(session)
+        if session.subscriber is not None:
+            self.broadcaster.remove(session.subscriber)
+            session.subscriber = None
+        self.close_shm_probe(session)
+
+    def close_shm_probe(self, session: CtrlSession):
+        if session.shm_probe is not None:
+            session.shm_probe.close()
+            session.shm_probe = None
+
+    # stream_id为None时表示所有已设置的视频流
+    def start_capture(self, session: CtrlSession, stream_id)->bool:
+        with self.lock:
+            if stream_id is None:
+                streams = list(self.streams.values())
+            elif stream_id in self.streams:
+                streams = [self.streams[stream_id]]
+            else:
+                streams = []
+        if len(streams) == 0:
+            return False
+        result = True
+        for stream in streams:
+            if stream.start():
+                session.capturing.add(stream.stream_id)
+            else:
+                result = False
+        return result
+
+    def stop_capture(self, session: CtrlSession, stream_id):
+        with self.lock:
+            if stream_id is None:
+                session.capturing.clear()
+            else:
+                session.capturing.discard(stream_id)
+            # 所有客户端都停止采集时才关闭对应的相机
+            in_use = set()
+            for s in self.ctrl_sessions:
+                in_use |= s.capturing
+            idle_streams = [stream for sid, stream in self.streams.items() if sid not in in_use]
+        for stream in idle_streams:
+            stream.stop()
+
+    # 根据客户端给出的数据流端口，找到对应的订阅者
+    def find_subscriber(self, session: CtrlSession, cmd: dict):
+        if 'data_port' not in cmd:
+            return None
+        return self.broadcaster.find((session.addr[0], int(cmd['data_port'])))
 
     # 处理控制命令
-    def handle_ctrl_cmd(self, cmd: dict)->dict:
+    def handle_ctrl_cmd(self, cmd: dict, session: CtrlSession)->dict:
         response = {'result': False}
         if 'cmd' not in cmd:
             response['msg'] = 'no cmd'
+        elif cmd['cmd'] == 'get_ctrl_features':   # 控制协议支持的功能，旧版本的服务端不认识该命令
+            response['result'] = True
+            response['features'] = ['id', 'batch', 'pipelining', 'adaptive', 'roi']
+            response['encodings'] = list(ENCODINGS)
+        elif cmd['cmd'] == 'batch':
+            # 按顺序执行cmds中的多个命令，一次往返完成，如set_camera + set_codec + capture
+            # stop_on_error为True时遇到失败的命令即停止，之后的命令不执行
+            responses = []
+            for sub_cmd in cmd.get('cmds', []):
+                if isinstance(sub_cmd, dict) and sub_cmd.get('cmd') == 'batch':
+                    sub_response = {'result': False, 'msg': 'nested batch'}
+                else:
+                    sub_response = self.exec_ctrl_cmd(sub_cmd, session)
+                responses.append(sub_response)
+                if not sub_response['result'] and cmd.get('stop_on_error', False):
+                    break
+            response['result'] = all(r['result'] for r in responses)
+            response['responses'] = responses
         elif cmd['cmd'] == 'get_cameras':
             response['result'] = True
-            response['cameras'] = self.cameraInfo.QueryCameras()
+            response['cameras'] = self.get_camera_info().QueryCameras(bool(cmd.get('refresh', False)))
         elif cmd['cmd'] == 'set_camera':    # 设置将使用的相机，及其对应的分辨率
             cam_idx = cmd['cam_idx']
             width = cmd['width']
             height = cmd['height']
-            response['result'] =self.SetCamera(cam_idx, width, height)
+            stream_id = int(cmd.get('stream_id', 0))
+            response['result'] =self.SetCamera(cam_idx, width, height, stream_id)
         elif cmd['cmd'] == 'get_camera_formats':
-            min_width = 640
-            min_height = 0
-            max_height = 10000
-            min_fps = 30
-            cam_name = cmd['cam_name']
-            if 'min_width' in cmd:
-                min_width = int(cmd['min_width'])
-            if 'min_fps' in cmd:
-                min_fps = int(cmd['min_fps'])
-            if 'min_height' in cmd:
-                min_height = int(cmd['min_height'])
-            if 'max_height' in cmd:
-                max_height = int(cmd['max_height'])
+            # 过滤条件: min/max_width, min/max_height, min/max_fps, pixel_format
+            # structured为True时返回dict的列表(name/width/height/fps/max_fps/pixel_format)，否则返回格式字串
+            filters = {'min_width': 640, 'min_height': 0, 'max_height': 10000, 'min_fps': 30,
+                       'max_width': 100000, 'max_fps': 1000}
+            for key in filters:
+                if key in cmd:
+                    filters[key] = int(cmd[key])
             response['result'] = True
-            response['formats'] = self.cameraInfo.GetAvailableFormats(cam_name, min_width=min_width, min_fps=min_fps, min_height=min_height, max_height=max_height)
+            response['formats'] = self.get_camera_info().GetAvailableFormats(
+                cmd['cam_name'], pixel_format=cmd.get('pixel_format'),
+                structured=bool(cmd.get('structured', False)), **filters)
         elif cmd['cmd'] == 'capture':
-            self.dataThread_state = 'running' # 通知数据线程开始发送图像数据
-            response['result'] = True
+            # 开始采集并向订阅者发送图像数据，未指定stream_id时启动所有已设置的视频流
+            response['result'] = self.start_capture(session, cmd.get('stream_id'))
+            if not response['result']:
+                response['msg'] = 'camera not set'
         elif cmd['cmd'] == 'stop_capture':
-            self.dataThread_state = 'idle'
+            self.stop_capture(session, cmd.get('stream_id'))
             response['result'] = True
-        return response
-
-    # 不断地发生相机数据到客户端
-    def sending_loop(self, cli_socket: socket.socket):
-        if self.cam_idx <0:
-            self.dataThread_state = "idle"
-            return
-        """
-        # 初始化cv相机
-        opencv在获取相机图像时发现一个问题，即常规的cap=VideoCapture(0)不能获得1280x960分辨率的图像。
-        单独只改用CAP_DSHOW后端会出现低帧率的情况，还需要设置CAP_PROP_FOURCC。
-        """
-        cap = cv2.VideoCapture(self.cam_idx, cv2.CAP_DSHOW)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
-        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
-        # cap.set(cv2.CAP_PROP_FPS, 30)
-        # 进入相机图像发送状态
-        while not self.exitFlag and self.dataThread_state == 'running':
-            # 读取相机
-            ret, frame = cap.read()     # frame为(h,w,3)的numpy数组，类型为uint8
-            if frame is None:
-                continue
-            if True:    # 启用压缩
-                # opencv method
-                result = cv2.imencode('.jpg', frame)[1] # result为压缩后的一维numpy数组
-                send_bytes = result.tobytes() 
+        elif cmd['cmd'] == 'subscribe':     # 使data_port对应的数据流开始接收图像
+            subscriber = self.find_subscriber(session, cmd)
+            if subscriber is None:
+                response['msg'] = 'no such data connection'
+            elif int(cmd.get('protocol', 0)) not in PROTOCOLS:
+                response['msg'] = 'unsupported protocol'
             else:
-                send_bytes = frame.tobytes()
-
-            # 先发送四个字节的数据长度
-            # print(time.asctime(), send_bytes.__len__())
-            length_info = send_bytes.__len__().to_bytes(4, byteorder='big')
-            cli_socket.sendall(length_info)
-            # 再发送图像数据
-            cli_socket.sendall(send_bytes)
-        print('exit from sending_loop')
-
-    # 用于ctrl_socket，发送一个控制数据包
-    def send_ctrl_pack(self, cli_socket:socket.socket, data: dict):
-        jsonObj = json.dumps(data)
-        send_data = bytes(jsonObj, 'utf-8')
-        # 先发送4字节长度信息
-        length_info = send_data.__len__().to_bytes(4, byteorder='big')
-        cli_socket.sendall(length_info)
-        # 再发送实际数据
-        cli_socket.sendall(send_data)
-        pass
-
-    # 用于ctrl_socket, 接收一个应答数据包
-    def recv_ctrl_pack(self, cli_socket:socket.socket)->dict:
-        # 先接受4字节长度信息
-        recv_bytes = cli_socket.recv(4, socket.MSG_WAITALL)
-        data_len = int.from_bytes(recv_bytes, byteorder='big')
-        if data_len ==0:
-            return {}
-        # 接收实际的数据
-        recv_bytes = cli_socket.recv(data_len, socket.MSG_WAITALL)
-        json_txt = recv_bytes.decode('utf-8')
-        data = json.loads(json_txt)
-        # print(f"Received message:", print(data))
-        return data
+                if 'protocol' in cmd:
+                    subscriber.protocol = int(cmd['protocol'])
+                if 'streams' in cmd:
+                    subscriber.streams = None if cmd['streams'] is None else set(cmd['streams'])
+                subscriber.set_active(True)
+                session.subscriber = subscriber
+                response['result'] = True
+                response['protocol'] = subscriber.protocol
+        elif cmd['cmd'] == 'set_codec':     # 设置data_port对应的数据流使用的编码参数
+            subscriber = self.find_subscriber(session, cmd)
+            if subscriber is None:
+                response['msg'] = 'no such data connection'
+            elif subscriber.protocol == 0:
+                response['msg'] = 'set_codec requires protocol >= 1'
+            else:
+                try:
+                    codec = CodecConfig.from_cmd(cmd)
+                    subscriber.set_codec(codec)
+                    response['result'] = True
+                    response['codec'] = codec.to_dict()
+                except ValueError as e:
+                    response['msg'] = str(e)
+        elif cmd['cmd'] == 'set_transport':     # 'shm'(共享内存，仅限同一台机器) 或 'tcp'
+            subscriber = self.find_subscriber(session, cmd)
+            transport = cmd.get('transport', 'tcp')
+            if subscriber is None:
+                response['msg'] = 'no such data connection'
+            elif subscriber.protocol == 0:
+                response['msg'] = 'set_transport requires protocol >= 1'
+            elif transport == 'shm' and session.addr[0] not in ('127.0.0.1', '::1'):
+                response['msg'] = 'shm transport is only available to local clients'
+            elif transport not in ('shm', 'tcp'):
+                response['msg'] = 'unknown transport'
+            else:
+                # 回环地址的客户端不一定与服务端共享内存(WSL的mirrored网络)，
+                # 应答中带上探测用的共享内存，客户端打开失败时再改回'tcp'
+                self.close_shm_probe(session)
+                if transport == 'shm':
+                    session.shm_probe = ShmProbe()
+                    response['shm_probe'] = session.shm_probe.name
+                    response['shm_token'] = session.shm_probe.token
+                codec = CodecConfig('shm') if transport == 'shm' else DEFAULT_CODEC
+                subscriber.set_codec(codec)
+                response['result'] = True
+        elif cmd['cmd'] == 'set_roi':
+            # data_port对应的数据流只接收roi=[x, y, 宽, 高]区域(None为整幅图像)，并按scale(0~1]缩小
+            # 在编码前裁剪和缩放，不需要重新打开相机，下一帧即生效
+            subscriber = self.find_subscriber(session, cmd)
+            if subscriber is None:
+                response['msg'] = 'no such data connection'
+            elif subscriber.protocol == 0:
+                response['msg'] = 'set_roi requires protocol >= 1'
+            else:
+                try:
+                    codec = subscriber.set_roi(cmd.get('roi'), cmd.get('scale'))
+                    response['result'] = True
+                    response['codec'] = codec.to_dict()
+                except ValueError as e:
+                    response['msg'] = str(e)
+        elif cmd['cmd'] == 'set_adaptive':
+            # 根据发送背压自动调整data_port对应的数据流的质量和缩放比例，以set_codec设置的jpeg/webp参数为基础
+            # enabled(默认True), target_latency_ms, target_fps, min_quality, max_quality, quality_step, min_scale
+            subscriber = self.find_subscriber(session, cmd)
+            if subscriber is None:
+                response['msg'] = 'no such data connection'
+            elif subscriber.protocol == 0:
+                response['msg'] = 'set_adaptive requires protocol >= 1'
+            elif not cmd.get('enabled', True):
+                subscriber.set_adaptive(None)
+                response['result'] = True
+                response['adaptive'] = {'enabled': False}
+            else:
+                adaptive = subscriber.adaptive
+                base = subscriber.codec if adaptive is None else adaptive.base
+                try:
+                    controller = AdaptiveController(
+                        base, float(cmd.get('target_latency_ms', 200)) / 1000,
+                        None if cmd.get('target_fps') is None else float(cmd['target_fps']),
+                        int(cmd.get('min_quality', 30)), int(cmd.get('max_quality', 90)),
+                        int(cmd.get('quality_step', 10)), float(cmd.get('min_scale', 0.5)))
+                    subscriber.set_adaptive(controller)
+                    response['result'] = True
+                    response['adaptive'] = controller.to_dict()
+                except ValueError as e:
+                    response['msg'] = str(e)
+        elif cmd['cmd'] == 'get_adaptive':     # 自适应控制当前的工作点(quality/scale)以及测量的帧率和延迟
+            subscriber = self.find_subscriber(session, cmd)
+            if subscriber is None:
+                response['msg'] = 'no such data connection'
+            else:
+                adaptive = subscriber.adaptive
+                response['result'] = True
+                response['adaptive'] = {'enabled': False} if adaptive is None else adaptive.to_dict()
+                response['codec'] = subscriber.codec.to_dict()
+        elif cmd['cmd'] == 'get_stats':     # 各视频流的采集/编码统计以及各订阅者的发送统计
+            with self.lock:
+                streams = list(self.streams.values())
+            response['result'] = True
+            response['streams'] = {str(stream.stream_id): stream.get_stats() for stream in streams}
+            response['subscribers'] = self.broadcaster.get_stats()
+            response['capture_pool'] = self.capture_pool.get_stats()
+        elif cmd['cmd'] == 'unsubscribe':   # 使data_port对应的数据流暂停接收图像
+            subscriber = self.find_subscriber(session, cmd)
+            if subscriber is None:
+                response['msg'] = 'no such data connection'
+            else:
+                subscriber.set_active(False)
+                session.subscriber = subscriber
+                response['result'] = True
+        else:
+            response['msg'] = 'unknown cmd'
+        return response
 
 
+"""
+    python server/IpCameraServer.py [数据源] [fps | original | max]
+数据源: camera(默认，实体相机) | synthetic(合成数据源) | 视频文件、图片目录或录像目录的路径(文件回放)
+回放已压缩的JPEG数据时: fps按固定帧率, original按录像中原始的时间间隔, max不限速
+"""
 if __name__ == "__main__":
-    server = CameraSocketServer()
+    import sys
+    source = sys.argv[1] if len(sys.argv) > 1 else 'camera'
+    rate = sys.argv[2] if len(sys.argv) > 2 else '30'
+    timing = rate if rate in ('original', 'max') else 'fps'
+    fps = float(rate) if timing == 'fps' else 30.0
+    server = CameraSocketServer(capture_factory=capture_factory_for(source, fps, timing))
     server.Start()
     try:
-        cnt = 0
-        while True:
-            if cnt%20==0:
-                print('tick:', time.asctime())
-            time.sleep(0.2)
-            cnt+=1
-    except:
-        server.Stop()
-        print('service exit.')
-
+        # 带超时地等待，使windows下的Ctrl+C可以及时生效
+        while not server.Wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    server.Stop()
+    print('service exit.')
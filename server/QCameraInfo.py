@@ -7,6 +7,7 @@ import cv2
 import numpy as np
 
 import json
+import bisect
 import threading
 from pathlib import Path
 from PySide6.QtCore import QObject, Signal, QCoreApplication
@@ -15,7 +16,38 @@ import sys
 
 lock = threading.Lock()
 
+DEVICE_CHECK_INTERVAL = 2.0     # 查询时距上次检查相机列表超过该时间(秒)则重新检查
 
+
+"""
+相机的一种视频格式，fps为最低帧率(取整)，name为'1280x960 30fps Jpeg'形式的格式字串
+"""
+class CameraFormat:
+    def __init__(self, qformat) -> None:
+        self.qformat = qformat
+        self.width = qformat.resolution().width()
+        self.height = qformat.resolution().height()
+        self.fps = int(qformat.minFrameRate())
+        self.max_fps = int(qformat.maxFrameRate())
+        self.pixel_format = qformat.pixelFormat().name.replace("Format_", "")
+        self.name = '%dx%d %dfps %s' % (self.width, self.height, self.fps, self.pixel_format)
+        self.order = 0          # 在相机给出的格式列表中的位置
+
+    def key(self) -> tuple:
+        return (self.width, self.height, self.fps, self.pixel_format)
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'width': self.width, 'height': self.height,
+                'fps': self.fps, 'max_fps': self.max_fps, 'pixel_format': self.pixel_format}
+
+
+"""
+相机以及视频格式的缓存。查询时距上次检查相机列表(QMediaDevices.videoInputs())超过DEVICE_CHECK_INTERVAL秒才重新枚举，
+相机插拔后(设备id或名称变化)才重新读取各相机的格式，refresh=True时立即重新读取；
+有Qt事件循环时videoInputsChanged信号也会使缓存失效。服务端没有Qt事件循环，不依赖该信号。
+每个相机的格式按(宽, 高, fps, 像素格式)建立索引，并按宽度排序用于二分查找，
+带过滤条件的查询结果也会缓存；返回的格式保持相机给出的顺序，与原来一致。
+"""
 class QCameraInfo(QObject):
     # 通知相机帧缓存中已经有图像, 
     # 注：如果需要对图像进行处理一般不用sig_hasImage，因为这样可能会造成GUI卡死，使用RegisterHandle来进行处理
@@ -24,54 +56,132 @@ class QCameraInfo(QObject):
 
     def __init__(self):
         super(QCameraInfo, self).__init__()
+        self.camDevDict = {}        # 名称 -> QCameraDevice
+        self.camNumDict = {}        # 名称 -> 编号
+        self.formatIndex = {}       # 名称 -> {(宽, 高, fps, 像素格式): CameraFormat}
+        self.sortedFormats = {}     # 名称 -> 按(宽, 高, fps)排序的CameraFormat列表
+        self.sortedWidths = {}      # 名称 -> sortedFormats对应的宽度列表，用于二分查找
+        self.queryCache = {}        # (名称, 过滤条件) -> 查询结果
+        self.deviceKeys = []        # 上次枚举到的相机(id, 名称)列表
+        self.checkedAt = 0.0        # 上次检查相机列表的时间(time.monotonic)
+        self.valid = False
+        self.lock = threading.Lock()
+        self.mediaDevices = QMediaDevices()
+        self.mediaDevices.videoInputsChanged.connect(self.Invalidate)
+
+    # 相机列表发生变化，下一次查询时重新枚举
+    def Invalidate(self):
+        with self.lock:
+            self.valid = False
 
+    @staticmethod
+    def _device_keys(devices) -> list:
+        return [(camDev.id().data(), camDev.description()) for camDev in devices]
+
+    def _refresh(self, devices=None):
+        if devices is None:
+            devices = QMediaDevices.videoInputs()
+        camDevDict = {}
+        camNumDict = {}
+        formatIndex = {}
+        sortedFormats = {}
+        sortedWidths = {}
+        for camNum, camDev in enumerate(devices):
+            name = camDev.description()
+            camDevDict[name] = camDev
+            camNumDict[name] = camNum
+            formats = {}
+            for camFormat in camDev.videoFormats():
+                if camFormat.pixelFormat().name.endswith('Invalid'):
+                    continue
+                fmt = CameraFormat(camFormat)
+                fmt.order = len(formats)
+                formats.setdefault(fmt.key(), fmt)
+            formatIndex[name] = formats
+            sortedFormats[name] = sorted(formats.values(), key=lambda f: (f.width, f.height, f.fps))
+            sortedWidths[name] = [f.width for f in sortedFormats[name]]
+        self.camDevDict = camDevDict
+        self.camNumDict = camNumDict
+        self.formatIndex = formatIndex
+        self.sortedFormats = sortedFormats
+        self.sortedWidths = sortedWidths
+        self.queryCache = {}
+        self.deviceKeys = self._device_keys(devices)
+        self.checkedAt = time.monotonic()
+        self.valid = True
+
+    # 距上次检查超过DEVICE_CHECK_INTERVAL时重新枚举相机列表，列表变化时重新读取
+    def _ensure(self, refresh: bool = False):
+        with self.lock:
+            devices = None
+            if not refresh and self.valid and time.monotonic() - self.checkedAt > DEVICE_CHECK_INTERVAL:
+                devices = QMediaDevices.videoInputs()
+                self.checkedAt = time.monotonic()
+                if self._device_keys(devices) != self.deviceKeys:     # 相机插拔
+                    self.valid = False
+            if refresh or not self.valid:
+                self._refresh(devices)
 
     # 查询相机, 返回 名称->编号的dict
-    def QueryCameras(self) -> dict:
-        self.camDevDict = {}
-        self.camNumDict = {}
-        camDevs = QMediaDevices.videoInputs()
-        if len(camDevs)>0:
-            self.camDevDict.clear()
-        camNum = 0
-        for camDev in camDevs:
-            self.camDevDict[camDev.description()] = camDev
-            self.camNumDict[camDev.description()] = camNum
-        return self.camNumDict
+    def QueryCameras(self, refresh: bool = False) -> dict:
+        self._ensure(refresh)
+        with self.lock:
+            return dict(self.camNumDict)
+
+    # 查找某个格式，没有时返回None
+    def FindFormat(self, camName, width: int, height: int, fps: int, pixel_format: str):
+        self._ensure()
+        with self.lock:
+            formats = self.formatIndex.get(camName, {})
+        return formats.get((width, height, fps, pixel_format))
 
+    """
+    获得相机的可用视频格式(CameraFormat列表)，按宽、高、fps以及像素格式过滤
+    先在按宽度排序的列表中二分查找到min_width的位置，结果按相机给出的顺序返回，并按过滤条件缓存
+    其他线程的查询可能在_ensure()中替换缓存，因此在锁内取出同一次枚举的格式列表和查询缓存，之后只使用取出的对象
+    """
+    def GetFormatRecords(self, camName, min_width=640, min_fps=30, min_height=480, max_height=10000,
+                         max_width=100000, max_fps=1000, pixel_format=None) -> list:
+        self._ensure()
+        key = (camName, min_width, min_fps, min_height, max_height, max_width, max_fps, pixel_format)
+        with self.lock:
+            queryCache = self.queryCache
+            formats = self.sortedFormats.get(camName, [])
+            widths = self.sortedWidths.get(camName, [])
+            result = queryCache.get(key)
+        if result is not None:
+            return result
+        start = bisect.bisect_left(widths, min_width)
+        result = []
+        for fmt in formats[start:]:
+            if fmt.width > max_width:
+                break
+            if fmt.height < min_height or fmt.height > max_height \
+                    or fmt.fps < min_fps or fmt.fps > max_fps:
+                continue
+            if pixel_format is not None and fmt.pixel_format != pixel_format:
+                continue
+            result.append(fmt)
+        result.sort(key=lambda f: f.order)      # 恢复相机给出的顺序
+        with self.lock:     # 期间缓存被替换时写入的是旧的缓存，不影响新的查询
+            queryCache[key] = result
+        return result
 
     """
     获得当前相机的可用视频格式, 可以通过min_width和min_height来设定最小尺寸
-    返回的格式列表形如：
+    返回的格式列表按相机给出的顺序，形如：
         ['2592x1944 30fps Jpeg', '1920x1080 30fps Jpeg', '1280x720 30fps Jpeg',
-        '1280x960 30fps Jpeg', '2048x1536 30fps Jpeg', '1920x1080 3fps YUYV', 
+        '1280x960 30fps Jpeg', '2048x1536 30fps Jpeg', '1920x1080 3fps YUYV',
         '1280x720 8fps YUYV', '2592x1944 2fps YUYV', '1280x960 8fps YUYV', '2048x1536 3fps YUYV']
+    structured=True时返回dict的列表，见CameraFormat.to_dict
     """
-    def GetAvailableFormats(self, camName, min_width=640, min_fps=30, min_height=480, max_height=10000) ->list:
-        if camName not in self.camDevDict:
-            return []
-        curCamDev = self.camDevDict[camName]
-        # self.curCam = QCamera()
-        formatList = curCamDev.videoFormats()
-        self.formatDict = {}
-        for camFormat in formatList:
-            w = str(camFormat.resolution().width())
-            h = str(camFormat.resolution().height())
-            if camFormat.resolution().width()<min_width \
-                or camFormat.resolution().height()<min_height \
-                or camFormat.resolution().height()>max_height \
-                or camFormat.minFrameRate()< min_fps :
-                continue
-            fps = str(int(camFormat.minFrameRate())) + 'fps'
-
-            pf = camFormat.pixelFormat().name   # .decode('utf-8')
-            if pf.endswith('Invalid'):
-                continue
-            # pf = pf.removeprefix('Format_')           # python 3.9
-            pf = pf.replace("Format_", "")
-            _formatStr = w + 'x' + h + " " + fps + " " + pf
-            self.formatDict[_formatStr] = camFormat
-        return list(self.formatDict.keys())
+    def GetAvailableFormats(self, camName, min_width=640, min_fps=30, min_height=480, max_height=10000,
+                            max_width=100000, max_fps=1000, pixel_format=None, structured=False) ->list:
+        formats = self.GetFormatRecords(camName, min_width, min_fps, min_height, max_height,
+                                        max_width, max_fps, pixel_format)
+        if structured:
+            return [fmt.to_dict() for fmt in formats]
+        return [fmt.name for fmt in formats]
 
 
 if __name__ == "__main__":
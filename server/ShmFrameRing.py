@@ -0,0 +1,78 @@
+import os
+import secrets
+import numpy as np
+from multiprocessing import shared_memory
+
+from WireFormat import SLOT_HEADER, SLOT_HEADER_SIZE, NOTIFY, SHM_NAME_PREFIX
+
+
+"""
+共享内存中的图像帧环形缓冲区，用于与服务端在同一台机器上的客户端
+服务端把未压缩的图像写入共享内存的槽位，数据流中只发送通知(NOTIFY，格式见WireFormat)，
+客户端直接把槽位映射为numpy数组，省去编码、TCP传输和解码。
+写入时先把槽位头中的seq清零，写完图像后再写入seq，客户端据此判断槽位是否正在被改写或已被覆盖。
+"""
+
+
+def align64(n: int) -> int:
+    return (n + 63) // 64 * 64
+
+
+class ShmFrameRing:
+    def __init__(self, stream_id: int, slot_size: int, slot_num: int = 8) -> None:
+        self.name = SHM_NAME_PREFIX % os.getpid() + '%d_%s' % (stream_id, secrets.token_hex(4))
+        self.slot_size = align64(slot_size)
+        self.stride = SLOT_HEADER_SIZE + self.slot_size
+        self.slot_num = slot_num
+        self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.stride * slot_num)
+
+    def fits(self, nbytes: int) -> bool:
+        return nbytes <= self.slot_size
+
+    # 写入一帧图像，返回发送给客户端的通知
+    def write(self, image: np.ndarray, seq: int) -> bytes:
+        h, w = image.shape[:2]
+        c = 1 if image.ndim == 2 else image.shape[2]
+        slot = seq % self.slot_num
+        offset = slot * self.stride
+        buf = self.shm.buf
+        SLOT_HEADER.pack_into(buf, offset, 0, 0, 0, 0, 0)      # 标记为正在写入
+        dst = np.ndarray(image.shape, np.uint8, buffer=buf, offset=offset + SLOT_HEADER_SIZE)
+        dst[...] = image
+        del dst
+        SLOT_HEADER.pack_into(buf, offset, seq, image.nbytes, h, w, c)
+        return NOTIFY.pack(self.name.encode('ascii'), self.stride, slot, seq, image.nbytes, h, w, c)
+
+    # 删除共享内存的名称，已经映射的客户端仍可以继续访问
+    def unlink(self):
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self.unlink()
+        try:
+            self.shm.close()
+        except BufferError:     # 仍有写入在进行，交给GC回收
+            pass
+
+
+"""
+set_transport('shm')时创建的探测用共享内存，写入随机的token，名称和token放在应答中，
+客户端能打开并读到相同的token才说明与服务端共享内存(回环地址不代表同一台机器，例如WSL的mirrored网络)。
+在该控制连接关闭或再次设置传输方式时释放
+"""
+class ShmProbe:
+    def __init__(self) -> None:
+        self.token = secrets.token_hex(8)
+        self.name = SHM_NAME_PREFIX % os.getpid() + 'probe_%s' % secrets.token_hex(4)
+        self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=len(self.token))
+        self.shm.buf[:len(self.token)] = self.token.encode('ascii')
+
+    def close(self):
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm.close()
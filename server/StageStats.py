@@ -0,0 +1,112 @@
+import threading
+import time
+
+
+"""
+流水线各阶段的低开销统计：耗时直方图和速率计数
+客户端(接收、解码、校正、处理函数)也使用本模块(client/StageStats.py是本文件的拷贝，两份必须完全相同)，按视频流各有一个StageStats
+直方图按2的幂次划分区间(微秒)，记录一次只需要一次整数运算和一次加锁，
+百分位数取所在区间的上界，精度为2倍以内，足以发现瓶颈。
+"""
+
+HIST_BUCKETS = 32       # 第i个区间为[2^(i-1), 2^i)微秒，最后一个区间包含更大的值
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * HIST_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    # 记录一次耗时(秒)
+    def record(self, dur: float):
+        idx = min(int(dur * 1e6).bit_length(), HIST_BUCKETS - 1)
+        with self.lock:
+            self.buckets[idx] += 1
+            self.count += 1
+            self.total += dur
+            if dur > self.max:
+                self.max = dur
+
+    # 百分位数(毫秒)
+    def percentile(self, p: float) -> float:
+        with self.lock:
+            buckets = list(self.buckets)
+            count = self.count
+        if count == 0:
+            return 0.0
+        target = count * p / 100.0
+        acc = 0
+        for idx, n in enumerate(buckets):
+            acc += n
+            if acc >= target:
+                return (1 << idx) / 1000.0
+        return self.max * 1000.0
+
+    def to_dict(self) -> dict:
+        count = self.count
+        return {'count': count,
+                'avg_ms': self.total * 1000.0 / count if count else 0.0,
+                'max_ms': self.max * 1000.0,
+                'p50_ms': self.percentile(50),
+                'p90_ms': self.percentile(90),
+                'p99_ms': self.percentile(99)}
+
+
+# 速率计数，按window秒的时间窗统计，返回上一个完整时间窗的速率
+class RateMeter:
+    def __init__(self, window: float = 1.0) -> None:
+        self.window = window
+        self.total = 0
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.last_rate = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, n: int = 1):
+        now = time.monotonic()
+        with self.lock:
+            self.total += n
+            self.window_count += n
+            elapsed = now - self.window_start
+            if elapsed >= self.window:
+                self.last_rate = self.window_count / elapsed
+                self.window_start = now
+                self.window_count = 0
+
+    def rate(self) -> float:
+        # 超过两个时间窗没有新的计数，说明已经停止
+        if time.monotonic() - self.window_start > 2 * self.window:
+            return 0.0
+        return self.last_rate
+
+    def to_dict(self) -> dict:
+        return {'total': self.total, 'per_s': self.rate()}
+
+
+# 一组命名的直方图和速率计数
+class StageStats:
+    def __init__(self) -> None:
+        self.hists = {}
+        self.rates = {}
+        self.lock = threading.Lock()
+
+    def hist(self, name: str) -> LatencyHistogram:
+        h = self.hists.get(name)
+        if h is None:
+            with self.lock:
+                h = self.hists.setdefault(name, LatencyHistogram())
+        return h
+
+    def rate(self, name: str) -> RateMeter:
+        r = self.rates.get(name)
+        if r is None:
+            with self.lock:
+                r = self.rates.setdefault(name, RateMeter())
+        return r
+
+    def to_dict(self) -> dict:
+        return {'latency': {name: h.to_dict() for name, h in list(self.hists.items())},
+                'rate': {name: r.to_dict() for name, r in list(self.rates.items())}}
@@ -0,0 +1,130 @@
+import itertools
+import threading
+
+import cv2
+import numpy as np
+
+from WireFormat import TILES_HEADER, TILE_ENTRY
+
+
+"""
+分块增量传输('tiles'编码)，用于场景基本静止的相机(如固定的检测相机)
+把图像划分为tile_size x tile_size的块，只编码和发送与上次编码时相比发生变化的块，
+变化的块数过多以及每隔KEYFRAME_INTERVAL帧时编码整幅图像(关键帧)。
+数据格式见WireFormat(TILES_HEADER)，客户端的TileDecoder在关键帧上依次覆盖收到的块，得到完整的图像。
+
+编码器保存每个块最新的编码结果以及其编码时的帧序号，每一帧生成一个快照(TileFrame)。
+每个订阅者记录自己上次发送的帧序号，从快照中选出此后更新过的块(订阅者丢帧时把多帧的变化合并发送)，
+因此一次编码的结果可以分给处于不同进度的订阅者。
+"""
+
+TILE_SIZE = 64
+PIXEL_THRESHOLD = 24        # 像素的差异(各通道的最大值)超过该值才认为变化，忽略传感器噪声
+MIN_CHANGED_PIXELS = 4      # 块中变化的像素超过该个数时重新编码该块
+FULL_FRAME_RATIO = 0.5      # 变化的块超过该比例时直接编码整幅图像
+KEYFRAME_INTERVAL = 150     # 关键帧间隔(帧)
+
+_encoder_ids = itertools.count(1)
+
+
+# 一帧的快照: 关键帧以及之后更新过的块
+class TileFrame:
+    def __init__(self, encoder_id: int, width: int, height: int, tile_size: int, base, base_seq: int,
+                 tiles: list, updated: np.ndarray) -> None:
+        self.encoder_id = encoder_id
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.base = base                # 关键帧的JPEG数据
+        self.base_seq = base_seq
+        self.tiles = tiles              # 块序号 -> 在关键帧之后最新的编码结果
+        self.updated = updated          # 块序号 -> 该块编码时的帧序号，0表示关键帧之后未更新
+
+    """
+    生成发送给一个订阅者的数据，last_seq为该订阅者上一次收到的帧序号，None表示客户端还没有任何图像
+    客户端没有收到当前的关键帧时附带关键帧
+    """
+    def build(self, last_seq) -> bytes:
+        with_base = last_seq is None or last_seq < self.base_seq
+        indices = np.flatnonzero(self.updated > (0 if with_base else last_seq))
+        parts = [TILES_HEADER.pack(self.width, self.height, self.tile_size, self.tile_size,
+                                   len(self.base) if with_base else 0, len(indices))]
+        if with_base:
+            parts.append(self.base)
+        for idx in indices:
+            tile = self.tiles[idx]
+            parts.append(TILE_ENTRY.pack(idx, len(tile)))
+            parts.append(tile)
+        return b''.join(parts)
+
+
+"""
+一个视频流上一组编码参数(CodecConfig)对应的分块编码器，params为块及关键帧的JPEG编码参数
+编码线程池中多个线程可能同时调用encode()，比已编码的帧更旧的帧返回None(订阅者跳过该帧)
+"""
+class TileEncoder:
+    def __init__(self, params: list, tile_size: int = TILE_SIZE) -> None:
+        self.params = params
+        self.tile_size = tile_size
+        self.lock = threading.Lock()
+        self.id = next(_encoder_ids)
+        self.last_seq = 0
+        self.ref = None             # 各块最近一次编码时的图像，用于检测变化
+        self.base = None
+        self.base_seq = 0
+        self.tiles = []
+        self.updated = None
+        self.row_starts = None
+        self.col_starts = None
+
+    # 图像尺寸改变时重新划分
+    def reset(self, height: int, width: int):
+        self.id = next(_encoder_ids)
+        self.row_starts = np.arange(0, height, self.tile_size)
+        self.col_starts = np.arange(0, width, self.tile_size)
+        self.tiles = [None] * (len(self.row_starts) * len(self.col_starts))
+        self.updated = np.zeros(len(self.tiles), np.int64)
+
+    # 与上次编码时相比发生变化的块序号
+    def changed_tiles(self, image) -> np.ndarray:
+        diff = cv2.absdiff(image, self.ref)
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+        mask = diff > PIXEL_THRESHOLD
+        counts = np.add.reduceat(mask, self.row_starts, axis=0, dtype=np.int32)
+        counts = np.add.reduceat(counts, self.col_starts, axis=1)
+        return np.flatnonzero(counts.reshape(-1) > MIN_CHANGED_PIXELS)
+
+    def encode(self, image, seq: int):
+        with self.lock:
+            if seq <= self.last_seq:
+                return None
+            self.last_seq = seq
+            height, width = image.shape[:2]
+            changed = None
+            if self.ref is None or self.ref.shape != image.shape:
+                self.reset(height, width)
+            elif seq - self.base_seq < KEYFRAME_INTERVAL:
+                changed = self.changed_tiles(image)
+                if len(changed) > len(self.tiles) * FULL_FRAME_RATIO:
+                    changed = None
+            if changed is None:     # 关键帧
+                self.base = cv2.imencode('.jpg', image, self.params)[1].reshape(-1)
+                self.base_seq = seq
+                self.tiles = [None] * len(self.tiles)
+                self.updated = np.zeros_like(self.updated)
+                self.ref = image.copy()
+            else:
+                cols = len(self.col_starts)
+                tiles = list(self.tiles)    # 旧的快照仍在使用中，不能原地修改
+                for idx in changed:
+                    y0 = self.row_starts[idx // cols]
+                    x0 = self.col_starts[idx % cols]
+                    y1, x1 = y0 + self.tile_size, x0 + self.tile_size
+                    tiles[idx] = cv2.imencode('.jpg', image[y0:y1, x0:x1], self.params)[1].reshape(-1)
+                    self.ref[y0:y1, x0:x1] = image[y0:y1, x0:x1]
+                self.tiles = tiles
+                self.updated = self.updated.copy()
+                self.updated[changed] = seq
+            return TileFrame(self.id, width, height, self.tile_size, self.base, self.base_seq,
+                             self.tiles, self.updated)
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# 与bench相同，服务端和客户端的模块都以平铺的方式导入
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root / 'server'))
+sys.path.insert(0, str(root / 'client'))
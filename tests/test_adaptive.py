@@ -0,0 +1,118 @@
+import socket
+
+import pytest
+
+import AdaptiveController as adaptive_module
+from AdaptiveController import AdaptiveController
+from FrameBroadcaster import DataSubscriber
+from FrameCodec import CodecConfig
+
+
+# 代替time模块，测试时手动推进时间
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+class Frame:
+    def __init__(self, capture_ts: float) -> None:
+        self.capture_ts = capture_ts
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(adaptive_module, 'time', clock)
+    return clock
+
+
+# 一个评估周期: 发送n帧，每帧从采集到发送完成的延迟为latency
+def period(controller: AdaptiveController, clock: FakeClock, latency: float, n: int = 10, dropped: int = 0, queued: int = 0):
+    for _ in range(n):
+        clock.now += controller.interval / n
+        controller.on_sent(Frame(clock.now - latency))
+    clock.now += 1e-6       # 避免累加的误差使周期略短于interval
+    return controller.update(dropped, queued)
+
+
+def operating_point(codec: CodecConfig) -> tuple:
+    return codec.quality, 1.0 if codec.scale is None else codec.scale
+
+
+def test_steps_down_quality_then_scale(clock):
+    controller = AdaptiveController(CodecConfig('jpeg'), target_latency=0.2, min_quality=30, max_quality=90,
+                                    quality_step=20, min_scale=0.5)
+    assert operating_point(controller.codec) == (90, 1.0)
+    points = []
+    for _ in range(20):     # 发送积压，延迟一直高于目标
+        codec = period(controller, clock, 0.3, queued=2)
+        if codec is not None:
+            points.append(operating_point(codec))
+    assert points == [(70, 1.0), (50, 1.0), (30, 1.0), (30, 0.75), (30, 0.5)]
+    assert period(controller, clock, 0.3, queued=2) is None     # 已是最低的工作点
+    assert controller.changes == 5
+
+
+def test_severe_congestion_steps_two_levels(clock):
+    controller = AdaptiveController(CodecConfig('jpeg'), target_latency=0.2, quality_step=10)
+    period(controller, clock, 0.05)     # 第一个周期只记录丢帧计数
+    codec = period(controller, clock, 0.05, dropped=100)
+    assert operating_point(codec) == (70, 1.0)
+
+
+def test_steps_up_after_up_hold(clock):
+    controller = AdaptiveController(CodecConfig('jpeg'), target_latency=0.2, quality_step=20, min_quality=30)
+    controller.set_level(3)
+    assert operating_point(controller.codec) == (30, 1.0)
+    results = [period(controller, clock, 0.05) for _ in range(9)]
+    # 改变工作点后的周期不评估，之后连续up_hold(2)个良好的周期才升一级
+    assert [None if codec is None else operating_point(codec) for codec in results] == \
+        [None, None, (50, 1.0), None, None, (70, 1.0), None, None, (90, 1.0)]
+    assert period(controller, clock, 0.05) is None
+
+
+def test_failed_step_up_doubles_up_hold(clock):
+    controller = AdaptiveController(CodecConfig('jpeg'), target_latency=0.2)
+    controller.set_level(2)
+    for _ in range(3):
+        period(controller, clock, 0.05)
+    assert controller.level == 1
+    period(controller, clock, 0.05)     # 改变工作点后的周期
+    period(controller, clock, 0.3)      # 升级后马上又拥塞
+    assert controller.level == 2 and controller.up_hold == 4
+
+
+def test_rebase_keeps_operating_point(clock):
+    controller = AdaptiveController(CodecConfig('jpeg'), target_latency=0.2, quality_step=20)
+    controller.set_level(4)
+    period(controller, clock, 0.3)
+    codec = controller.rebase(CodecConfig('jpeg', roi=[10, 20, 300, 200]))
+    assert operating_point(codec) == controller.levels[4] == (30, 0.75)
+    assert codec.roi == (10, 20, 300, 200)
+    assert period(controller, clock, 0.3) is None       # 队列中还有旧区域的帧，本周期不评估
+    assert period(controller, clock, 0.3).roi == (10, 20, 300, 200)
+
+
+# 自适应控制时set_roi只修改roi，scale仍由控制器决定
+def test_subscriber_set_roi_rebases_controller(clock):
+    a, b = socket.socketpair()
+    try:
+        subscriber = DataSubscriber(a, ('127.0.0.1', 0))
+        controller = AdaptiveController(CodecConfig('jpeg'), target_latency=0.2, quality_step=20)
+        controller.set_level(4)
+        subscriber.set_adaptive(controller)
+        codec = subscriber.set_roi([0, 0, 100, 100], scale=1.0)
+        assert codec is subscriber.codec is controller.codec
+        assert (codec.roi, codec.scale) == ((0, 0, 100, 100), 0.75)
+        subscriber.set_adaptive(None)
+        codec = subscriber.set_roi(None, 0.5)
+        assert (codec.roi, codec.scale) == (None, 0.5)
+    finally:
+        a.close()
+        b.close()
@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+# QCameraInfo依赖PySide6的QtMultimedia(服务端的Windows环境)，不能载入时跳过
+try:
+    import QCameraInfo as camera_info
+except ImportError as e:
+    pytest.skip('QtMultimedia not available: %s' % str(e), allow_module_level=True)
+
+
+# 代替QCameraFormat/QCameraDevice，只提供QCameraInfo用到的接口
+class FakeValue:
+    def __init__(self, **values) -> None:
+        for key, value in values.items():
+            setattr(self, key, (lambda v: lambda: v)(value))
+
+
+class FakeFormat:
+    def __init__(self, width: int, height: int, fps: int, pixel_format: str = 'Jpeg') -> None:
+        self.resolution = lambda: FakeValue(width=width, height=height)
+        self.minFrameRate = lambda: float(fps)
+        self.maxFrameRate = lambda: float(fps)
+        self.pixelFormat = lambda: type('PixelFormat', (), {'name': 'Format_' + pixel_format})()
+
+
+class FakeDevice:
+    def __init__(self, dev_id: bytes, name: str, formats: list) -> None:
+        self.id = lambda: FakeValue(data=dev_id)
+        self.description = lambda: name
+        self.videoFormats = lambda: formats
+
+
+class FakeSignal:
+    def connect(self, slot):
+        self.slot = slot
+
+
+class FakeMediaDevices:
+    devices = []
+    calls = 0
+
+    def __init__(self) -> None:
+        self.videoInputsChanged = FakeSignal()
+
+    @staticmethod
+    def videoInputs() -> list:
+        FakeMediaDevices.calls += 1
+        return list(FakeMediaDevices.devices)
+
+
+FORMATS = [FakeFormat(1920, 1080, 30), FakeFormat(640, 480, 30), FakeFormat(1280, 960, 30),
+           FakeFormat(1280, 960, 8, 'YUYV'), FakeFormat(320, 240, 30)]
+
+
+@pytest.fixture
+def info(monkeypatch):
+    monkeypatch.setattr(camera_info, 'QMediaDevices', FakeMediaDevices)
+    FakeMediaDevices.devices = [FakeDevice(b'usb0', 'cam0', FORMATS)]
+    FakeMediaDevices.calls = 0
+    return camera_info.QCameraInfo()
+
+
+# 模拟经过了DEVICE_CHECK_INTERVAL
+def age(info):
+    info.checkedAt -= camera_info.DEVICE_CHECK_INTERVAL + 1
+
+
+def test_formats_keep_device_order(info):
+    assert info.QueryCameras() == {'cam0': 0}
+    assert info.GetAvailableFormats('cam0') == ['1920x1080 30fps Jpeg', '640x480 30fps Jpeg', '1280x960 30fps Jpeg']
+    assert info.GetAvailableFormats('cam0', min_width=1280, min_fps=0, pixel_format='YUYV') == ['1280x960 8fps YUYV']
+    assert info.FindFormat('cam0', 1280, 960, 30, 'Jpeg').name == '1280x960 30fps Jpeg'
+    assert info.GetAvailableFormats('other') == []
+
+
+def test_enumeration_throttled(info):
+    info.QueryCameras()
+    first = info.GetFormatRecords('cam0')
+    assert FakeMediaDevices.calls == 1
+    for _ in range(10):     # 间隔之内的查询不重新枚举，带过滤条件的查询结果被缓存
+        info.QueryCameras()
+        assert info.GetFormatRecords('cam0') is first
+    assert FakeMediaDevices.calls == 1
+    age(info)
+    assert info.GetFormatRecords('cam0') is first      # 重新枚举，相机列表没有变化时不重新读取格式
+    assert FakeMediaDevices.calls == 2
+    assert info.QueryCameras(refresh=True) == {'cam0': 0}
+    assert FakeMediaDevices.calls == 3
+    assert info.GetFormatRecords('cam0') is not first   # refresh重新读取格式，缓存失效
+
+
+def test_hot_plug_invalidates_cache(info):
+    first = info.GetFormatRecords('cam0')
+    FakeMediaDevices.devices.append(FakeDevice(b'usb1', 'cam1', FORMATS[:1]))
+    assert info.QueryCameras() == {'cam0': 0}          # 间隔之内还没有发现
+    age(info)
+    assert info.QueryCameras() == {'cam0': 0, 'cam1': 1}
+    assert info.GetFormatRecords('cam0') is not first
+    assert info.GetAvailableFormats('cam1') == ['1920x1080 30fps Jpeg']
+
+
+# videoInputsChanged信号(有Qt事件循环时)使缓存立即失效
+def test_invalidate_signal(info):
+    info.QueryCameras()
+    FakeMediaDevices.devices = []
+    info.mediaDevices.videoInputsChanged.slot()
+    assert info.QueryCameras() == {}
+    assert FakeMediaDevices.calls == 2
+
+
+# 其他线程refresh替换缓存的同时查询，结果始终完整
+def test_concurrent_refresh(info):
+    expected = info.GetAvailableFormats('cam0')
+    errors = []
+    stop = threading.Event()
+
+    def query():
+        while not stop.is_set():
+            if info.GetAvailableFormats('cam0') != expected:
+                errors.append('bad result')
+
+    threads = [threading.Thread(target=query) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for _ in range(200):
+        info.QueryCameras(refresh=True)
+    stop.set()
+    for th in threads:
+        th.join()
+    assert errors == []
@@ -0,0 +1,108 @@
+import time
+
+import cv2
+
+from CapturePool import CapturePool
+
+
+# 代替cv2.VideoCapture，记录打开、设置和关闭
+class FakeCapture:
+    def __init__(self, cam_idx: int, log: list) -> None:
+        self.cam_idx = cam_idx
+        self.log = log
+        self.props = {}
+        self.released = False
+        log.append(('open', cam_idx))
+
+    def set(self, prop: int, value) -> bool:
+        self.props[prop] = value
+        return True
+
+    def get(self, prop: int):
+        return self.props.get(prop, 0)
+
+    def grab(self) -> bool:
+        return True
+
+    def isOpened(self) -> bool:
+        return not self.released
+
+    def release(self):
+        self.released = True
+        self.log.append(('release', self.cam_idx))
+
+
+def make_pool(max_open: int = 4, idle_timeout: float = 60.0):
+    log = []
+    return CapturePool(lambda cam_idx: FakeCapture(cam_idx, log), max_open, idle_timeout), log
+
+
+def test_reuse_idle_with_same_size():
+    pool, log = make_pool()
+    try:
+        entry = pool.acquire(0, 640, 480)
+        assert entry.configured
+        pool.release(entry)
+        again = pool.acquire(0, 640, 480)
+        assert again is entry and not again.configured      # 不重新打开，也不重新设置
+        assert log == [('open', 0)]
+        assert pool.get_stats()['reused'] == 1
+        pool.release(again)
+    finally:
+        pool.close()
+
+
+def test_reconfigure_in_place():
+    pool, log = make_pool()
+    try:
+        entry = pool.acquire(0, 640, 480)
+        entry.meta['passthrough'] = True
+        pool.release(entry)
+        again = pool.acquire(0, 1280, 960)
+        assert again is entry and again.configured
+        assert again.size == (1280, 960) and again.meta == {}
+        assert again.cap.get(cv2.CAP_PROP_FRAME_WIDTH) == 1280
+        assert log == [('open', 0)]
+        pool.release(again)
+    finally:
+        pool.close()
+
+
+def test_lru_eviction_at_capacity():
+    pool, log = make_pool(max_open=2)
+    try:
+        a, b = pool.acquire(0, 640, 480), pool.acquire(1, 640, 480)
+        pool.release(a)
+        pool.release(b)
+        c = pool.acquire(2, 640, 480)    # 关闭最久未使用的相机0
+        assert log == [('open', 0), ('open', 1), ('release', 0), ('open', 2)]
+        assert a.cap.released and not b.cap.released
+        assert pool.get_stats()['idle'] == [1]
+        pool.release(c)
+    finally:
+        pool.close()
+    assert b.cap.released and c.cap.released
+
+
+def test_idle_timeout_reaper():
+    pool, log = make_pool(idle_timeout=0.05)
+    try:
+        entry = pool.acquire(0, 640, 480)
+        pool.release(entry)
+        deadline = time.monotonic() + 5.0
+        while not entry.cap.released and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert entry.cap.released
+        assert pool.get_stats()['idle'] == []
+        assert pool.acquire(0, 640, 480) is not entry       # 超时关闭后重新打开
+        assert log == [('open', 0), ('release', 0), ('open', 0)]
+    finally:
+        pool.close()
+
+
+def test_no_pool_when_idle_timeout_is_zero():
+    pool, log = make_pool(idle_timeout=0)
+    entry = pool.acquire(0, 640, 480)
+    pool.release(entry)
+    assert entry.cap.released
+    pool.close()
@@ -0,0 +1,43 @@
+import pytest
+
+from WireFormat import encode_message, decode_message, BINARY_MAGIC
+
+MESSAGE = {'cmd': 'set_codec', 'id': 7, 'data_port': 50123, 'codec': 'jpeg', 'quality': 80,
+           'scale': 0.5, 'roi': [10, 20, 300, 200], 'optimize': False, 'subsampling': None,
+           'big': 1 << 40, 'nested': {'a': [True, 'x', -1.5]}}
+
+
+@pytest.mark.parametrize('encoding', ['json', 'binary'])
+def test_round_trip(encoding):
+    data = encode_message(MESSAGE, encoding)
+    value, decoded_encoding = decode_message(data)
+    assert decoded_encoding == encoding
+    assert value == MESSAGE
+
+
+def test_binary_is_compact():
+    assert encode_message(MESSAGE, 'binary')[:1] == BINARY_MAGIC
+    assert len(encode_message(MESSAGE, 'binary')) < len(encode_message(MESSAGE, 'json'))
+
+
+# 截断在任意位置的二进制数据都报告为ValueError，服务端据此断开连接
+def test_truncated_binary():
+    data = encode_message(MESSAGE, 'binary')
+    for n in range(1, len(data)):
+        with pytest.raises(ValueError):
+            decode_message(data[:n])
+
+
+def test_trailing_bytes():
+    with pytest.raises(ValueError):
+        decode_message(encode_message(MESSAGE, 'binary') + b'N')
+
+
+def test_unknown_tag():
+    with pytest.raises(ValueError):
+        decode_message(BINARY_MAGIC + b'z')
+
+
+def test_cannot_encode():
+    with pytest.raises(ValueError):
+        encode_message({'x': object()}, 'binary')
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from DecodePool import DecodePool
+from FrameHeader import FrameInfo
+from WireFormat import CODEC_JPEG
+
+
+def jpeg(value: int) -> np.ndarray:
+    return cv2.imencode('.jpg', np.full((64, 64, 3), value, np.uint8))[1].reshape(-1)
+
+
+def frame_info(seq: int) -> FrameInfo:
+    info = FrameInfo(0, 0, CODEC_JPEG, 2)
+    info.seq = seq
+    return info
+
+
+def test_delivers_in_receive_order():
+    delivered = []
+    pool = DecodePool(4, lambda info, img, dur: delivered.append((info.seq, int(img[0, 0, 0]))),
+                      max_pending=100)
+    for seq in range(1, 41):
+        if seq % 5 == 0:    # 在接收线程中处理的帧同样按顺序交付
+            pool.put_done(frame_info(seq), np.full((2, 2, 3), seq, np.uint8), 0.0)
+        else:
+            pool.submit(frame_info(seq), jpeg(seq))
+    pool.close()
+    assert [seq for seq, _ in delivered] == list(range(1, 41))
+    assert all(abs(value - seq) <= 2 for seq, value in delivered)
+
+
+def test_newest_wins_when_behind():
+    gate = threading.Event()
+    delivered = []
+
+    def publish(info, img, dur):
+        gate.wait(5.0)      # 交付很慢，解码池中的帧越积越多
+        delivered.append(info.seq)
+    pool = DecodePool(1, publish, max_pending=2)
+    for seq in range(1, 21):
+        pool.submit(frame_info(seq), jpeg(seq))
+        time.sleep(0.002)
+    gate.set()
+    pool.close()
+    assert delivered == sorted(delivered)
+    assert delivered[-1] == 20
+    assert pool.get_skipped(0) > 0
+    assert len(delivered) + pool.get_skipped(0) == 20
@@ -0,0 +1,171 @@
+import selectors
+import socket
+import threading
+import time
+
+import pytest
+
+from EventLoop import EventLoop
+from IpCameraServer import CameraSocketServer
+from FrameSource import SyntheticCapture
+from WireFormat import encode_message, decode_message
+
+PORT = 31400
+
+
+def wait_until(cond, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return cond()
+
+
+@pytest.fixture
+def loop():
+    loop = EventLoop()
+    loop.start()
+    yield loop
+    loop.stop()
+    loop.close()
+
+
+# 其他线程交给循环的回调都在循环线程中按提交顺序执行，不需要轮询
+def test_wakeup_from_other_threads(loop):
+    results = []
+    done = threading.Event()
+
+    def callback(thread_idx: int, i: int):
+        results.append((thread_idx, i, loop.in_loop()))
+        if len(results) == 4 * 50:
+            done.set()
+
+    def post(thread_idx: int):
+        for i in range(50):
+            loop.call_soon_threadsafe(callback, thread_idx, i)
+            if i % 10 == 0:
+                time.sleep(0.005)   # 循环在两次提交之间回到select中等待
+
+    threads = [threading.Thread(target=post, args=(k,)) for k in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert done.wait(5.0)
+    assert all(in_loop for _, _, in_loop in results)
+    for k in range(4):
+        assert [i for thread_idx, i, _ in results if thread_idx == k] == list(range(50))
+
+
+def test_socket_handler_and_stop(loop):
+    a, b = socket.socketpair()
+    received = []
+    got = threading.Event()
+    a.setblocking(False)
+    loop.call_soon_threadsafe(loop.register, a, selectors.EVENT_READ,
+                              lambda mask: (received.append(a.recv(16)), got.set()))
+    b.send(b'ping')
+    assert got.wait(5.0) and received == [b'ping']
+    loop.call_soon_threadsafe(loop.unregister, a)
+    loop.stop()
+    ran = []
+    loop.call_soon_threadsafe(ran.append, threading.get_ident())   # 循环已停止，直接在当前线程执行
+    assert ran == [threading.get_ident()]
+    a.close()
+    b.close()
+
+
+class RawCtrlClient:
+    def __init__(self, port: int) -> None:
+        self.sock = socket.create_connection(('localhost', port + 1))
+        self.sock.settimeout(5.0)
+        self.ids = 0
+
+    def send(self, cmd: dict) -> int:
+        self.ids += 1
+        data = encode_message(dict(cmd, id=self.ids))
+        self.sock.sendall(len(data).to_bytes(4, 'big') + data)
+        return self.ids
+
+    def recv_exactly(self, n: int) -> bytes:
+        data = b''
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if len(chunk) == 0:
+                raise ConnectionError('closed')
+            data += chunk
+        return data
+
+    def recv(self) -> dict:
+        data_len = int.from_bytes(self.recv_exactly(4), 'big')
+        return decode_message(self.recv_exactly(data_len))[0]
+
+
+# 'capture'命令等待gate后才执行，用于在命令执行期间观察会话的状态
+@pytest.fixture
+def gated_server():
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: SyntheticCapture(idx, 60.0))
+    gate, entered = threading.Event(), threading.Event()
+    handle = server.handle_ctrl_cmd
+
+    def gated(cmd, session):
+        if cmd.get('cmd') == 'capture':
+            entered.set()
+            gate.wait(5.0)
+        return handle(cmd, session)
+
+    server.handle_ctrl_cmd = gated
+    server.Start()
+    yield server, gate, entered
+    gate.set()
+    server.Stop()
+
+
+def test_idle_busy_idle_pipelined(gated_server):
+    server, gate, entered = gated_server
+    client = RawCtrlClient(PORT)
+    try:
+        assert wait_until(lambda: len(server.ctrl_sessions) == 1)
+        session = server.ctrl_sessions[0]
+        assert session.state == 'idle'
+        client.send({'cmd': 'set_camera', 'cam_idx': 0, 'width': 160, 'height': 120, 'stream_id': 0})
+        assert client.recv()['result']
+        # 不等应答连续发送，'busy'期间的命令暂存在recv_buf中，按顺序执行
+        first = client.send({'cmd': 'capture'})
+        second = client.send({'cmd': 'stop_capture'})
+        assert entered.wait(5.0)
+        assert wait_until(lambda: len(session.recv_buf) > 0)
+        assert session.state == 'busy'
+        gate.set()
+        responses = [client.recv(), client.recv()]
+        assert [r['id'] for r in responses] == [first, second]
+        assert all(r['result'] for r in responses)
+        assert wait_until(lambda: session.state == 'idle')
+        assert not server.streams[0].is_running()
+    finally:
+        client.sock.close()
+    assert wait_until(lambda: session.state == 'closed' and len(server.ctrl_sessions) == 0)
+
+
+# 命令执行期间客户端半关闭连接: 会话进入'closing'，命令完成后才释放，采集请求不会遗留
+def test_half_close_while_busy(gated_server):
+    server, gate, entered = gated_server
+    client = RawCtrlClient(PORT)
+    try:
+        assert wait_until(lambda: len(server.ctrl_sessions) == 1)
+        session = server.ctrl_sessions[0]
+        client.send({'cmd': 'set_camera', 'cam_idx': 0, 'width': 160, 'height': 120, 'stream_id': 0})
+        assert client.recv()['result']
+        client.send({'cmd': 'capture'})
+        assert entered.wait(5.0)
+        client.sock.shutdown(socket.SHUT_WR)
+        assert wait_until(lambda: session.state == 'closing')
+        assert len(server.ctrl_sessions) == 1
+        gate.set()      # 命令完成后登记了采集请求，随即随会话一起释放
+        assert wait_until(lambda: session.state == 'closed' and len(server.ctrl_sessions) == 0)
+        assert wait_until(lambda: not server.streams[0].is_running())
+        assert len(session.capturing) == 0
+        assert client.sock.recv(4) == b''       # 迟到的应答被丢弃，连接已关闭
+    finally:
+        client.sock.close()
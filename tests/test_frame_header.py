@@ -0,0 +1,97 @@
+import asyncio
+import struct
+
+import pytest
+
+from FrameProtocol import pack_header
+from WireFormat import HEADER_V2, CODEC_JPEG, CODEC_RAW, PIXFMT_BGR
+from FrameHeader import read_header, read_header_async
+
+
+class FakeFrame:
+    stream_id = 3
+    seq = 42
+    capture_ts = 1700000000.25
+    width = 1280
+    height = 960
+    pixfmt = PIXFMT_BGR
+
+
+def reader(data: bytes):
+    pos = 0
+
+    def recv(n):
+        nonlocal pos
+        chunk = data[pos:pos + n]
+        assert len(chunk) == n
+        pos += n
+        return chunk
+    return recv
+
+
+def parse_async(data: bytes):
+    async def run():
+        stream = asyncio.StreamReader()
+        stream.feed_data(data)
+        stream.feed_eof()
+        return await read_header_async(stream.readexactly)
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('parse', [lambda data: read_header(reader(data)), parse_async])
+def test_protocol0(parse):
+    info = parse(pack_header(0, FakeFrame, 12345))
+    assert (info.version, info.stream_id, info.payload_len, info.codec) == (0, 0, 12345, CODEC_JPEG)
+    assert info.seq is None
+
+
+@pytest.mark.parametrize('parse', [lambda data: read_header(reader(data)), parse_async])
+def test_protocol1(parse):
+    info = parse(pack_header(1, FakeFrame, 777, CODEC_RAW))
+    assert (info.version, info.stream_id, info.payload_len, info.codec) == (1, 3, 777, CODEC_RAW)
+    assert info.seq is None
+
+
+@pytest.mark.parametrize('parse', [lambda data: read_header(reader(data)), parse_async])
+def test_protocol2(parse):
+    info = parse(pack_header(2, FakeFrame, 999, encode_dur=0.0025, size=(640, 480)))
+    assert (info.version, info.stream_id, info.payload_len) == (2, 3, 999)
+    assert info.seq == 42
+    assert info.capture_ts == FakeFrame.capture_ts
+    assert info.encode_dur == pytest.approx(0.0025)
+    assert (info.width, info.height, info.pixfmt) == (640, 480, PIXFMT_BGR)
+
+
+# 新版本的服务端在帧头末尾增加字段时，客户端按帧头长度读完并忽略多出的部分
+def test_protocol2_longer_header():
+    head = bytearray(pack_header(2, FakeFrame, 999))
+    extra = 300
+    struct.pack_into('>H', head, 6, HEADER_V2.size + extra)
+    data = bytes(head[:HEADER_V2.size]) + bytes(extra)
+    info = read_header(reader(data))
+    assert (info.seq, info.payload_len) == (42, 999)
+
+
+def test_recv_buffer_longer_header():
+    import socket
+    from RecvBuffer import RecvBuffer
+    head = bytearray(pack_header(2, FakeFrame, 5))
+    extra = 1000
+    struct.pack_into('>H', head, 6, HEADER_V2.size + extra)
+    a, b = socket.socketpair()
+    try:
+        a.sendall(bytes(head) + bytes(extra) + b'hello')
+        buf = RecvBuffer(64)
+        info = read_header(lambda n: buf.recv_head(b, n))
+        n = buf.recv_payload(b, info.payload_len)
+        assert bytes(buf.as_array(n)) == b'hello'
+    finally:
+        a.close()
+        b.close()
+
+
+def test_protocol2_short_header():
+    head = bytearray(pack_header(2, FakeFrame, 1))
+    struct.pack_into('>H', head, 6, 10)
+    with pytest.raises(ValueError):
+        read_header(reader(bytes(head)))
@@ -0,0 +1,51 @@
+import numpy as np
+
+from FrameHeader import FrameInfo
+from WireFormat import CODEC_JPEG, CODEC_TILES
+from FrameRecorder import FrameRecorder, FramePlayer
+
+
+def info(seq: int, ts: float, codec: int = CODEC_JPEG) -> FrameInfo:
+    info = FrameInfo(0, 4, codec, 2)
+    info.seq = seq
+    info.capture_ts = ts
+    info.recv_ts = ts
+    info.width, info.height, info.pixfmt = 4, 4, 0
+    return info
+
+
+def record(path, frames):
+    recorder = FrameRecorder(path)
+    for seq, ts in frames:
+        recorder.write(info(seq, ts), np.frombuffer(b'%04d' % seq, np.uint8))
+    recorder.close()
+    return recorder.get_stats()
+
+
+def test_skip_tiles(tmp_path):
+    recorder = FrameRecorder(tmp_path)
+    recorder.write(info(1, 1.0, CODEC_TILES), np.zeros(4, np.uint8))
+    recorder.close()
+    assert recorder.get_stats()['skipped'] == 1
+
+
+# 服务端重新开始采集(seq从1开始)以及追加录像后，按seq和时间查找仍在各段之内进行
+def test_runs_after_restart_and_append(tmp_path):
+    stats = record(tmp_path, [(1, 10.0), (2, 10.1), (3, 10.2), (1, 10.3), (2, 10.4)])
+    assert stats['written'] == 5
+    record(tmp_path, [(1, 5.0), (2, 5.1)])      # 追加，时钟回退
+    player = FramePlayer(tmp_path, 0)
+    try:
+        assert len(player) == 7
+        assert player.runs() == [(0, 3), (3, 5), (5, 7)]
+        assert player.find_seq(2, run=0) == 1
+        assert player.find_seq(2, run=1) == 4
+        assert player.find_seq(2, run=-1) == 6
+        assert player.find_seq(3) == 2
+        assert player.find_seq(9) == len(player)
+        assert player.find_time(10.25) == 3
+        assert player.find_time(5.05, run=2) == 6
+        index, data = player.read(4)
+        assert bytes(data) == b'0002' and index.seq == 2
+    finally:
+        player.close()
@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+import pytest
+
+from FrameRing import FrameRing
+
+
+def frame(value: int) -> np.ndarray:
+    return np.full((2, 2), value, np.uint8)
+
+
+def test_overwrite_oldest():
+    ring = FrameRing(2)
+    seqs = [ring.publish(frame(i), info=i) for i in range(3)]
+    assert seqs == [1, 2, 3]
+    assert ring.read_seq(1) is None         # 已被第3帧覆盖
+    seq, img, info = ring.read_seq(2)
+    assert (seq, int(img[0, 0]), info) == (2, 1, 1)
+    assert ring.read_latest()[0] == 3
+    assert ring.read_seq(4) is None         # 尚未到达
+
+
+def test_frames_are_read_only():
+    ring = FrameRing(1)
+    ring.publish(frame(1))
+    with pytest.raises(ValueError):
+        ring.read_latest()[1][0, 0] = 0
+
+
+def test_wait_newer_returns_latest():
+    ring = FrameRing(4)
+    for i in range(3):
+        ring.publish(frame(i))
+    seq, img, _ = ring.wait_newer(1, timeout=0)
+    assert seq == 3 and int(img[0, 0]) == 2
+    assert ring.wait_newer(3, timeout=0.01) == (3, None, None)
+
+
+def test_wait_newer_wakes_on_publish_and_close():
+    ring = FrameRing(2)
+    timer = threading.Timer(0.05, ring.publish, (frame(9),))
+    timer.start()
+    seq, img, _ = ring.wait_newer(0, timeout=5.0)
+    assert seq == 1 and int(img[0, 0]) == 9
+    threading.Timer(0.05, ring.close).start()
+    assert ring.wait_newer(1, timeout=5.0) == (1, None, None)
+
+
+def test_capacity():
+    with pytest.raises(ValueError):
+        FrameRing(0)
@@ -0,0 +1,121 @@
+import time
+
+import cv2
+import numpy as np
+
+from FrameHeader import FrameInfo
+from WireFormat import CODEC_JPEG
+from FrameRecorder import FrameRecorder
+from FrameSource import CompressedReplayCapture, SyntheticCapture, is_compressed_source
+
+N = 5
+SIZE = (64, 48)
+
+
+# 各帧颜色不同的平坦图像，JPEG压缩后仍可以按颜色区分
+def make_frames() -> list:
+    return [np.full((SIZE[1], SIZE[0], 3), 20 + i * 40, np.uint8) for i in range(N)]
+
+
+def encode(frames: list) -> list:
+    return [cv2.imencode('.jpg', frame)[1].tobytes() for frame in frames]
+
+
+def read_all(cap, n: int) -> list:
+    frames = []
+    for _ in range(n):
+        ret, frame = cap.read()
+        assert ret
+        frames.append(frame.copy())
+    return frames
+
+
+# 前n帧与原始图像一致，第n+1帧回到开头
+def check_replay(cap, frames: list, n: int):
+    try:
+        assert len(cap) == n
+        assert (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) == SIZE
+        decoded = read_all(cap, n + 1)
+        for i in range(n):
+            assert np.abs(decoded[i].astype(np.int16) - frames[i]).mean() < 3
+        assert np.array_equal(decoded[n], decoded[0])
+        # 不解码时输出JPEG数据本身，同样循环
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        raw = read_all(cap, n)      # 从第2帧开始，最后一帧回到开头
+        assert raw[0].ndim == 2 and raw[0].shape[0] == 1
+        assert np.array_equal(cv2.imdecode(raw[-1], cv2.IMREAD_COLOR), decoded[0])
+    finally:
+        cap.release()
+
+
+def test_jpeg_blob(tmp_path):
+    frames = make_frames()
+    jpegs = encode(frames)
+    path = tmp_path / 'stream.mjpeg'
+    path.write_bytes(b''.join(jpegs))
+    assert is_compressed_source(path)
+    cap = CompressedReplayCapture(str(path), timing='max')
+    assert [int(n) for n in cap.lengths] == [len(jpeg) for jpeg in jpegs]
+    check_replay(cap, frames, N)
+    # 末尾的帧不完整(没有EOI)时被忽略
+    path.write_bytes(b''.join(jpegs[:-1]) + jpegs[-1][:len(jpegs[-1]) // 2])
+    check_replay(CompressedReplayCapture(str(path), timing='max'), frames, N - 1)
+
+
+def test_mjpeg_avi(tmp_path):
+    frames = make_frames()
+    path = tmp_path / 'video.avi'
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 25, SIZE)
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    assert is_compressed_source(path)
+    cap = CompressedReplayCapture(str(path), timing='max')
+    assert np.allclose(cap.periods, 0.04)
+    check_replay(cap, frames, N)
+    # 截断在最后一帧的中间: 该帧被忽略，其余的帧仍可以回放
+    data = path.read_bytes()
+    cut = int(cap.offsets[-1] + cap.lengths[-1] // 2)
+    path.write_bytes(data[:cut])
+    check_replay(CompressedReplayCapture(str(path), timing='max'), frames, N - 1)
+
+
+def record(path, jpegs: list, period: float):
+    recorder = FrameRecorder(path)
+    for i, jpeg in enumerate(jpegs):
+        info = FrameInfo(0, len(jpeg), CODEC_JPEG, 2)
+        info.seq = i + 1
+        info.capture_ts = info.recv_ts = 100.0 + i * period
+        info.width, info.height, info.pixfmt = SIZE[0], SIZE[1], 0
+        recorder.write(info, np.frombuffer(jpeg, np.uint8))
+    recorder.close()
+
+
+def test_recording(tmp_path):
+    frames = make_frames()
+    jpegs = encode(frames)
+    record(tmp_path, jpegs, 0.02)
+    assert is_compressed_source(tmp_path)
+    cap = CompressedReplayCapture(str(tmp_path), timing='max')
+    assert np.allclose(cap.periods, 0.02)
+    check_replay(cap, frames, N)
+    # 按录像中的时间间隔回放
+    cap = CompressedReplayCapture(str(tmp_path), timing='original')
+    try:
+        cap.read()
+        start = time.perf_counter()
+        read_all(cap, N)
+        assert time.perf_counter() - start >= 0.02 * (N - 1)
+    finally:
+        cap.release()
+    # 录像时异常退出，最后一帧的数据不完整: 指向它的索引被忽略
+    seg = tmp_path / '00000.seg'
+    seg.write_bytes(seg.read_bytes()[:-10])
+    check_replay(CompressedReplayCapture(str(tmp_path), timing='max'), frames, N - 1)
+
+
+# 其他文件不被当作压缩数据
+def test_not_compressed(tmp_path):
+    path = tmp_path / 'frame.png'
+    cv2.imwrite(str(path), SyntheticCapture(0, 0).read()[1])
+    assert not is_compressed_source(path)
@@ -0,0 +1,321 @@
+import asyncio
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+from IpCameraServer import CameraSocketServer
+from CameraStream import open_dshow_camera
+from FrameSource import SyntheticCapture
+from IpCameraClient import IpCameraClient
+from AsyncIpCameraClient import AsyncIpCameraClient
+from ShmFrameReader import ShmFrameReader
+from WireFormat import CODEC_SHM
+
+PORT = 31200
+
+
+@pytest.fixture
+def server():
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: SyntheticCapture(idx, 60.0))
+    server.Start()
+    yield server
+    server.Stop()
+
+
+@pytest.mark.parametrize('options', [{}, {'decode_workers': 2}, {'lazy_decode': True}])
+def test_sync_client(server, options):
+    client = IpCameraClient(**options)
+    assert client.connect('localhost', PORT)
+    try:
+        assert client.protocol == 2
+        assert client.set_camera(0, 320, 240)
+        assert client.start_capture()
+        last_seq = 0
+        for _ in range(5):
+            img, info = client.read(timeout=5.0, with_info=True)
+            assert img is not None
+            assert img.shape == (240, 320, 3)
+            assert (info.width, info.height, info.stream_id) == (320, 240, 0)
+            assert info.seq > last_seq      # 按顺序交付
+            last_seq = info.seq
+        small = client.read(timeout=5.0, reduce=4, gray=True)
+        assert small.shape == (60, 80)
+        batch, infos = client.read_batch(3, size=(64, 48), dtype=np.float32, channels_first=True, timeout=5.0)
+        assert batch.shape == (3, 3, 48, 64) and len(infos) == 3
+        assert 0.0 <= batch.min() and batch.max() <= 1.0
+        assert client.stop_capture()
+    finally:
+        client.disconnect()
+
+
+# 多个解码线程并行解码，交付到FrameRing和read_batch返回的帧仍按seq的顺序
+def test_parallel_decode_in_order(server):
+    client = IpCameraClient(decode_workers=4)
+    published = []
+    publish = client.publish_frame
+    client.publish_frame = lambda info, img, decode_dur: (published.append(info.seq), publish(info, img, decode_dur))
+    assert client.connect('localhost', PORT)
+    try:
+        assert client.decode_pool is not None and client.decode_pool.workers == 4
+        assert client.set_camera(0, 640, 480)
+        assert client.start_capture()
+        last_seq = 0
+        for _ in range(5):
+            batch, infos = client.read_batch(4, size=(160, 120), timeout=5.0)
+            assert batch.shape == (4, 120, 160, 3)
+            seqs = [info.seq for info in infos]
+            assert seqs[0] > last_seq and seqs == sorted(set(seqs))
+            last_seq = seqs[-1]
+        assert client.stop_capture()
+    finally:
+        client.disconnect()
+    assert len(published) >= 20
+    assert all(a < b for a, b in zip(published, published[1:]))
+
+
+# 两路合成视频流尺寸不同，read(stream_id)只返回该视频流的图像
+def test_multiple_streams(server):
+    client = IpCameraClient()
+    assert client.connect('localhost', PORT)
+    try:
+        shapes = {0: (240, 320, 3), 1: (120, 160, 3)}
+        assert client.set_camera(0, 320, 240, stream_id=0)
+        assert client.set_camera(1, 160, 120, stream_id=1)
+        assert client.start_capture()
+        for _ in range(3):
+            for stream_id, shape in shapes.items():
+                img, info = client.read(stream_id, timeout=5.0, with_info=True)
+                assert img.shape == shape
+                assert info.stream_id == stream_id
+        # 只订阅视频流1后，视频流0不再有新的图像
+        assert client.subscribe(streams=[1])
+        client.read(1, timeout=5.0)
+        client.read(0, timeout=0.2)         # 订阅改变前已发出的帧
+        assert client.read(1, timeout=5.0).shape == shapes[1]
+        assert client.read(0, timeout=0.3) is None
+        assert client.stop_capture()
+    finally:
+        client.disconnect()
+
+
+def test_set_codec_raw(server):
+    client = IpCameraClient()
+    assert client.connect('localhost', PORT)
+    try:
+        assert client.set_codec('raw')
+        client.set_camera(0, 160, 120)
+        client.start_capture()
+        img = client.read(timeout=5.0)
+        assert img.shape == (120, 160, 3)
+        client.stop_capture()
+    finally:
+        client.disconnect()
+
+
+def test_shm_transport(server):
+    client = IpCameraClient()
+    assert client.connect('localhost', PORT)
+    try:
+        client.set_camera(0, 320, 240)
+        assert client.set_transport('shm')
+        client.start_capture()
+        for _ in range(3):
+            assert client.read(timeout=5.0).shape == (240, 320, 3)
+        client.stop_capture()
+    finally:
+        client.disconnect()
+
+
+def raise_not_found(self, name: str):
+    raise FileNotFoundError(name)
+
+
+# 回环地址的客户端不一定与服务端共享内存(WSL的mirrored网络): 打不开探测共享内存时改回'tcp'
+def test_shm_probe_fails(server, monkeypatch):
+    client = IpCameraClient()
+    assert client.connect('localhost', PORT)
+    try:
+        client.set_camera(0, 320, 240)
+        with monkeypatch.context() as m:
+            m.setattr(ShmFrameReader, 'attach', raise_not_found)
+            assert not client.set_transport('shm')
+        client.start_capture()
+        img, info = client.read(timeout=5.0, with_info=True)
+        assert img.shape == (240, 320, 3) and info.codec != CODEC_SHM
+        assert len(server.ctrl_sessions) == 1 and server.ctrl_sessions[0].shm_probe is None
+        client.stop_capture()
+    finally:
+        client.disconnect()
+
+
+# 已设置'shm'后共享内存打不开: 丢弃这些帧，接收线程继续运行
+def test_shm_attach_fails_drops_frames(server, monkeypatch):
+    client = IpCameraClient()
+    assert client.connect('localhost', PORT)
+    try:
+        client.set_camera(0, 320, 240)
+        assert client.set_transport('shm')
+        with monkeypatch.context() as m:
+            m.setattr(ShmFrameReader, 'attach', raise_not_found)
+            client.start_capture()
+            assert client.read(timeout=0.3) is None
+            assert not client.exitFlag
+        img, info = client.read(timeout=5.0, with_info=True)
+        assert img.shape == (240, 320, 3) and info.codec == CODEC_SHM
+        client.stop_capture()
+    finally:
+        client.disconnect()
+
+
+def read_shape(client, shape: tuple, timeout: float = 5.0) -> tuple:
+    # 修改参数之前已发出的帧尺寸不同，读到期望的尺寸或超时为止
+    deadline = time.monotonic() + timeout
+    img = None
+    while time.monotonic() < deadline:
+        img = client.read(timeout=1.0)
+        if img is not None and img.shape == shape:
+            break
+    return None if img is None else img.shape
+
+
+@pytest.mark.parametrize('roi, scale, shape', [([300, 0, 200, 400], None, (400, 200, 3)),
+                                              ([300, 0, 200, 400], 0.5, (200, 100, 3)),
+                                              (None, 0.5, (240, 320, 3))])
+def test_set_roi(server, roi, scale, shape):
+    client = IpCameraClient()
+    assert client.connect('localhost', PORT)
+    try:
+        client.set_camera(0, 640, 480)
+        client.start_capture()
+        assert client.read(timeout=5.0).shape == (480, 640, 3)
+        assert client.set_roi(roi, scale)
+        assert read_shape(client, shape) == shape
+        client.stop_capture()
+    finally:
+        client.disconnect()
+
+
+def test_async_client(server):
+    async def run():
+        client = AsyncIpCameraClient()
+        assert await client.connect('localhost', PORT)
+        try:
+            assert await client.set_camera(0, 320, 240)
+            assert await client.start_capture()
+            img = await asyncio.wait_for(client.read(), 5.0)
+            assert img.shape == (240, 320, 3)
+            await client.stop_capture()
+        finally:
+            await client.close()
+    asyncio.run(run())
+
+
+# 控制连接断开或close()之后，新的命令立即抛出ConnectionError而不是一直等待
+def test_async_request_after_disconnect():
+    server = CameraSocketServer('localhost', PORT, capture_factory=lambda idx: SyntheticCapture(idx, 60.0))
+    server.Start()
+    stopped = False
+
+    async def run():
+        nonlocal stopped
+        client = AsyncIpCameraClient()
+        assert await client.connect('localhost', PORT)
+        try:
+            assert await client.get_cameras() is not None
+            server.Stop()
+            stopped = True
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(client.get_cameras(), 5.0)
+            assert client.ctrl_task.done() and len(client.pending) == 0
+        finally:
+            await client.close()
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(client.get_cameras(), 5.0)
+    try:
+        asyncio.run(run())
+    finally:
+        if not stopped:
+            server.Stop()
+
+
+# get_server_stats返回服务端get_stats应答的全部内容，两个客户端一致
+def test_server_stats(server):
+    client = IpCameraClient()
+    assert client.connect('localhost', PORT)
+    try:
+        client.set_camera(0, 320, 240)
+        client.start_capture()
+        for _ in range(3):
+            assert client.read(timeout=5.0) is not None
+        stats = client.get_server_stats()
+        assert set(stats) == {'streams', 'subscribers', 'capture_pool'}
+        stream = stats['streams']['0']
+        assert stream['running'] and stream['size'] == [320, 240]
+        assert stream['rate']['capture']['total'] >= 3 and stream['latency']['encode']['count'] >= 3
+        assert len(stats['subscribers']) == 1 and stats['subscribers'][0]['sent'] >= 3
+        assert stats['capture_pool']['in_use'] == 1 and stats['capture_pool']['opened'] == 1
+        client.stop_capture()
+    finally:
+        client.disconnect()
+
+    async def run():
+        client = AsyncIpCameraClient()
+        assert await client.connect('localhost', PORT)
+        try:
+            stats = await client.get_server_stats()
+            assert set(stats) == {'streams', 'subscribers', 'capture_pool'}
+            assert stats['capture_pool']['opened'] == 1 and stats['capture_pool']['in_use'] == 0
+        finally:
+            await client.close()
+    asyncio.run(run())
+
+
+# 代替依赖PySide6的QCameraInfo模块，记录创建的实例和所在的线程
+@pytest.fixture
+def fake_camera_info(monkeypatch):
+    created = []
+
+    class QCameraInfo:
+        def __init__(self) -> None:
+            created.append(threading.current_thread().name)
+            time.sleep(0.05)    # 创建期间其他命令线程也在查询
+
+        def QueryCameras(self, refresh: bool = False) -> dict:
+            return {'cam0': 0}
+
+    monkeypatch.setitem(sys.modules, 'QCameraInfo', types.SimpleNamespace(QCameraInfo=QCameraInfo))
+    return created
+
+
+# 多个连接同时查询相机，命令线程池中只创建一个QCameraInfo
+def test_camera_info_created_once(server, fake_camera_info):
+    clients = [IpCameraClient() for _ in range(4)]
+    try:
+        for client in clients:
+            assert client.connect('localhost', PORT)
+        results = []
+        threads = [threading.Thread(target=lambda c=client: results.append(c.get_cameras())) for client in clients]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        assert results == [{'cam0': 0}] * 4
+        assert len(fake_camera_info) == 1
+    finally:
+        for client in clients:
+            client.disconnect()
+
+
+# 使用真实的相机时，QCameraInfo在调用Start()的线程中创建
+def test_camera_info_created_in_start(fake_camera_info):
+    server = CameraSocketServer('localhost', PORT + 10)
+    assert server.capture_factory is open_dshow_camera
+    server.Start()
+    try:
+        assert fake_camera_info == [threading.current_thread().name]
+    finally:
+        server.Stop()
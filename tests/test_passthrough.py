@@ -0,0 +1,83 @@
+import queue
+
+import cv2
+import numpy as np
+
+from CameraStream import CameraStream
+from FrameCodec import CodecConfig, DEFAULT_CODEC
+from FrameSource import RecordedMjpegCapture
+
+N = 4
+
+
+def make_jpegs() -> list:
+    jpegs = RecordedMjpegCapture.from_synthetic(160, 120, N).jpeg_list
+    return [jpeg.tobytes() for jpeg in jpegs]
+
+
+# 用录制的MJPEG数据源代替相机，返回收到的帧
+def run_stream(jpegs: list, codecs: list, n: int, passthrough: bool = True):
+    frames = queue.Queue()
+    stream = CameraStream(0, frames.put, lambda cam_idx: RecordedMjpegCapture(jpegs, 0),
+                          lambda stream_id: codecs)
+    stream.passthrough = passthrough
+    stream.encoder_num = 1      # 按顺序编码，便于按seq对应录制的数据
+    stream.drop_policy = 'block'
+    stream.configure(0, 160, 120)
+    assert stream.start()
+    try:
+        received = [frames.get(timeout=5.0) for _ in range(n)]
+    finally:
+        stream.stop()
+    return stream, received
+
+
+# enable_raw_output()读取了第一帧，之后的帧从第二个开始
+def source_jpeg(jpegs: list, seq: int) -> bytes:
+    return jpegs[seq % len(jpegs)]
+
+
+def test_passthrough_forwards_camera_jpeg():
+    jpegs = make_jpegs()
+    stream, frames = run_stream(jpegs, [DEFAULT_CODEC], 2 * N)
+    stats = stream.get_stats()
+    assert stats['passthrough'] and stats['size'] == [160, 120]
+    assert stats['rate']['capture']['total'] >= 2 * N and stats['rate']['encode']['total'] >= 2 * N
+    assert stats['corrupt'] == 0
+    for frame in frames:
+        assert bytes(frame.payloads[DEFAULT_CODEC]) == source_jpeg(jpegs, frame.seq)
+        assert frame.encode_durs[DEFAULT_CODEC] == 0.0
+        assert (frame.width, frame.height) == (160, 120)
+
+
+def test_passthrough_disabled_reencodes():
+    jpegs = make_jpegs()
+    stream, frames = run_stream(jpegs, [DEFAULT_CODEC], 2, passthrough=False)
+    assert not stream.get_stats()['passthrough']
+    for frame in frames:
+        assert bytes(frame.payloads[DEFAULT_CODEC]) != source_jpeg(jpegs, frame.seq)
+
+
+"""
+不能解码的JPEG数据(相机输出不完整的帧): 原样转发给默认jpeg编码的订阅者，
+需要解码后重新编码的订阅者跳过这一帧，并计入corrupt
+"""
+def test_truncated_jpeg():
+    jpegs = make_jpegs()
+    jpegs[2] = jpegs[2][:len(jpegs[2]) // 2]
+    png = CodecConfig('png')
+    stream, frames = run_stream(jpegs, [DEFAULT_CODEC, png], 2 * N)
+    corrupt = [frame for frame in frames if frame.seq % N == 2]
+    assert len(corrupt) == 2
+    for frame in frames:
+        assert bytes(frame.payloads[DEFAULT_CODEC]) == source_jpeg(jpegs, frame.seq)
+        if frame in corrupt:
+            assert png not in frame.payloads
+        else:
+            img = cv2.imdecode(np.frombuffer(frame.payloads[png], np.uint8), cv2.IMREAD_COLOR)
+            assert img.shape == (120, 160, 3)
+    # 停止之前可能还编码了几帧，按实际编码的帧数计算
+    stats = stream.get_stats()
+    encoded = stats['rate']['encode']['total']
+    assert stats['corrupt'] == len([seq for seq in range(1, encoded + 1) if seq % N == 2])
+    assert stats['passthrough']
@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+
+from FramePipeline import BoundedQueue, FramePipeline
+from FrameSource import SyntheticCapture
+
+
+def test_bounded_queue_drop_oldest():
+    q = BoundedQueue(2)
+    assert q.put(1) is None and q.put(2) is None
+    assert q.put(3) == 1
+    assert q.dropped == 1
+    assert [q.get(0), q.get(0), q.get(0)] == [2, 3, None]
+
+
+def test_bounded_queue_block():
+    q = BoundedQueue(1, 'block')
+    q.put(1)
+    done = threading.Event()
+    th = threading.Thread(target=lambda: (q.put(2), done.set()))
+    th.start()
+    assert not done.wait(0.1)       # 队列满，put阻塞
+    assert q.get(0) == 1
+    assert done.wait(1.0)
+    th = threading.Thread(target=q.put, args=(3,))     # 队列仍是满的，关闭队列时唤醒阻塞的put
+    th.start()
+    q.close()
+    th.join(1.0)
+    assert not th.is_alive() and q.get(0) is None
+
+
+# 编码耗时不同，输出仍按采集顺序
+def encode_random(frame):
+    time.sleep(random.uniform(0.0, 0.01))
+    frame.payloads[None] = frame.image[:1, :1].copy()
+
+
+def test_ordered_output_and_stop():
+    released = []
+    pipeline = FramePipeline(lambda: SyntheticCapture(0, 0), encode_random, 4, 8, 'block',
+                             release_capture=lambda cap: (released.append(cap), cap.release()))
+    pipeline.start()
+    seqs = []
+    while len(seqs) < 30:
+        frame = pipeline.get(5.0)
+        assert frame is not None and frame.image is None
+        seqs.append(frame.seq)
+    assert seqs == list(range(1, 31))       # 'block'策略不丢帧
+    stats = pipeline.queue_stats()
+    assert stats['capture_queue'] <= 8 and stats['encode_queue'] <= 8
+    pipeline.stop()
+    assert not pipeline.captureThread.is_alive() and not pipeline.dispatchThread.is_alive()
+    assert len(released) == 1 and not released[0].isOpened()
+    assert pipeline.get(0.1) is None
+
+
+def test_drop_oldest_when_slow():
+    pipeline = FramePipeline(lambda: SyntheticCapture(0, 0), lambda frame: time.sleep(0.02), 1, 2)
+    pipeline.start()
+    try:
+        last = 0
+        for _ in range(5):
+            frame = pipeline.get(5.0)
+            assert frame.seq > last
+            last = frame.seq
+        assert pipeline.dropped() > 0
+    finally:
+        pipeline.stop()
+
+
+# 读取若干帧后失败的相机(模拟被拔出)
+class FailingCapture(SyntheticCapture):
+    def __init__(self, good: int) -> None:
+        super().__init__(0, 0)
+        self.good = good
+        self.reads = 0
+
+    def read(self):
+        self.reads += 1
+        if self.reads > self.good:
+            return False, None
+        return super().read()
+
+
+def test_read_failures_reopen():
+    caps = []
+
+    def open_capture():
+        caps.append(FailingCapture(3 if len(caps) == 0 else 1000))
+        return caps[-1]
+
+    pipeline = FramePipeline(open_capture, encode_random, 2, retry_interval=0.01, reopen_after=3)
+    pipeline.start()
+    try:
+        seqs = [pipeline.get(5.0).seq for _ in range(6)]
+        assert seqs == sorted(seqs) and seqs[-1] >= 6
+        stats = pipeline.queue_stats()
+        assert stats['reopened'] == 1 and stats['capture_failed'] == 3
+        assert stats['capture_error'] is None       # 重新打开后恢复正常
+        assert caps[0].reads == 6 and not caps[0].isOpened()
+    finally:
+        pipeline.stop()
+
+
+# 打开相机失败时不退出采集线程，按逐次加倍的间隔重试
+def test_open_failure_backoff():
+    attempts = []
+
+    def open_capture():
+        attempts.append(time.monotonic())
+        raise OSError('no such camera')
+
+    pipeline = FramePipeline(open_capture, encode_random, 1, retry_interval=0.01, max_retry_interval=0.04)
+    pipeline.start()
+    try:
+        time.sleep(0.3)
+        assert pipeline.captureThread.is_alive()
+        assert 3 <= len(attempts) <= 12       # 没有忙等
+        assert pipeline.queue_stats()['capture_error'] == 'open failed: no such camera'
+        assert pipeline.get(0.05) is None
+    finally:
+        start = time.monotonic()
+        pipeline.stop()
+    assert time.monotonic() - start < 0.5      # stop()唤醒等待重试的采集线程
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from FrameHeader import FrameInfo
+from FrameDecoder import reduce_image
+from FrameSource import SyntheticCapture
+from IpCameraClient import IpCameraClient
+from WireFormat import CODEC_JPEG
+
+WIDTH, HEIGHT = 640, 480
+
+
+def make_jpeg(cam_idx: int = 0) -> np.ndarray:
+    src = SyntheticCapture(cam_idx, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
+    return cv2.imencode('.jpg', src.read()[1], [cv2.IMWRITE_JPEG_QUALITY, 90])[1].reshape(-1)
+
+
+"""
+不连接服务端，由线程直接向客户端的帧缓冲区发布帧，与接收线程的发布方式相同:
+lazy为True时发布压缩的数据(lazy_decode)，否则发布解码后的图像
+"""
+class Feeder:
+    def __init__(self, client: IpCameraClient, lazy: bool, streams=(0,)) -> None:
+        self.client = client
+        self.jpegs = {sid: make_jpeg(sid) for sid in streams}
+        self.lazy = lazy
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def publish(self, stream_id: int, seq: int):
+        jpeg = self.jpegs[stream_id]
+        info = FrameInfo(stream_id, len(jpeg), CODEC_JPEG, 2)
+        info.seq, info.width, info.height = seq, WIDTH, HEIGHT
+        if self.lazy:
+            info.encoded = True
+            self.client.get_ring(stream_id).publish(jpeg.copy(), info)
+        else:
+            self.client.get_ring(stream_id).publish(cv2.imdecode(jpeg, cv2.IMREAD_COLOR), info)
+
+    def run(self):
+        seq = 0
+        while not self.stop_event.is_set():
+            seq += 1
+            for stream_id in self.jpegs:
+                self.publish(stream_id, seq)
+            time.sleep(0.002)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop_event.set()
+        self.thread.join()
+
+
+@pytest.fixture(params=[False, True], ids=['decoded', 'lazy'])
+def client(request):
+    client = IpCameraClient(lazy_decode=request.param)
+    yield client
+    client.disconnect()
+
+
+@pytest.mark.parametrize('reduce, gray, shape', [(1, False, (480, 640, 3)), (2, False, (240, 320, 3)),
+                                                (4, True, (120, 160)), (8, True, (60, 80))])
+def test_read_reduce_gray_shapes(client, reduce, gray, shape):
+    with Feeder(client, client.lazy_decode):
+        img = client.read(timeout=5.0, reduce=reduce, gray=gray)
+    assert img.shape == shape and img.dtype == np.uint8
+
+
+# 延迟解码与接收时解码的结果: 原尺寸完全相同，缩小解码(DCT缩放)与解码后缩小只有很小的差别
+@pytest.mark.parametrize('reduce, gray', [(1, False), (1, True), (4, False), (8, True)])
+def test_lazy_matches_full_decode(reduce, gray):
+    jpeg = make_jpeg()
+    full = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+    lazy_client = IpCameraClient(lazy_decode=True)
+    try:
+        with Feeder(lazy_client, True):
+            lazy = lazy_client.read(timeout=5.0, reduce=reduce, gray=gray)
+    finally:
+        lazy_client.disconnect()
+    expected = reduce_image(full, reduce, gray)
+    assert lazy.shape == expected.shape
+    diff = np.abs(lazy.astype(np.int16) - expected)
+    if reduce == 1 and not gray:
+        assert diff.max() == 0
+    else:
+        assert diff.mean() < 3.0
+
+
+@pytest.mark.parametrize('dtype, channels_first, gray, shape', [
+    (np.uint8, False, False, (4, 120, 160, 3)),
+    (np.uint8, True, False, (4, 3, 120, 160)),
+    (np.float32, True, False, (4, 3, 120, 160)),
+    (np.float32, False, True, (4, 120, 160, 1))])
+def test_batch_shapes(client, dtype, channels_first, gray, shape):
+    with Feeder(client, client.lazy_decode):
+        batch, infos = client.read_batch(4, size=(160, 120), dtype=dtype, channels_first=channels_first,
+                                         gray=gray, timeout=5.0)
+        assert batch.shape == shape and batch.dtype == dtype and len(infos) == 4
+        assert [info.seq for info in infos] == sorted(info.seq for info in infos)
+        again, _ = client.read_batch(4, size=(160, 120), dtype=dtype, channels_first=channels_first,
+                                     gray=gray, timeout=5.0)
+    assert again is batch       # 形状相同时复用同一个数组
+    if dtype == np.float32:
+        assert 0.0 <= batch.min() and batch.max() <= 1.0
+
+
+# 批数组的内容与逐帧read()后缩放一致；延迟解码时按缩小的尺寸解码，只有很小的差别
+def test_batch_matches_read(client):
+    with Feeder(client, client.lazy_decode):
+        batch, _ = client.read_batch(2, size=(160, 120), timeout=5.0)
+        img = client.read(timeout=5.0)
+    expected = cv2.resize(img, (160, 120), interpolation=cv2.INTER_AREA)
+    for item in batch:
+        diff = np.abs(item.astype(np.int16) - expected)
+        assert diff.max() == 0 if not client.lazy_decode else diff.mean() < 3.0
+
+
+def test_batch_streams_interleaved(client):
+    with Feeder(client, client.lazy_decode, streams=(0, 1)):
+        batch, infos = client.read_batch(3, size=(80, 60), streams=[0, 1], timeout=5.0)
+    assert batch.shape == (6, 60, 80, 3)
+    assert [info.stream_id for info in infos] == [0, 1, 0, 1, 0, 1]
+
+
+def test_batch_timeout_and_empty(client):
+    start = time.monotonic()
+    assert client.read_batch(2, size=(80, 60), timeout=0.2) == (None, [])
+    assert time.monotonic() - start < 2.0
+    # 只有一帧时，第二帧超时，整批返回(None, [])
+    feeder = Feeder(client, client.lazy_decode)
+    feeder.publish(0, 1)
+    assert client.read_batch(2, size=(80, 60), timeout=0.2) == (None, [])
+    with pytest.raises(ValueError):
+        client.read_batch(0)
+    with pytest.raises(ValueError):
+        client.read_batch(2, streams=[])
@@ -0,0 +1,89 @@
+import numpy as np
+
+from ShmFrameRing import ShmFrameRing, ShmProbe
+from ShmFrameReader import ShmFrameReader
+from CameraStream import CameraStream
+
+
+def image(value: int, shape=(48, 64, 3)) -> np.ndarray:
+    return np.full(shape, value, np.uint8)
+
+
+def test_write_read_round_trip():
+    ring, reader = ShmFrameRing(0, image(0).nbytes, 4), ShmFrameReader()
+    try:
+        for seq, shape in ((1, (48, 64, 3)), (2, (48, 64))):
+            img = reader.read(ring.write(image(seq, shape), seq))
+            assert img.shape == shape
+            assert np.array_equal(img, image(seq, shape))
+            del img
+    finally:
+        reader.close()
+        ring.close()
+
+
+# 槽位被新的帧覆盖后，旧的通知读不到图像
+def test_reader_detects_overwrite():
+    ring, reader = ShmFrameRing(0, image(0).nbytes, 2), ShmFrameReader()
+    try:
+        old = ring.write(image(1), 1)
+        ring.write(image(3), 3)     # 与第1帧使用同一个槽位
+        assert reader.read(old) is None
+        img = reader.read(ring.write(image(4), 4))
+        assert int(img[0, 0, 0]) == 4
+        del img
+    finally:
+        reader.close()
+        ring.close()
+
+
+# 图像大于槽位时换一块更大的共享内存，已映射旧共享内存的客户端仍可以读取
+def test_ring_grows_for_larger_frames():
+    stream, reader = CameraStream(0, lambda frame: None), ShmFrameReader()
+    try:
+        small = stream.write_shm(image(1), 1)
+        first = stream.shm_ring
+        assert int(reader.read(small)[0, 0, 0]) == 1
+        large = stream.write_shm(image(2, (96, 128, 3)), 2)
+        assert stream.shm_ring is not first
+        assert stream.retired_shm_rings == [first]
+        img = reader.read(large)
+        assert img.shape == (96, 128, 3) and int(img[0, 0, 0]) == 2
+        del img
+        assert stream.write_shm(image(3), 3)
+        assert stream.shm_ring.fits(image(0, (96, 128, 3)).nbytes)     # 变小后继续使用大的共享内存
+    finally:
+        reader.close()
+        stream.close_shm()
+
+
+# 换用新的共享内存后，读取端在旧的图像不再被引用时关闭旧的共享内存
+def test_reader_detaches_replaced_ring():
+    stream, reader = CameraStream(0, lambda frame: None), ShmFrameReader()
+    try:
+        old = reader.read(stream.write_shm(image(1), 1))
+        first = stream.shm_ring
+        img = reader.read(stream.write_shm(image(2, (96, 128, 3)), 2))
+        assert list(reader.shms) == [stream.shm_ring.name]
+        assert len(reader.retired) == 1     # old仍引用旧的共享内存
+        assert int(old[0, 0, 0]) == 1
+        del old
+        del img
+        img = reader.read(stream.write_shm(image(3), 3))
+        assert reader.retired == [] and first.name not in reader.shms
+        assert int(img[0, 0, 0]) == 3
+        del img
+    finally:
+        reader.close()
+        stream.close_shm()
+
+
+def test_probe():
+    probe, reader = ShmProbe(), ShmFrameReader()
+    try:
+        assert reader.probe(probe.name, probe.token)
+        assert not reader.probe(probe.name, '0' * len(probe.token))
+        assert len(reader.shms) == 0    # 探测之后不保留
+    finally:
+        reader.close()
+        probe.close()
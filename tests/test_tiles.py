@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+from TileEncoder import TileEncoder
+from TileDecoder import TileDecoder
+from FrameSource import SyntheticCapture
+
+PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 95]
+
+
+def synthetic(width: int = 320, height: int = 240) -> np.ndarray:
+    src = SyntheticCapture(0, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return src.read()[1]
+
+
+def decode(decoder: TileDecoder, payload: bytes):
+    return decoder.decode(np.frombuffer(payload, np.uint8))
+
+
+def assert_close(a: np.ndarray, b: np.ndarray):
+    assert a.shape == b.shape
+    assert np.abs(a.astype(np.int16) - b).mean() < 3.0
+
+
+def test_round_trip_with_changed_tiles():
+    encoder, decoder = TileEncoder(PARAMS), TileDecoder()
+    image = synthetic()
+    assert_close(decode(decoder, encoder.encode(image, 1).build(None)), image)
+    changed = image.copy()
+    changed[100:140, 200:260] = (0, 0, 255)
+    snapshot = encoder.encode(changed, 2)
+    assert np.count_nonzero(snapshot.updated) > 0
+    payload = snapshot.build(1)
+    assert len(payload) < len(snapshot.base)    # 只发送变化的块
+    assert_close(decode(decoder, payload), changed)
+
+
+def test_lagging_subscriber_gets_merged_changes():
+    encoder = TileEncoder(PARAMS)
+    image = synthetic()
+    first = encoder.encode(image, 1)
+    a = image.copy()
+    a[0:50, 0:50] = 255
+    encoder.encode(a, 2)
+    b = a.copy()
+    b[150:200, 250:300] = 0
+    latest = encoder.encode(b, 3)
+    decoder = TileDecoder()
+    decode(decoder, first.build(None))
+    assert_close(decode(decoder, latest.build(1)), b)   # 跳过了第2帧
+
+
+def test_out_of_order_and_missing_keyframe():
+    encoder = TileEncoder(PARAMS)
+    image = synthetic()
+    snapshot = encoder.encode(image, 5)
+    assert encoder.encode(image, 4) is None             # 比已编码的帧更旧
+    assert decode(TileDecoder(), snapshot.build(5)) is None   # 没有关键帧
@@ -0,0 +1,69 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from Undistorter import Undistorter
+from FrameSource import SyntheticCapture
+
+MATRIX = np.array([[300.0, 0.0, 160.0], [0.0, 300.0, 120.0], [0.0, 0.0, 1.0]])
+DISTORTION = np.array([[-0.3, 0.1, 0.001, 0.001, 0.0]])
+
+
+def make_image(width: int = 320, height: int = 240) -> np.ndarray:
+    src = SyntheticCapture(0, 0)
+    src.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    src.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return src.read()[1]
+
+
+# 定点映射表与cv2.undistort(内部同样使用定点映射表)的结果相同，浮点映射表只在个别像素上略有差别
+@pytest.mark.parametrize('fixed_point, max_diff, mean_diff', [(True, 0, 0.0), (False, 8, 0.1)])
+def test_matches_cv_undistort(fixed_point, max_diff, mean_diff):
+    image = make_image()
+    expected = cv2.undistort(image, MATRIX, DISTORTION)
+    result = Undistorter(MATRIX, DISTORTION, fixed_point=fixed_point).undistort(image)
+    diff = np.abs(result.astype(np.int16) - expected)
+    assert diff.max() <= max_diff and diff.mean() <= mean_diff
+
+
+def test_maps_and_buffer_reused():
+    undistorter = Undistorter(MATRIX, DISTORTION)
+    image = make_image()
+    out = np.empty_like(image)
+    first = undistorter.undistort(image, out)
+    maps = undistorter.get_maps(320, 240)
+    second = undistorter.undistort(make_image(), out)
+    assert first is out and second is out
+    assert undistorter.get_maps(320, 240) is maps       # 同一分辨率只计算一次映射表
+    assert np.array_equal(out, undistorter.undistort(make_image()))
+    undistorter.invalidate()
+    assert undistorter.get_maps(320, 240) is not maps
+
+
+# read()把校正结果写入每路视频流复用的输出图像，copy=True时返回拷贝
+def test_client_reuses_undistort_buffer(tmp_path):
+    from IpCameraServer import CameraSocketServer
+    from IpCameraClient import IpCameraClient
+    port = 31300
+    server = CameraSocketServer('localhost', port, capture_factory=lambda idx: SyntheticCapture(idx, 60.0))
+    server.Start()
+    client = IpCameraClient()
+    try:
+        assert client.connect('localhost', port)
+        params = tmp_path / 'params.json'
+        params.write_text(json.dumps({'matrix': MATRIX.tolist(), 'distortion': DISTORTION.tolist()}))
+        assert client.load_undist_params(params)
+        client.set_camera(0, 320, 240)
+        client.start_capture()
+        first = client.read(timeout=5.0)
+        second = client.read(timeout=5.0)
+        assert first is second and first is client.undist_bufs[0]
+        copied = client.read(timeout=5.0, copy=True)
+        assert copied is not client.undist_bufs[0] and copied.shape == (240, 320, 3)
+        assert client.read(timeout=5.0, reduce=2).shape == (120, 160, 3)
+        client.stop_capture()
+    finally:
+        client.disconnect()
+        server.Stop()
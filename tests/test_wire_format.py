@@ -0,0 +1,22 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+root = Path(__file__).resolve().parent.parent
+
+
+# 客户端可以单独部署，与服务端共用的模块在client目录中各有一份拷贝，两份必须完全相同
+@pytest.mark.parametrize('name', ['WireFormat.py', 'StageStats.py'])
+def test_client_copy_matches_server(name):
+    assert (root / 'client' / name).read_bytes() == (root / 'server' / name).read_bytes(), \
+        'client/%s differs from server/%s, copy the server file to the client' % (name, name)
+
+
+# 客户端只需要client目录
+def test_client_imports_without_server_dir():
+    code = 'import sys; sys.path = [p for p in sys.path if "server" not in p]; ' \
+           'import IpCameraClient, AsyncIpCameraClient, FrameRecorder; ' \
+           'assert not any("server" in str(getattr(m, "__file__", "")) for m in list(sys.modules.values()))'
+    subprocess.run([sys.executable, '-c', code], cwd=root / 'client', check=True)